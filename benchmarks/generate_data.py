@@ -0,0 +1,124 @@
+"""
+Generate synthetic log_data/song_data in the Udacity layout for benchmarking.
+
+Scale 1 matches the size of the Udacity set (30 daily event files with 8056
+events, 14896 one-record song files); scale 10 and 100 multiply both.
+
+    python benchmarks/generate_data.py --out /tmp/goose_bench --scale 10
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+# Size of the Udacity data set at scale 1
+EVENTS_PER_SCALE = 8056
+SONGS_PER_SCALE = 14896
+DAYS = 30
+START_DATE = datetime(2018, 11, 1)
+
+# JSONPaths mapping the camelCase log fields onto the staging_events columns
+LOG_JSON_PATHS = [
+    "artist", "auth", "firstName", "gender", "itemInSession", "lastName",
+    "length", "level", "location", "method", "page", "registration",
+    "sessionId", "song", "status", "ts", "userAgent", "userId",
+]
+
+FIRST_NAMES = ["Lily", "Kevin", "Tegan", "Jacob", "Chloe", "Aleena", "Ryan", "Sara"]
+LAST_NAMES = ["Koch", "Arellano", "Levine", "Klein", "Cuevas", "Kirby", "Smith", "Johnson"]
+LOCATIONS = ["Chicago-Naperville-Elgin, IL-IN-WI", "San Francisco-Oakland-Hayward, CA",
+             "Lansing-East Lansing, MI", "Portland-South Portland, ME"]
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.36"
+
+
+def make_songs(count, rng):
+    """ Song records with the same fields as the Udacity song_data files """
+    artists = max(1, count // 2)
+    songs = []
+    for index in range(count):
+        artist = rng.randrange(artists)
+        songs.append({
+            "num_songs": 1,
+            "artist_id": f"AR{artist:016X}",
+            "artist_latitude": round(rng.uniform(-60, 60), 5) if rng.random() < 0.5 else None,
+            "artist_longitude": round(rng.uniform(-150, 150), 5) if rng.random() < 0.5 else None,
+            "artist_location": rng.choice(LOCATIONS + [""]),
+            "artist_name": f"Artist {artist}",
+            "song_id": f"SO{index:016X}",
+            "title": f"Song {index}",
+            "duration": round(rng.uniform(90, 420), 5),
+            "year": rng.choice([0] + list(range(1960, 2019))),
+        })
+    return songs
+
+
+def write_songs(out, songs):
+    """ One file per song under song_data/<A-Z>/<A-Z>/<A-Z>/ like the Udacity bucket """
+    for song in songs:
+        letters = song["song_id"][-3:]
+        directory = os.path.join(out, "song_data", *letters)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"TR{song['song_id'][2:]}.json"), "w") as f:
+            json.dump(song, f)
+
+
+def write_events(out, songs, count, match_rate, rng):
+    """ Daily newline-delimited event files under log_data/<year>/<month>/ """
+    users = max(10, count // 80)
+    per_day = max(1, count // DAYS)
+    for day_index in range(DAYS):
+        day = START_DATE + timedelta(days=day_index)
+        directory = os.path.join(out, "log_data", f"{day.year}", f"{day.month:02d}")
+        os.makedirs(directory, exist_ok=True)
+        day_ms = int((day - datetime(1970, 1, 1)).total_seconds() * 1000)
+        with open(os.path.join(directory, f"{day:%Y-%m-%d}-events.json"), "w") as f:
+            for index in range(per_day):
+                user = rng.randrange(users)
+                if rng.random() < match_rate:
+                    song = rng.choice(songs)
+                    title, artist, length = song["title"], song["artist_name"], song["duration"]
+                else:
+                    title, artist, length = f"Unknown {index}", f"Nobody {index}", 200.0
+                next_song = rng.random() < 0.8
+                f.write(json.dumps({
+                    "artist": artist if next_song else None,
+                    "auth": "Logged In",
+                    "firstName": FIRST_NAMES[user % len(FIRST_NAMES)],
+                    "gender": "F" if user % 2 else "M",
+                    "itemInSession": index % 100,
+                    "lastName": LAST_NAMES[user % len(LAST_NAMES)],
+                    "length": length if next_song else None,
+                    "level": "paid" if rng.random() < 0.3 else "free",
+                    "location": LOCATIONS[user % len(LOCATIONS)],
+                    "method": "PUT" if next_song else "GET",
+                    "page": "NextSong" if next_song else "Home",
+                    "registration": 1540000000000 + user,
+                    "sessionId": user * 100 + index // 50,
+                    "song": title if next_song else None,
+                    "status": 200,
+                    "ts": day_ms + int(index * 86400000 / per_day),
+                    "userAgent": USER_AGENT,
+                    "userId": str(user),
+                }) + "\n")
+
+
+def generate(out, scale=1, match_rate=0.5, seed=42):
+    """ Write the whole synthetic data set (and log_json_path.json) under ``out`` """
+    rng = random.Random(seed)
+    songs = make_songs(int(SONGS_PER_SCALE * scale), rng)
+    write_songs(out, songs)
+    write_events(out, songs, int(EVENTS_PER_SCALE * scale), match_rate, rng)
+    with open(os.path.join(out, "log_json_path.json"), "w") as f:
+        json.dump({"jsonpaths": [f"$['{field}']" for field in LOG_JSON_PATHS]}, f)
+    return {"songs": len(songs), "events": int(EVENTS_PER_SCALE * scale), "days": DAYS}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", required=True, help="Directory standing in for the S3 bucket")
+    parser.add_argument("--scale", type=float, default=1, help="Multiple of the Udacity set (1, 10, 100)")
+    parser.add_argument("--match-rate", type=float, default=0.5, help="Share of plays that match a song")
+    parser.add_argument("--seed", type=int, default=42)
+    arguments = parser.parse_args()
+    print(generate(arguments.out, arguments.scale, arguments.match_rate, arguments.seed))
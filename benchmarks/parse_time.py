@@ -0,0 +1,86 @@
+"""
+Measure how long Airflow takes to parse this repo's DAG folder.
+
+Loads dags/ into a DagBag in a fresh interpreter (so nothing is cached from an
+earlier parse), several times, and reports the parse time. Fails if the median
+is over the budget, if the DagBag has import errors, or if parsing pulled in
+modules that should only load when a task runs (database and AWS hooks).
+
+    python benchmarks/parse_time.py --budget 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported just to parse the DAGs
+EXECUTE_TIME_MODULES = [
+    "airflow.hooks.postgres_hook",
+    "airflow.contrib.hooks.aws_hook",
+    "psycopg2",
+    "boto3",
+    "pyarrow",
+]
+
+# Runs in the child interpreter: import Airflow first, then time only the DagBag
+CHILD = """
+import json, sys, time
+from airflow.models import DagBag
+before = set(sys.modules)
+start = time.monotonic()
+dagbag = DagBag(dag_folder=sys.argv[1], include_examples=False)
+seconds = time.monotonic() - start
+print(json.dumps({
+    "seconds": seconds,
+    "dags": len(dagbag.dags),
+    "tasks": sum(len(dag.tasks) for dag in dagbag.dags.values()),
+    "import_errors": {path: str(error) for path, error in dagbag.import_errors.items()},
+    "new_modules": sorted(set(sys.modules) - before),
+}))
+"""
+
+
+def parse_once():
+    """ Parse the DAG folder in a new interpreter and return its measurements """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.join(ROOT, "plugins"),
+                                                      os.path.join(ROOT, "dags"),
+                                                      env.get("PYTHONPATH")]))
+    output = subprocess.run([sys.executable, "-c", CHILD, os.path.join(ROOT, "dags")],
+                            env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def heavy_imports(new_modules):
+    return sorted(module for module in new_modules
+                  if any(module == name or module.startswith(name + ".") for name in EXECUTE_TIME_MODULES))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget", type=float, default=0.5, help="Allowed median parse time in seconds")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh parses to time")
+    arguments = parser.parse_args()
+
+    runs = [parse_once() for _ in range(arguments.runs)]
+    median = statistics.median(run["seconds"] for run in runs)
+    last = runs[-1]
+    print(f"Parsed {last['dags']} DAG(s) with {last['tasks']} task(s): median {median:.3f}s, "
+          f"max {max(run['seconds'] for run in runs):.3f}s over {len(runs)} run(s) "
+          f"(budget {arguments.budget}s)")
+
+    problems = []
+    if last["import_errors"]:
+        problems.append(f"import errors: {last['import_errors']}")
+    heavy = heavy_imports(last["new_modules"])
+    if heavy:
+        problems.append(f"imported at parse time: {', '.join(heavy)}")
+    if median > arguments.budget:
+        problems.append(f"median parse time {median:.3f}s is over the {arguments.budget}s budget")
+    if problems:
+        print("\n".join(problems))
+        sys.exit(1)
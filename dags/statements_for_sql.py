@@ -1,4 +1,7 @@
 # Optimized SQL Table Creation and Insert Statements
+# Star schema tables carry the distribution/sort keys from helpers/star_schema.py
+from helpers.song_matching import song_match_key
+from helpers.star_schema import STAR_SCHEMA_LAYOUTS, create_table_sql
 
 # Staging Events Table
 CREATE_staging_events_TABLE_SQL = """
@@ -24,6 +27,13 @@ CREATE TABLE IF NOT EXISTS staging_events (
 );
 """
 
+# JSON field for each staging_events column, in table order (same as log_json_path.json)
+staging_events_json_fields = [
+    "artist", "auth", "firstName", "gender", "itemInSession", "lastName",
+    "length", "level", "location", "method", "page", "registration",
+    "sessionId", "song", "status", "ts", "userAgent", "userId",
+]
+
 # Staging Songs Table
 CREATE_staging_songs_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS staging_songs (
@@ -41,18 +51,18 @@ CREATE TABLE IF NOT EXISTS staging_songs (
 """
 
 # Artists Table
-CREATE_artists_TABLE_SQL = """
+CREATE_artists_TABLE_SQL = create_table_sql("""
 CREATE TABLE IF NOT EXISTS artists (
     artist_id VARCHAR(50) PRIMARY KEY,
     name VARCHAR(256),
     location VARCHAR(256),
     latitude FLOAT,
     longitude FLOAT
-);
-"""
+)
+""", STAR_SCHEMA_LAYOUTS["artists"])
 
 # Songplays Fact Table
-CREATE_songplays_TABLE_SQL = """
+CREATE_songplays_TABLE_SQL = create_table_sql("""
 CREATE TABLE IF NOT EXISTS songplays (
     play_id VARCHAR(32) PRIMARY KEY,
     start_time TIMESTAMP NOT NULL,
@@ -63,33 +73,33 @@ CREATE TABLE IF NOT EXISTS songplays (
     session_id INT,
     location VARCHAR(256),
     user_agent TEXT
-);
-"""
+)
+""", STAR_SCHEMA_LAYOUTS["songplays"])
 
 # Songs Table
-CREATE_songs_TABLE_SQL = """
+CREATE_songs_TABLE_SQL = create_table_sql("""
 CREATE TABLE IF NOT EXISTS songs (
     song_id VARCHAR(50) PRIMARY KEY,
     title VARCHAR(256),
     artist_id VARCHAR(50),
     year INT,
     duration FLOAT
-);
-"""
+)
+""", STAR_SCHEMA_LAYOUTS["songs"])
 
 # Users Table
-CREATE_users_TABLE_SQL = """
+CREATE_users_TABLE_SQL = create_table_sql("""
 CREATE TABLE IF NOT EXISTS users (
     user_id INT PRIMARY KEY,
     first_name VARCHAR(50),
     last_name VARCHAR(50),
     gender CHAR(1),
     level VARCHAR(50)
-);
-"""
+)
+""", STAR_SCHEMA_LAYOUTS["users"])
 
 # Time Table
-CREATE_time_TABLE_SQL = """
+CREATE_time_TABLE_SQL = create_table_sql("""
 CREATE TABLE IF NOT EXISTS time (
     start_time TIMESTAMP PRIMARY KEY,
     hour INT,
@@ -98,8 +108,17 @@ CREATE TABLE IF NOT EXISTS time (
     month INT,
     year INT,
     day_of_week INT
-);
-"""
+)
+""", STAR_SCHEMA_LAYOUTS["time"])
+
+# Song Lookup Table (match key of title/artist/duration -> song, for the fact load)
+CREATE_song_lookup_TABLE_SQL = create_table_sql("""
+CREATE TABLE IF NOT EXISTS song_lookup (
+    match_key CHAR(32) PRIMARY KEY,
+    song_id VARCHAR(50),
+    artist_id VARCHAR(50)
+)
+""", STAR_SCHEMA_LAYOUTS["song_lookup"])
 
 # Insert Statements
 songplay_table_insert = """
@@ -151,3 +170,75 @@ time_table_insert = """
            EXTRACT(dow FROM start_time)
     FROM songplays;
 """
+
+# Upsert Statements (one row per primary key, for LoadDimensionOperator merge mode)
+# Each reads only the run's delta: staging_events keeps every day staged so far, so
+# the events are limited to the run window (rendered by Airflow, like the fact load);
+# staging_songs holds only the song files compacted in this run.
+
+# Latest row per user of the run window, so a change of users.level overwrites the
+# old level; users with later staged events keep theirs when an older day is backfilled
+user_table_upsert = """
+    SELECT user_id, first_name, last_name, gender, level
+    FROM (
+        SELECT user_id, first_name, last_name, gender, level,
+               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY ts DESC) AS row_num
+        FROM staging_events
+        WHERE page = 'NextSong' AND user_id IS NOT NULL
+          AND ts >= {{ execution_date.int_timestamp * 1000 }}
+          AND ts < {{ next_execution_date.int_timestamp * 1000 }}
+    ) latest
+    WHERE row_num = 1
+      AND user_id NOT IN (SELECT user_id
+                          FROM staging_events
+                          WHERE page = 'NextSong' AND user_id IS NOT NULL
+                            AND ts >= {{ next_execution_date.int_timestamp * 1000 }});
+"""
+
+song_table_upsert = """
+    SELECT song_id, title, artist_id, year, duration
+    FROM (
+        SELECT song_id, title, artist_id, year, duration,
+               ROW_NUMBER() OVER (PARTITION BY song_id ORDER BY year DESC) AS row_num
+        FROM staging_songs
+        WHERE song_id IS NOT NULL
+    ) latest
+    WHERE row_num = 1;
+"""
+
+artist_table_upsert = """
+    SELECT artist_id, artist_name, artist_location, artist_latitude, artist_longitude
+    FROM (
+        SELECT artist_id, artist_name, artist_location, artist_latitude, artist_longitude,
+               ROW_NUMBER() OVER (PARTITION BY artist_id ORDER BY year DESC) AS row_num
+        FROM staging_songs
+        WHERE artist_id IS NOT NULL
+    ) latest
+    WHERE row_num = 1;
+"""
+
+time_table_upsert = """
+    SELECT start_time,
+           EXTRACT(hour FROM start_time),
+           EXTRACT(day FROM start_time),
+           EXTRACT(week FROM start_time),
+           EXTRACT(month FROM start_time),
+           EXTRACT(year FROM start_time),
+           EXTRACT(dow FROM start_time)
+    FROM (SELECT DISTINCT start_time FROM songplays) play_times;
+"""
+
+# One song per match key (latest year wins), merged into song_lookup as songs arrive
+song_lookup_upsert = f"""
+    SELECT match_key, song_id, artist_id
+    FROM (
+        SELECT match_key, song_id, artist_id,
+               ROW_NUMBER() OVER (PARTITION BY match_key ORDER BY year DESC, song_id) AS row_num
+        FROM (SELECT {song_match_key("title", "artist_name", "duration")} AS match_key,
+                     song_id, artist_id, year
+              FROM staging_songs
+              WHERE song_id IS NOT NULL) keyed
+        WHERE match_key IS NOT NULL
+    ) latest
+    WHERE row_num = 1;
+"""
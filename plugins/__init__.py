@@ -4,23 +4,12 @@ from __future__ import division, absolute_import, print_function
 # Import Airflow's plugin manager
 from airflow.plugins_manager import AirflowPlugin
 
-# Import the custom operators and helper functions
-import operators
-import helpers
 
 # Define an Airflow plugin class
 class UdacityPlugin(AirflowPlugin):
     name = "udacity_plugin"  # The plugin name used internally in Airflow
 
-    # Registering custom operators
-    operators = [
-        operators.StageToRedshiftOperator,
-        operators.LoadFactOperator,
-        operators.LoadDimensionOperator,
-        operators.DataQualityOperator
-    ]
-
-    # Registering helper functions (e.g., SQL queries)
-    helpers = [
-        helpers.SqlQueries
-    ]
+    # No operators or helpers are registered here: listing their classes would import
+    # every operator and helper whenever the plugin loads. The DAG files import what
+    # they use from its module (e.g. operators.stage_to_redshift), and the pooled
+    # Redshift hook in hooks/ is imported by the operators when they run.
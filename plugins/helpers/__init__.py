@@ -1,5 +1,39 @@
-from helpers.sql_queries import SqlQueries
+# Helpers are imported from their modules on first use (PEP 562), like the
+# operators, so importing one helper module does not load the others
+import importlib
 
-__all__ = [
-    'SqlQueries',
-]
+_MODULES = {
+    'SqlQueries': 'helpers.sql_queries',
+    'PartitionWatermark': 'helpers.watermark',
+    'ObjectInfo': 'helpers.object_store',
+    'S3ObjectStore': 'helpers.object_store',
+    'LocalObjectStore': 'helpers.object_store',
+    'DataCheck': 'helpers.data_checks',
+    'TableLayout': 'helpers.star_schema',
+    'STAR_SCHEMA_LAYOUTS': 'helpers.star_schema',
+    'CopySlots': 'helpers.copy_slots',
+    'LoadError': 'helpers.load_errors',
+    'LoadErrors': 'helpers.load_errors',
+    'Rollup': 'helpers.rollups',
+    'ROLLUPS': 'helpers.rollups',
+    'PIPELINE_SPEC': 'helpers.pipeline_spec',
+    'QueryProfiler': 'helpers.query_plans',
+    'ResultCache': 'helpers.result_cache',
+    'RedshiftBackend': 'helpers.backends',
+    'LocalBackend': 'helpers.backends',
+    'SqlMetrics': 'helpers.instrumentation',
+    'StatsdMetricsSink': 'helpers.instrumentation',
+    'JsonLinesMetricsSink': 'helpers.instrumentation',
+}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name):
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_MODULES[name]), name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,320 @@
+import codecs
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import time
+from collections import namedtuple
+from contextlib import closing
+from datetime import datetime
+
+from helpers.ddl import without_table_attributes
+from helpers.json_validation import iter_checked_values
+from helpers.load_errors import LoadError, LoadErrors
+from helpers.object_store import LocalObjectStore, S3ObjectStore
+
+Credentials = namedtuple("Credentials", ["access_key", "secret_key"])
+
+# Parts of the COPY statements StageToRedshiftOperator builds
+_COMMENT = re.compile(r"\s--[^\n]*")
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_TABLE = re.compile(r"^\s*COPY\s+(\S+)", re.IGNORECASE)
+_SOURCE = re.compile(r"\bFROM\s+'([^']*)'", re.IGNORECASE)
+_FORMAT = re.compile(r"\bFORMAT\s+AS\s+(JSON|CSV|PARQUET)(?:\s+'([^']*)')?", re.IGNORECASE)
+_TIMEFORMAT = re.compile(r"\bTIMEFORMAT\s+AS\s+'([^']*)'", re.IGNORECASE)
+_MAXERROR = re.compile(r"\bMAXERROR\s+(\d+)", re.IGNORECASE)
+_APPROXIMATE = re.compile(r"\bAPPROXIMATE\s+COUNT\s*\(\s*DISTINCT\b", re.IGNORECASE)
+
+# Postgres type OIDs of TIMESTAMP and TIMESTAMPTZ columns
+_TIMESTAMP_TYPES = (1114, 1184)
+
+
+class RedshiftBackend:
+    """
+    The warehouse the pipeline runs on in production: S3 and Redshift.
+
+    Operators go through a backend for the few things that differ between it and
+    a stand-in (see LocalBackend): where objects live, the AWS credentials, the
+    COPY itself, and the bits of DDL and SQL plain Postgres does not accept.
+    """
+
+    name = "redshift"
+
+    def credentials(self, aws_credentials_id):
+        """ AWS credentials for the COPY, from the Airflow connection """
+        from airflow.contrib.hooks.aws_hook import AwsHook
+        return AwsHook(aws_credentials_id).get_credentials()
+
+    def object_store(self, bucket, aws_credentials_id):
+        return S3ObjectStore(bucket, aws_credentials_id)
+
+    def slice_count(self, redshift):
+        return int(redshift.get_first("SELECT COUNT(*) FROM stv_slices")[0])
+
+    def ddl(self, create_sql):
+        return create_sql
+
+    def sql(self, statement):
+        return statement
+
+    def copy(self, operator, cursor, metrics, formatted_sql, inspect=True):
+        """
+        Run the COPY and return the rows it skipped under MAXERROR.
+
+        If it fails, the transaction is rolled back and the exception raised again
+        with the rejected rows attached as ``load_errors``.
+        """
+        if not inspect:
+            metrics.run(cursor, formatted_sql, table=operator.table, copy=True)
+            return []
+
+        load_errors = LoadErrors(cursor)
+        mark = load_errors.mark()
+        try:
+            metrics.run(cursor, formatted_sql, table=operator.table, copy=True)
+        except Exception as error:
+            # stl_load_errors cannot be read inside the aborted transaction
+            cursor.connection.rollback()
+            error.load_errors = load_errors.since(mark)
+            raise
+        return load_errors.since(mark)
+
+
+class LocalBackend(RedshiftBackend):
+    """
+    A local stand-in for S3 and Redshift, to run the whole pipeline against
+    Postgres on a laptop (e.g. the docker-compose service) in seconds.
+
+    Buckets are directories under ``root`` (``s3://udacity-dend/log_data`` is
+    ``<root>/udacity-dend/log_data``), and the COPY statements the staging
+    operator builds are carried out with COPY FROM STDIN, streaming
+    ``batch_rows`` rows at a time. The Redshift options map as follows:
+
+    - ``FORMAT AS JSON 'auto'`` reads the field named like each column;
+      a JSONPaths file (``$['field']`` or ``$.field`` paths) picks them by position.
+      Empty strings load as NULL, nested values as their JSON text.
+    - ``FORMAT AS CSV`` passes the files through; Parquet is not supported.
+    - ``TIMEFORMAT AS 'epochmillisecs'`` turns numbers into TIMESTAMP column values.
+    - ``GZIP`` gunzips the files, ``MANIFEST`` reads the listed files (``file://``
+      or ``s3://`` URLs).
+    - ``MAXERROR n`` skips up to n records that are not JSON objects; past that the
+      COPY fails. Skipped and failing records are reported as LoadErrors, so
+      ``max_errors`` and ``retry_failed_files`` behave as they do on Redshift.
+
+    DDL loses its DISTSTYLE/DISTKEY/SORTKEY attributes and ``APPROXIMATE
+    COUNT(DISTINCT ...)`` becomes an exact count.
+    """
+
+    name = "local"
+
+    def __init__(self, root, batch_rows=10000, slices=1):
+        """
+        :param root: Directory holding one directory per bucket.
+        :param batch_rows: Rows sent per COPY FROM STDIN.
+        :param slices: Slices to balance manifests over (Postgres has none).
+        """
+        self.root = root
+        self.batch_rows = batch_rows
+        self.slices = slices
+
+    def credentials(self, aws_credentials_id):
+        # No AWS involved locally
+        return Credentials("local", "local")
+
+    def object_store(self, bucket, aws_credentials_id):
+        return LocalObjectStore(os.path.join(self.root, bucket))
+
+    def slice_count(self, redshift):
+        return self.slices
+
+    def ddl(self, create_sql):
+        return without_table_attributes(create_sql)
+
+    def sql(self, statement):
+        return _APPROXIMATE.sub("COUNT(DISTINCT", statement)
+
+    def locate(self, operator, url):
+        """ (store, key) of an ``s3://`` or ``file://`` URL; s3 URLs honour the operator's store override """
+        if url.startswith("file://"):
+            path = url[len("file://"):]
+            return LocalObjectStore(os.path.dirname(path)), os.path.basename(path)
+        if not url.startswith("s3://"):
+            raise ValueError(f"Cannot load {url} locally")
+        bucket, _, key = url[len("s3://"):].partition("/")
+        if operator.object_store is not None:
+            return operator.object_store, key
+        return self.object_store(bucket, None), key
+
+    def source_files(self, operator, url, manifest):
+        """ (store, key, url) of every file the COPY reads, in load order """
+        store, key = self.locate(operator, url)
+        if not manifest:
+            return [(store, obj.key, store.url(obj.key)) for obj in store.list_objects(key)]
+        with closing(store.open(key)) as body:
+            entries = json.load(body)["entries"]
+        return [self.locate(operator, entry["url"]) + (entry["url"],) for entry in entries]
+
+    def field_paths(self, operator, paths):
+        """ Key path of each column's value, from a JSONPaths file or None for 'auto' """
+        if paths.lower() == "auto":
+            return None
+        store, key = self.locate(operator, paths)
+        with closing(store.open(key)) as body:
+            jsonpaths = json.load(body)["jsonpaths"]
+        return [[bracket or dotted for bracket, dotted in re.findall(r"\['([^']*)'\]|\.(\w+)", path)]
+                for path in jsonpaths]
+
+    @staticmethod
+    def value(record, path):
+        for part in path:
+            if not isinstance(record, dict):
+                return None
+            record = record.get(part)
+        return record
+
+    @staticmethod
+    def open_text(store, key, gunzip):
+        body = store.open(key)
+        stream = gzip.GzipFile(fileobj=body) if gunzip or key.endswith(".gz") else body
+        return body, codecs.getreader("utf-8")(stream)
+
+    @staticmethod
+    def copy_stream(cursor, table, columns, stream):
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", stream)
+
+    def copy_batch(self, cursor, table, columns, buffer):
+        buffer.seek(0)
+        self.copy_stream(cursor, table, columns, buffer)
+
+    def copy(self, operator, cursor, metrics, formatted_sql, inspect=True):
+        statement = _COMMENT.sub("", formatted_sql)
+        options = _LITERAL.sub("''", statement).upper()
+        table = _TABLE.match(statement).group(1)
+        data_format, paths = _FORMAT.search(statement).groups()
+        data_format = data_format.upper()
+        if data_format == "PARQUET":
+            raise ValueError("The local backend cannot load Parquet files")
+        timeformat = _TIMEFORMAT.search(statement)
+        max_errors = _MAXERROR.search(statement)
+        max_errors = int(max_errors.group(1)) if max_errors else 0
+        gunzip = re.search(r"\bGZIP\b", options) is not None
+        files = self.source_files(operator, _SOURCE.search(statement).group(1),
+                                  re.search(r"\bMANIFEST\b", options) is not None)
+
+        cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+        columns = [column[0] for column in cursor.description]
+        epoch_columns = {index for index, column in enumerate(cursor.description)
+                         if timeformat and timeformat.group(1).lower() == "epochmillisecs"
+                         and column[1] in _TIMESTAMP_TYPES}
+        fields = [[column] for column in columns] if data_format == "CSV" else \
+            self.field_paths(operator, paths) or [[column] for column in columns]
+
+        start = time.monotonic()
+        rows = 0
+        errors = []
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for store, key, url in files:
+            body, lines = self.open_text(store, key, gunzip)
+            with closing(body):
+                if data_format == "CSV":
+                    # Already CSV: hand the file to Postgres as it is
+                    self.copy_stream(cursor, table, columns, lines)
+                    continue
+                for number, (record, text) in enumerate(iter_checked_values(lines), 1):
+                    if not isinstance(record, dict):
+                        errors.append(LoadError(None, url, number, "", "Invalid JSON object",
+                                                (text if record is None else json.dumps(record))[:1024]))
+                        if len(errors) > max_errors:
+                            error = ValueError(f"Load into table '{table}' failed: {len(errors)} bad "
+                                               f"record(s), MAXERROR is {max_errors}")
+                            error.load_errors = errors
+                            raise error
+                        continue
+                    values = []
+                    for index, path in enumerate(fields):
+                        value = self.value(record, path)
+                        if value == "":
+                            value = None
+                        elif isinstance(value, (dict, list)):
+                            value = json.dumps(value)
+                        elif index in epoch_columns and isinstance(value, (int, float)):
+                            value = datetime.utcfromtimestamp(value / 1000.0).isoformat()
+                        values.append(value)
+                    writer.writerow(values)
+                    rows += 1
+                    if rows % self.batch_rows == 0:
+                        self.copy_batch(cursor, table, columns, buffer)
+                        buffer = io.StringIO()
+                        writer = csv.writer(buffer)
+        self.copy_batch(cursor, table, columns, buffer)
+
+        metrics.record(f"COPY {table}", time.monotonic() - start, rows, table=table, backend=self.name)
+        return errors
+
+
+class ConnectionBackend:
+    """
+    The backend named in the warehouse connection's extras, looked up when a task
+    first uses it, so the DAG file does not read any configuration when parsed.
+
+    ``{"backend": "local", "local_root": "/data/s3"}`` in the extras picks
+    LocalBackend (``local_batch_rows`` optional); anything else is Redshift.
+    """
+
+    def __init__(self, conn_id="redshift"):
+        """
+        :param conn_id: Airflow connection whose extras name the backend.
+        """
+        self.conn_id = conn_id
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            from airflow.hooks.base_hook import BaseHook
+            extra = BaseHook.get_connection(self.conn_id).extra_dejson
+            if extra.get("backend") == "local":
+                self._backend = LocalBackend(extra["local_root"], batch_rows=extra.get("local_batch_rows", 10000))
+            else:
+                self._backend = RedshiftBackend()
+        return self._backend
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    def credentials(self, aws_credentials_id):
+        return self.backend.credentials(aws_credentials_id)
+
+    def object_store(self, bucket, aws_credentials_id):
+        return self.backend.object_store(bucket, aws_credentials_id)
+
+    def slice_count(self, redshift):
+        return self.backend.slice_count(redshift)
+
+    def ddl(self, create_sql):
+        return self.backend.ddl(create_sql)
+
+    def sql(self, statement):
+        return self.backend.sql(statement)
+
+    def copy(self, operator, cursor, metrics, formatted_sql, inspect=True):
+        return self.backend.copy(operator, cursor, metrics, formatted_sql, inspect=inspect)
+
+
+# Backends by the "kind" the pipeline spec names
+BACKENDS = {"redshift": RedshiftBackend, "local": LocalBackend, "connection": ConnectionBackend}
+
+
+def make_backend(config=None):
+    """ Backend from its spec entry, e.g. ``{"kind": "local", "root": "/data/s3"}`` (None is Redshift) """
+    if config is None:
+        return RedshiftBackend()
+    options = dict(config)
+    kind = options.pop("kind", "redshift")
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown backend: {kind}")
+    return BACKENDS[kind](**options)
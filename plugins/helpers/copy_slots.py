@@ -0,0 +1,97 @@
+import logging
+import time
+from contextlib import closing, contextmanager
+
+
+class CopySlots:
+    """
+    Warehouse-wide counting semaphore for COPY statements, kept in a small lock
+    table in Redshift so every worker and every DAG run sees the same limit.
+
+    A slot is a row in the table. Taking one locks the table, drops rows older
+    than ``stale_after`` seconds (left behind by killed tasks), and inserts a row
+    if fewer than ``max_slots`` are held; otherwise the caller polls until a slot
+    frees up or ``timeout`` seconds pass.
+    """
+
+    # Bookkeeping table: one row per COPY currently running
+    create_sql = """
+        CREATE TABLE IF NOT EXISTS {} (
+            holder VARCHAR(512) NOT NULL,
+            acquired_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+
+    # Drop slots held longer than the stale timeout
+    expire_sql = """
+        DELETE FROM {} WHERE acquired_at < CURRENT_TIMESTAMP - INTERVAL '{} seconds';
+    """
+
+    def __init__(self, redshift, max_slots, slot_table="copy_slots", stale_after=3 * 3600,
+                 poll_seconds=10, timeout=6 * 3600):
+        """
+        :param redshift: Hook connected to Redshift.
+        :param max_slots: Number of COPYs allowed to run at once.
+        :param slot_table: Name of the lock table.
+        :param stale_after: Seconds after which a held slot is considered abandoned.
+        :param poll_seconds: Seconds between attempts while all slots are taken.
+        :param timeout: Give up waiting after this many seconds.
+        """
+        self.redshift = redshift
+        self.max_slots = max_slots
+        self.slot_table = slot_table
+        self.stale_after = stale_after
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+
+    @staticmethod
+    def _quote(value):
+        return str(value).replace("'", "''")
+
+    def ensure_table(self):
+        """ Create the lock table if it does not exist yet """
+        self.redshift.run(CopySlots.create_sql.format(self.slot_table))
+
+    def try_acquire(self, holder):
+        """ Take a slot for the holder if one is free; returns True on success """
+        with closing(self.redshift.get_conn()) as conn:
+            cursor = conn.cursor()
+            # Serialize slot bookkeeping across all workers
+            cursor.execute(f"LOCK {self.slot_table};")
+            cursor.execute(CopySlots.expire_sql.format(self.slot_table, int(self.stale_after)))
+            cursor.execute(f"SELECT COUNT(*) FROM {self.slot_table};")
+            held = cursor.fetchone()[0]
+            if held >= self.max_slots:
+                conn.commit()
+                return False
+            cursor.execute(f"INSERT INTO {self.slot_table} (holder) VALUES ('{self._quote(holder)}');")
+            conn.commit()
+            return True
+
+    def acquire(self, holder):
+        """ Wait for a slot; returns the seconds spent waiting """
+        start = time.monotonic()
+        while not self.try_acquire(holder):
+            waited = time.monotonic() - start
+            if waited >= self.timeout:
+                raise TimeoutError(f"No COPY slot free in {self.slot_table} after {int(waited)}s "
+                                   f"({self.max_slots} slot(s))")
+            logging.info(f"All {self.max_slots} COPY slot(s) are taken, waiting...")
+            time.sleep(self.poll_seconds)
+        return time.monotonic() - start
+
+    def release(self, holder):
+        """ Give the holder's slot back """
+        with closing(self.redshift.get_conn()) as conn:
+            conn.cursor().execute(
+                f"DELETE FROM {self.slot_table} WHERE holder = '{self._quote(holder)}';")
+            conn.commit()
+
+    @contextmanager
+    def slot(self, holder):
+        """ Hold a slot for the duration of the block; yields the wait in seconds """
+        waited = self.acquire(holder)
+        try:
+            yield waited
+        finally:
+            self.release(holder)
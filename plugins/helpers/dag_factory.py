@@ -0,0 +1,367 @@
+from airflow import DAG
+from airflow.operators.dummy_operator import DummyOperator
+
+from operators.compact_json import CompactJsonOperator
+from operators.create_table import CreateTableOperator
+from operators.data_quality_check import DataQualityOperator
+from operators.load_to_dimension_table import LoadDimensionOperator
+from operators.load_rollups import LoadRollupsOperator
+from operators.load_time_dimension import LoadTimeDimensionOperator
+from operators.load_to_fact_table import LoadFactOperator
+from operators.stage_to_redshift import StageToRedshiftOperator
+from operators.validate_json import ValidateJsonOperator
+from helpers.query_plans import QueryProfiler
+from helpers.result_cache import ResultCache
+from helpers.backends import make_backend
+
+# Source keys the factory handles itself; the rest go to StageToRedshiftOperator
+_SOURCE_KEYS = ("name", "create_sql", "compact", "validate")
+
+dimension_groupings = ("single", "per_table")
+
+
+def profiler(spec):
+    """ The spec's QueryProfiler (None if profiling is off), keeping plans over the spec's connection """
+    if not spec.get("query_profile"):
+        return None
+    return QueryProfiler(**dict({"history_conn_id": spec["redshift_conn_id"]}, **spec["query_profile"]))
+
+
+def quality_checks(spec):
+    """ Check dicts for every fact and dimension in the spec (see DataCheck) """
+    checks = []
+    for entry in spec.get("facts", []) + spec.get("dimensions", []):
+        table = entry["table"]
+        key = entry.get("key") or entry.get("merge_key")
+        checks.append({"table": table, "metric": "row_count", "comparator": "greater_than", "value": 0})
+        if key:
+            checks.append({"table": table, "metric": "null_count", "column": key, "comparator": "zero_nulls"})
+            checks.append({"table": table, "metric": "duplicate_count", "column": key,
+                           "comparator": "equals", "value": 0})
+        for column in entry.get("not_null", []):
+            checks.append({"table": table, "metric": "null_count", "column": column,
+                           "comparator": "zero_nulls"})
+    return checks + list(spec.get("quality", {}).get("extra_checks", []))
+
+
+def validated_manifest(name):
+    """ The manifest of clean files the source's ValidateJsonOperator hands the COPY """
+    return f"{{{{ ti.xcom_pull(task_ids='Validate_{name}_data') }}}}"
+
+
+def validate_task(dag, source, s3_key, sql, aws, backend):
+    """ ValidateJsonOperator checking the source's records under ``s3_key`` against its table """
+    check = dict(source["validate"])
+    prefix = check.pop("prefix")
+    json_fields = check.pop("json_fields", None)
+    return ValidateJsonOperator(task_id=f"Validate_{source['name']}_data",
+                                dag=dag,
+                                s3_bucket=source["s3_bucket"],
+                                source_prefix=s3_key,
+                                clean_prefix=f"{prefix}/clean/{{{{ ds_nodash }}}}",
+                                quarantine_prefix=f"{prefix}/quarantine/{{{{ ds_nodash }}}}",
+                                manifest_key=f"{prefix}/{{{{ ds_nodash }}}}/copy.manifest",
+                                create_table_sql=getattr(sql, source["create_sql"]),
+                                json_fields=getattr(sql, json_fields) if json_fields else None,
+                                **aws, **backend, **check)
+
+
+def build_dag(spec, sql, default_args, dag_id=None):
+    """
+    Build the pipeline DAG from a table spec (see helpers.pipeline_spec).
+
+    :param spec: The table spec.
+    :param sql: Module (or object) holding the SQL the spec refers to by name.
+    :param default_args: Default arguments for every task.
+    :param dag_id: Overrides the spec's dag_id.
+
+    Only operators are constructed here (no connections, no S3 calls), so the
+    DAG file stays cheap for the scheduler to parse however many sources it has.
+    """
+    grouping = spec.get("dimension_grouping", "single")
+    if grouping not in dimension_groupings:
+        raise ValueError(f"Unknown dimension grouping: {grouping}")
+
+    dag = DAG(dag_id or spec["dag_id"],
+              default_args=default_args,
+              description=spec.get("description"),
+              schedule_interval=spec.get("schedule_interval"))
+    conn_ids = {"redshift_conn_id": spec["redshift_conn_id"]}
+    aws = {"aws_credentials_id": spec["aws_credentials_id"]}
+    # Handed to every task that runs SQL through SqlMetrics
+    profiling = {"query_profiler": profiler(spec)}
+    # S3 and Redshift, or the local stand-in; handed to every task that touches either
+    backend = {"backend": make_backend(spec.get("backend"))}
+
+    start_operator = DummyOperator(task_id='Begin_execution', dag=dag)
+    end_operator = DummyOperator(task_id='Stop_execution', dag=dag)
+
+    # Task that loads each table, for wiring the tasks that read it
+    loaded_by = {}
+
+    for source in spec.get("sources", []):
+        name, table = source["name"], source["table"]
+        options = {key: value for key, value in source.items() if key not in _SOURCE_KEYS}
+        options.setdefault("copy_slots", spec.get("copy_slots"))
+        if source.get("validate"):
+            options["manifest_url"] = validated_manifest(name)
+        stage = StageToRedshiftOperator(task_id=f"Stage_{name}_from_s3_to_redshift",
+                                        dag=dag, **dict(conn_ids, **aws), **profiling, **backend, **options)
+        upstream = []
+
+        if source.get("create_sql"):
+            upstream.append(CreateTableOperator(task_id=f"create_{table}_table",
+                                                dag=dag,
+                                                table=table,
+                                                create_sql=getattr(sql, source["create_sql"]),
+                                                **conn_ids, **backend))
+        if source.get("compact"):
+            compact = dict(source["compact"])
+            compact.setdefault("target_bucket", source["s3_bucket"])
+            upstream.append(CompactJsonOperator(task_id=f"Compact_{compact['source_prefix']}",
+                                                dag=dag, **aws, **backend, **compact))
+
+        first = stage
+        if source.get("validate"):
+            # Check the records against the table schema and COPY only the clean ones
+            first = validate_task(dag, source, options["s3_key"], sql, aws, backend)
+            first >> stage
+
+        for task in upstream or [start_operator]:
+            if task is not start_operator:
+                start_operator >> task
+            task >> first
+        loaded_by[table] = stage
+
+    # (task, tables it reads); wired once every table's loading task exists, so
+    # e.g. the fact load can read a lookup table that the dimension tasks load
+    reads_of = []
+
+    def wire(task, reads):
+        reads_of.append((task, reads))
+
+    def create_first(entry, task):
+        # Fact and dimension tables the load writes into (or merges through) must exist first
+        if entry.get("create_sql"):
+            create = CreateTableOperator(task_id=f"create_{entry['table']}_table",
+                                         dag=dag,
+                                         table=entry["table"],
+                                         create_sql=getattr(sql, entry["create_sql"]),
+                                         **conn_ids, **backend)
+            start_operator >> create
+            create >> task
+
+    for fact in spec.get("facts", []):
+        task = LoadFactOperator(task_id=f"Load_{fact['table']}_fact_table",
+                                dag=dag,
+                                sql_statement=getattr(sql, fact["sql"]) if fact.get("sql") else None,
+                                **conn_ids, **profiling)
+        wire(task, fact.get("reads", []))
+        create_first(fact, task)
+        loaded_by[fact["table"]] = task
+
+    dimensions = spec.get("dimensions", [])
+    merged = [dim for dim in dimensions if dim.get("kind") != "time"]
+    if merged and grouping == "single":
+        # One task (one session and transaction) after everything any dimension reads
+        task = LoadDimensionOperator(
+            task_id='Load_dim_tables',
+            dag=dag,
+            tables={dim["table"]: {"sql_statement": getattr(sql, dim["sql"]),
+                                   "merge_key": dim.get("merge_key")}
+                    for dim in merged},
+            transaction_grouping="single",
+            **conn_ids, **profiling)
+        wire(task, sorted({table for dim in merged for table in dim.get("reads", [])}))
+        for dim in merged:
+            create_first(dim, task)
+            loaded_by[dim["table"]] = task
+    else:
+        # Dimensions are only wired to what they read, so they can run in parallel
+        for dim in merged:
+            task = LoadDimensionOperator(task_id=f"Load_{dim['table']}_dim_table",
+                                         dag=dag,
+                                         table_name=dim["table"],
+                                         sql_statement=getattr(sql, dim["sql"]),
+                                         merge_key=dim.get("merge_key"),
+                                         **conn_ids, **profiling)
+            wire(task, dim.get("reads", []))
+            create_first(dim, task)
+            loaded_by[dim["table"]] = task
+
+    # Time dimensions only add the window's new timestamps, in a task of their own
+    for dim in dimensions:
+        if dim.get("kind") == "time":
+            task = LoadTimeDimensionOperator(task_id=f"Load_{dim['table']}_dim_table",
+                                             dag=dag,
+                                             table=dim["table"],
+                                             source_table=dim.get("source_table", "songplays"),
+                                             calendar_grain=dim.get("calendar_grain"),
+                                             **conn_ids, **profiling)
+            wire(task, dim.get("reads", []))
+            create_first(dim, task)
+            loaded_by[dim["table"]] = task
+
+    rollups = spec.get("rollups")
+    rollup_task = None
+    if rollups:
+        rollup_task = LoadRollupsOperator(task_id='Load_rollup_tables',
+                                          dag=dag,
+                                          rollups=rollups.get("tables"),
+                                          **conn_ids, **profiling)
+        wire(rollup_task, rollups.get("reads", []))
+
+    for task, reads in reads_of:
+        upstream = []
+        for table in reads:
+            if table in loaded_by and loaded_by[table] is not task and loaded_by[table] not in upstream:
+                upstream.append(loaded_by[table])
+        for parent in upstream or [start_operator]:
+            parent >> task
+
+    quality = spec.get("quality", {})
+    run_quality_checks = DataQualityOperator(task_id='Run_data_quality_checks',
+                                             dag=dag,
+                                             check_sql=quality.get("check_sql", ""),
+                                             expected_value=quality.get("expected_value", 0),
+                                             describe=quality.get("describe", ""),
+                                             checks=quality_checks(spec),
+                                             result_cache=ResultCache(**quality["result_cache"])
+                                             if quality.get("result_cache") else None,
+                                             **conn_ids, **profiling, **backend)
+
+    # Quality checks wait for every fact and dimension load
+    upstream = []
+    for entry in spec.get("facts", []) + dimensions:
+        if loaded_by[entry["table"]] not in upstream:
+            upstream.append(loaded_by[entry["table"]])
+    if rollup_task is not None:
+        upstream.append(rollup_task)
+    for task in upstream:
+        task >> run_quality_checks
+    if not upstream:
+        start_operator >> run_quality_checks
+    run_quality_checks >> end_operator
+
+    return dag
+
+
+def build_backfill_dag(spec, sql, default_args, dag_id=None):
+    """
+    Build the DAG that reprocesses past days, e.g. when event logs arrive late.
+
+    Each run is one day of the schedule. Only the sources under the spec's
+    "backfill" entry are restaged, for that day's partitions (their rows for the
+    day are replaced, see StageToRedshiftOperator's ``reload_where``); a source
+    with "validate" is checked first and only its clean files reloaded. Only
+    the tables that read them, directly or through another table, are loaded
+    again for the day's window; quality checks are left to the daily DAG.
+
+    The DAG is created paused and runs with ``airflow backfill -s <first day>
+    -e <last day> <dag_id>``: up to ``max_active_runs`` days stage at once,
+    while the tasks writing the shared fact, dimension and rollup tables run
+    ``write_concurrency`` days at a time so their transactions do not conflict.
+
+    :param spec: The table spec.
+    :param sql: Module (or object) holding the SQL the spec refers to by name.
+    :param default_args: Default arguments for every task.
+    :param dag_id: Overrides the default ``<dag_id>_backfill``.
+    """
+    backfill = spec["backfill"]
+    dag = DAG(dag_id or f"{spec['dag_id']}_backfill",
+              default_args=default_args,
+              description=f"Reprocess past days of {spec['dag_id']}",
+              schedule_interval=spec.get("schedule_interval"),
+              max_active_runs=backfill.get("max_active_runs", 4),
+              catchup=False,
+              # Only run through `airflow backfill`, never by the scheduler
+              is_paused_upon_creation=True)
+    conn_ids = {"redshift_conn_id": spec["redshift_conn_id"]}
+    aws = {"aws_credentials_id": spec["aws_credentials_id"]}
+    profiling = {"query_profiler": profiler(spec)}
+    backend = {"backend": make_backend(spec.get("backend"))}
+    writes = {"task_concurrency": backfill.get("write_concurrency", 1)}
+
+    start_operator = DummyOperator(task_id='Begin_execution', dag=dag)
+    end_operator = DummyOperator(task_id='Stop_execution', dag=dag)
+
+    loaded_by = {}
+    stages = []
+    sources = {source["name"]: source for source in spec.get("sources", [])}
+    for name, overrides in backfill["sources"].items():
+        source = sources[name]
+        options = {key: value for key, value in source.items() if key not in _SOURCE_KEYS}
+        options.update(overrides, incremental=True)
+        options.setdefault("copy_slots", spec.get("copy_slots"))
+        if source.get("validate"):
+            options["manifest_url"] = validated_manifest(name)
+        stage = StageToRedshiftOperator(task_id=f"Stage_{name}_from_s3_to_redshift",
+                                        dag=dag, **dict(conn_ids, **aws), **profiling, **backend, **options)
+        if source.get("validate"):
+            # Late files are checked like the daily run's, and only the clean ones reloaded
+            validate = validate_task(dag, source, options["s3_key"], sql, aws, backend)
+            start_operator >> validate
+            validate >> stage
+        else:
+            start_operator >> stage
+        loaded_by[source["table"]] = stage
+        stages.append(stage)
+
+    # Tables that read a restaged table, directly or through another table
+    entries = spec.get("facts", []) + spec.get("dimensions", [])
+    affected = set(loaded_by)
+    changed = True
+    while changed:
+        changed = False
+        for entry in entries:
+            if entry["table"] not in affected and affected.intersection(entry.get("reads", [])):
+                affected.add(entry["table"])
+                changed = True
+
+    tasks = []
+    for entry in entries:
+        table = entry["table"]
+        if table not in affected or table in loaded_by:
+            continue
+        if entry in spec.get("facts", []):
+            task = LoadFactOperator(task_id=f"Load_{table}_fact_table",
+                                    dag=dag,
+                                    sql_statement=getattr(sql, entry["sql"]) if entry.get("sql") else None,
+                                    **conn_ids, **profiling, **writes)
+        elif entry.get("kind") == "time":
+            task = LoadTimeDimensionOperator(task_id=f"Load_{table}_dim_table",
+                                             dag=dag,
+                                             table=table,
+                                             source_table=entry.get("source_table", "songplays"),
+                                             calendar_grain=entry.get("calendar_grain"),
+                                             **conn_ids, **profiling, **writes)
+        else:
+            task = LoadDimensionOperator(task_id=f"Load_{table}_dim_table",
+                                         dag=dag,
+                                         table_name=table,
+                                         sql_statement=getattr(sql, entry["sql"]),
+                                         merge_key=entry.get("merge_key"),
+                                         **conn_ids, **profiling, **writes)
+        loaded_by[table] = task
+        tasks.append((task, entry.get("reads", [])))
+
+    rollups = spec.get("rollups")
+    if rollups and affected.intersection(rollups.get("reads", [])):
+        tasks.append((LoadRollupsOperator(task_id='Load_rollup_tables',
+                                          dag=dag,
+                                          rollups=rollups.get("tables"),
+                                          **conn_ids, **profiling, **writes),
+                      rollups.get("reads", [])))
+
+    # Wired once every task exists, like build_dag
+    parents = set()
+    for task, reads in tasks:
+        for table in reads:
+            if table in loaded_by:
+                loaded_by[table] >> task
+                parents.add(loaded_by[table])
+    for task in stages + [task for task, _ in tasks]:
+        if task not in parents:
+            task >> end_operator
+
+    return dag
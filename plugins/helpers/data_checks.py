@@ -0,0 +1,223 @@
+import statistics
+from collections import OrderedDict
+
+
+class DataCheck:
+    """
+    A single data-quality check: a metric compared against an expectation.
+
+    A check either measures a built-in metric on a table (``row_count``,
+    ``null_count``, ``null_rate``, ``duplicate_count`` or ``approx_distinct`` of
+    a column) or runs its own ``sql`` and reads the first value. Table metrics on
+    the same table, filter and sample can be fused into one aggregate query, so
+    the table is scanned once.
+
+    ``where`` limits the scan, e.g. to the run window on a sort key, which
+    Redshift answers from the matching blocks only. ``sample`` (a fraction)
+    measures a random share of those rows; counts are scaled up to estimate the
+    whole, rates are used as they are. The sample is a ``RANDOM() < sample``
+    filter, so every row the ``where`` lets through is still read: it saves
+    aggregation work, not I/O, and a sampled check still needs a ``where`` to
+    limit its scan. ``approx_distinct`` uses Redshift's
+    ``APPROXIMATE COUNT(DISTINCT ...)`` (HyperLogLog, about 2% error).
+
+    Comparators:
+    - ``equals``: actual == value
+    - ``greater_than``: actual > value
+    - ``less_than``: actual < value
+    - ``range``: min <= actual <= max
+    - ``zero_nulls``: actual == 0 (for null counts)
+    - ``within_stddev``: actual is within ``deviations`` standard deviations of
+      the mean of the check's last ``history_runs`` values (see MetricHistory);
+      passes until ``min_history`` values are recorded
+    """
+
+    # Aggregate expression for each built-in table metric
+    metric_sql = {
+        "row_count": "COUNT(*)",
+        "null_count": "COALESCE(SUM(CASE WHEN {column} IS NULL THEN 1 ELSE 0 END), 0)",
+        "duplicate_count": "COUNT({column}) - COUNT(DISTINCT {column})",
+        "null_rate": "AVG(CASE WHEN {column} IS NULL THEN 1.0 ELSE 0.0 END)",
+        "approx_distinct": "APPROXIMATE COUNT(DISTINCT {column})",
+    }
+
+    # Metrics that can be measured on a sample, and whether to scale them up
+    sampled_metrics = {"row_count": True, "null_count": True, "null_rate": False}
+
+    comparators = ("equals", "greater_than", "less_than", "range", "zero_nulls", "within_stddev")
+
+    def __init__(self, table=None, metric="row_count", column=None, sql=None,
+                 comparator="equals", value=None, min=None, max=None,
+                 where=None, describe=None, sample=None,
+                 deviations=3, history_runs=14, min_history=5):
+        if sql is None and table is None:
+            raise ValueError("A data check needs either a table or its own sql")
+        if sql is None and metric not in DataCheck.metric_sql:
+            raise ValueError(f"Unknown data check metric: {metric}")
+        if comparator not in DataCheck.comparators:
+            raise ValueError(f"Unknown data check comparator: {comparator}")
+        if sample is not None and (sql is not None or metric not in DataCheck.sampled_metrics):
+            raise ValueError(f"A sample only works for the {', '.join(DataCheck.sampled_metrics)} metrics")
+        if sample is not None and not 0 < sample <= 1:
+            raise ValueError(f"Sample fraction must be in (0, 1]: {sample}")
+
+        self.table = table
+        self.metric = metric
+        self.column = column
+        self.sql = sql
+        self.comparator = comparator
+        self.value = value
+        self.min = min
+        self.max = max
+        self.where = where
+        self.sample = sample
+        self.deviations = deviations
+        self.history_runs = history_runs
+        self.min_history = min_history
+        self.describe = describe or self.default_description()
+
+    @classmethod
+    def from_dict(cls, check):
+        """ Build a check from the dict form used in DAG files """
+        return check if isinstance(check, cls) else cls(**check)
+
+    def default_description(self):
+        if self.sql is not None:
+            return self.sql.strip()
+        target = f"{self.table}.{self.column}" if self.column else self.table
+        return f"{self.metric} of {target}"
+
+    @property
+    def fusable(self):
+        """ Built-in table metrics can share one scan; custom SQL runs alone """
+        return self.sql is None
+
+    @property
+    def uses_history(self):
+        return self.comparator == "within_stddev"
+
+    def expression(self):
+        expression = DataCheck.metric_sql[self.metric].format(column=self.column)
+        if self.sample is not None and DataCheck.sampled_metrics[self.metric]:
+            return f"{expression} / {float(self.sample)}"
+        return expression
+
+    def bounds(self, history):
+        """ (low, high) allowed by ``within_stddev``, or None while history is short """
+        values = [float(value) for value in (history or [])[:self.history_runs]]
+        if len(values) < max(self.min_history, 2):
+            return None
+        mean, spread = statistics.mean(values), statistics.stdev(values)
+        return mean - self.deviations * spread, mean + self.deviations * spread
+
+    def expectation(self, history=None):
+        if self.comparator == "within_stddev":
+            bounds = self.bounds(history)
+            if bounds is None:
+                return f"anything until {self.min_history} earlier values are recorded"
+            return (f"within {self.deviations} stddev of the last {min(len(history), self.history_runs)} "
+                    f"values: {bounds[0]:.2f} to {bounds[1]:.2f}")
+        if self.comparator == "range":
+            return f"between {self.min} and {self.max}"
+        if self.comparator == "zero_nulls":
+            return "0"
+        if self.comparator == "greater_than":
+            return f"> {self.value}"
+        if self.comparator == "less_than":
+            return f"< {self.value}"
+        return f"{self.value}"
+
+    def passes(self, actual, history=None):
+        """ Compare the measured value against the expectation (and the earlier values, newest first) """
+        if actual is None:
+            return False
+        actual = float(actual)
+        if self.comparator == "within_stddev":
+            bounds = self.bounds(history)
+            return bounds is None or bounds[0] <= actual <= bounds[1]
+        if self.comparator == "equals":
+            return actual == float(self.value)
+        if self.comparator == "greater_than":
+            return actual > float(self.value)
+        if self.comparator == "less_than":
+            return actual < float(self.value)
+        if self.comparator == "range":
+            return float(self.min) <= actual <= float(self.max)
+        return actual == 0
+
+
+def fuse_checks(checks):
+    """
+    Group checks into as few queries as possible.
+
+    Returns a list of ``(sql, checks)`` pairs; the n-th column of the query's
+    first row is the measured value of the n-th check.
+    """
+    fused = OrderedDict()
+    queries = []
+    for check in checks:
+        if not check.fusable:
+            queries.append((check.sql, [check]))
+            continue
+        fused.setdefault((check.table, check.where, check.sample), []).append(check)
+
+    for (table, where, sample), group in fused.items():
+        sql = f"SELECT {', '.join(check.expression() for check in group)} FROM {table}"
+        conditions = [f"({where})"] if where else []
+        if sample is not None:
+            conditions.append(f"RANDOM() < {float(sample)}")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        queries.append((sql, group))
+    return queries
+
+
+class MetricHistory:
+    """
+    The values each check measured, one per run date, in a small table in the
+    warehouse, for checks compared against their own history (``within_stddev``).
+
+    Values are keyed on the check's ``describe`` and the run's ``ds``; a re-run
+    of the same date replaces its value instead of counting twice.
+    """
+
+    # Bookkeeping table: one row per check and run date
+    create_sql = """
+        CREATE TABLE IF NOT EXISTS {} (
+            check_name VARCHAR(1024) NOT NULL,
+            ds VARCHAR(10) NOT NULL,
+            metric_value FLOAT,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+
+    # Earlier values of a check, newest first
+    values_sql = """
+        SELECT metric_value FROM {} WHERE check_name = %s AND ds < %s AND metric_value IS NOT NULL
+        ORDER BY ds DESC LIMIT %s;
+    """
+
+    delete_sql = """
+        DELETE FROM {} WHERE check_name = %s AND ds = %s;
+    """
+
+    insert_sql = """
+        INSERT INTO {} (check_name, ds, metric_value) VALUES (%s, %s, %s);
+    """
+
+    def __init__(self, history_table="dq_metric_history"):
+        self.history_table = history_table
+
+    def ensure_table(self, cursor):
+        cursor.execute(MetricHistory.create_sql.format(self.history_table))
+
+    def values(self, cursor, check, ds):
+        """ The check's values from runs before ``ds``, newest first """
+        cursor.execute(MetricHistory.values_sql.format(self.history_table),
+                       (check.describe, ds, check.history_runs))
+        return [row[0] for row in cursor.fetchall()]
+
+    def record(self, cursor, check, ds, value):
+        cursor.execute(MetricHistory.delete_sql.format(self.history_table), (check.describe, ds))
+        cursor.execute(MetricHistory.insert_sql.format(self.history_table),
+                       (check.describe, ds, float(value) if value is not None else None))
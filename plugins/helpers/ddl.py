@@ -0,0 +1,84 @@
+import re
+
+# Column definition inside CREATE TABLE: name, type and optional (length/precision)
+_COLUMN = re.compile(r"^\s*(\w+)\s+([A-Za-z][A-Za-z0-9 ]*)\s*(\([\d,\s]+\))?(?:\s|,|$)")
+
+# Column attributes that can follow a type without a size (e.g. ``BIGINT NOT NULL``)
+_ATTRIBUTES = (" NOT", " NULL", " PRIMARY", " DEFAULT", " ENCODE", " DISTKEY", " SORTKEY",
+               " IDENTITY", " UNIQUE", " REFERENCES", " COLLATE", " GENERATED")
+
+# Lines inside CREATE TABLE that are constraints rather than columns
+_CONSTRAINTS = ("CONSTRAINT", "PRIMARY", "FOREIGN", "UNIQUE", "CHECK")
+
+# Type families the converters and validators understand
+INTEGER_TYPES = ("SMALLINT", "INT2", "INT", "INTEGER", "INT4", "BIGINT", "INT8")
+FLOAT_TYPES = ("FLOAT", "FLOAT4", "FLOAT8", "REAL", "DOUBLE PRECISION", "NUMERIC", "DECIMAL")
+TEXT_TYPES = ("VARCHAR", "CHAR", "CHARACTER", "CHARACTER VARYING", "TEXT", "BPCHAR")
+
+
+def _column_list_span(create_table_sql):
+    """ Positions of the parentheses around the column list """
+    start = create_table_sql.index("(")
+    depth = 0
+    for position in range(start, len(create_table_sql)):
+        if create_table_sql[position] == "(":
+            depth += 1
+        elif create_table_sql[position] == ")":
+            depth -= 1
+            if depth == 0:
+                return start, position
+    raise ValueError("Unbalanced parentheses in CREATE TABLE statement")
+
+
+def without_table_attributes(create_table_sql):
+    """
+    Drop Redshift table attributes (DISTSTYLE, DISTKEY, SORTKEY, ...) that follow
+    the column list, e.g. to run the DDL on plain Postgres.
+    """
+    _, end = _column_list_span(create_table_sql)
+    return create_table_sql[:end + 1] + ";\n"
+
+
+def parse_columns(create_table_sql):
+    """
+    Read the columns of a CREATE TABLE statement.
+
+    Returns a list of ``(name, type, length)`` tuples in table order; ``type`` is
+    upper-cased without its size and ``length`` is the VARCHAR/CHAR size or None.
+    """
+    start, end = _column_list_span(create_table_sql)
+    body = create_table_sql[start + 1:end]
+    columns = []
+    for line in body.splitlines():
+        line = line.split("--")[0].strip()
+        if not line or line.split()[0].upper() in _CONSTRAINTS:
+            continue
+        match = _COLUMN.match(line)
+        if not match:
+            continue
+        name, sql_type, size = match.groups()
+        sql_type = " ".join(sql_type.upper().split())
+        # Multi-word types (DOUBLE PRECISION) are read whole, up to the first attribute
+        for keyword in _ATTRIBUTES:
+            if keyword in f" {sql_type}":
+                sql_type = f" {sql_type}".split(keyword)[0].strip()
+        length = None
+        if size and sql_type in TEXT_TYPES:
+            length = int(size.strip("()").split(",")[0])
+        columns.append((name, sql_type, length))
+    return columns
+
+
+def type_family(sql_type):
+    """ 'integer', 'float', 'text', 'timestamp', 'boolean' or 'other' for a column type """
+    if sql_type in INTEGER_TYPES:
+        return "integer"
+    if sql_type in FLOAT_TYPES:
+        return "float"
+    if sql_type in TEXT_TYPES:
+        return "text"
+    if sql_type.startswith("TIMESTAMP"):
+        return "timestamp"
+    if sql_type in ("BOOL", "BOOLEAN"):
+        return "boolean"
+    return "other"
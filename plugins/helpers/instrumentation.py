@@ -0,0 +1,192 @@
+import json
+import logging
+import socket
+import time
+from datetime import datetime
+
+
+class SqlMetrics:
+    """
+    Records wall time, rows affected and the Redshift query id of each statement
+    an operator runs, then publishes them to XCom and an optional metrics sink.
+
+    Usage inside an operator::
+
+        metrics = SqlMetrics(self.task_id, self.metrics_sink)
+        with closing(redshift.get_conn()) as conn:
+            cursor = conn.cursor()
+            metrics.run(cursor, sql, table="songplays")
+            conn.commit()
+        metrics.publish(context)
+    """
+
+    # XCom key the records are pushed under
+    xcom_key = "sql_metrics"
+
+    def __init__(self, task_id, sink=None, query_ids=None, profiler=None):
+        """
+        :param task_id: Task the statements belong to.
+        :param sink: Optional metrics sink (StatsdMetricsSink, JsonLinesMetricsSink).
+        :param query_ids: Look up pg_last_query_id()/pg_last_copy_count(). These only
+            exist on Redshift; None detects Redshift from ``version()`` on first use.
+        :param profiler: Optional QueryProfiler that EXPLAINs each statement first
+            (see helpers.query_plans).
+        """
+        self.task_id = task_id
+        self.sink = sink
+        self.query_ids = query_ids
+        self.profiler = profiler
+        self.records = []
+
+    @property
+    def dry_run(self):
+        """ True if statements that write are only EXPLAINed """
+        return self.profiler is not None and self.profiler.dry_run
+
+    def run(self, cursor, sql, table=None, copy=False, parameters=None):
+        """
+        Execute one statement on the cursor and record its metrics.
+
+        For COPY statements the rows come from ``pg_last_copy_count()``, since the
+        cursor's rowcount does not cover COPY on Redshift. Returns the row count.
+
+        With a profiler the statement is EXPLAINed first and its plan added to the
+        record; in a dry run, statements that write are not run and return 0.
+
+        Lookups and plan bookkeeping run on a second cursor of the same session,
+        so the statement's own result set is still there for the caller to fetch.
+        """
+        bookkeeping = cursor.connection.cursor()
+        profile = self.profiler.explain(bookkeeping, sql, parameters) if self.profiler is not None else None
+        if self.profiler is not None and self.profiler.skips(sql):
+            extra = {"dry_run": True}
+            if profile is not None:
+                extra.update(self.profiler.observe(bookkeeping, self.task_id, sql, profile))
+            self.record(sql, 0.0, None, table=table, **extra)
+            self.check_plan(extra, table)
+            return 0
+
+        start = time.monotonic()
+        cursor.execute(sql, parameters)
+        seconds = time.monotonic() - start
+        rows = cursor.rowcount
+
+        query_id = None
+        if self.query_ids is None:
+            bookkeeping.execute("SELECT version()")
+            self.query_ids = "redshift" in bookkeeping.fetchone()[0].lower()
+        if self.query_ids:
+            if copy:
+                bookkeeping.execute("SELECT pg_last_copy_id(), pg_last_copy_count()")
+                query_id, rows = bookkeeping.fetchone()
+            else:
+                bookkeeping.execute("SELECT pg_last_query_id()")
+                query_id = bookkeeping.fetchone()[0]
+
+        extra = {}
+        if profile is not None:
+            extra = self.profiler.observe(bookkeeping, self.task_id, sql, profile, seconds, query_id)
+        self.record(sql, seconds, rows, table=table, query_id=query_id, **extra)
+        self.check_plan(extra, table)
+        return rows
+
+    def check_plan(self, fields, table=None):
+        """ Record (and, if the profiler says so, raise) a plan that picked up new findings """
+        if not fields.get("new_findings"):
+            return
+        self.record("PLAN_REGRESSION", 0.0, len(fields["new_findings"]), table=table,
+                    plan_hash=fields["plan_hash"], new_findings=fields["new_findings"])
+        if self.profiler.fail_on_regression:
+            raise ValueError(f"Query plan regression in {self.task_id}: "
+                             f"{', '.join(fields['new_findings'])}")
+
+    def record(self, sql, seconds, rows, table=None, query_id=None, **extra):
+        """ Record metrics for a statement run elsewhere (e.g. by a hook) """
+        record = {
+            "task_id": self.task_id,
+            "table": table,
+            "statement": sql.split()[0].upper() if sql.strip() else "",
+            "seconds": round(seconds, 3),
+            "rows": rows if rows is not None and rows >= 0 else None,
+            "query_id": query_id,
+        }
+        record.update(extra)
+        self.records.append(record)
+        logging.info(f"SQL metrics: {record}")
+        return record
+
+    def acquired(self, connection):
+        """ Record how long a pooled connection waited for a free slot """
+        wait = getattr(connection, "wait_seconds", None)
+        if isinstance(wait, float):
+            self.record("POOL_WAIT", wait, None, table="connection_pool")
+
+    def publish(self, context):
+        """ Push the records to XCom and hand them to the metrics sink """
+        task_instance = context.get("ti") or context.get("task_instance")
+        if task_instance is not None:
+            task_instance.xcom_push(key=SqlMetrics.xcom_key, value=self.records)
+        if self.sink is not None:
+            self.sink.emit(self.records, context)
+
+
+class StatsdMetricsSink:
+    """
+    Sends each record to StatsD over UDP as ``<prefix>.<task>.<table>.<statement>.seconds``
+    (timer) and ``<prefix>.<task>.<table>.<statement>.rows`` (gauge), where the statement
+    is the record's first SQL keyword (e.g. ``DELETE``, ``INSERT``) or marker (e.g.
+    ``POOL_WAIT``), so a merge's delete and insert are separate series. Sending never
+    fails the task.
+    """
+
+    def __init__(self, host="localhost", port=8125, prefix="goose_music"):
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+
+    @staticmethod
+    def _name(value):
+        return str(value).replace(".", "_").replace(":", "_").replace("|", "_")
+
+    def lines(self, records):
+        lines = []
+        for record in records:
+            name = ".".join(self._name(part) for part in
+                            (self.prefix, record["task_id"], record["table"] or "all",
+                             record["statement"] or "unknown"))
+            lines.append(f"{name}.seconds:{int(record['seconds'] * 1000)}|ms")
+            if record["rows"] is not None:
+                lines.append(f"{name}.rows:{record['rows']}|g")
+        return lines
+
+    def emit(self, records, context=None):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for line in self.lines(records):
+                sock.sendto(line.encode("utf-8"), (self.host, self.port))
+        except OSError as error:
+            logging.warning(f"Could not send metrics to StatsD: {error}")
+        finally:
+            sock.close()
+
+
+class JsonLinesMetricsSink:
+    """
+    Appends each record, tagged with the DAG id, run date and emit time, as one
+    JSON line to a local file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, records, context=None):
+        context = context or {}
+        dag = context.get("dag")
+        tags = {
+            "dag_id": getattr(dag, "dag_id", None),
+            "ds": context.get("ds"),
+            "emitted_at": datetime.utcnow().isoformat(),
+        }
+        with open(self.path, "a") as f:
+            for record in records:
+                f.write(json.dumps(dict(record, **tags), default=str) + "\n")
@@ -0,0 +1,49 @@
+import codecs
+import gzip
+import json
+from contextlib import closing
+
+
+def iter_lines_records(lines):
+    """
+    Yield every JSON value from an iterable of text lines.
+
+    Newline-delimited files decode one line at a time; a value spread over
+    several lines (e.g. a pretty-printed song file) is buffered until it is
+    complete, so memory stays bounded by the largest single record. Only a
+    value the decoder ran out of input on is buffered: a syntax error inside
+    the text raises ValueError at once, naming the line it is on.
+    """
+    decoder = json.JSONDecoder()
+    pending = ""
+    number = 0
+    for number, line in enumerate(lines, 1):
+        pending += line
+        text = pending.strip()
+        if not text:
+            pending = ""
+            continue
+        position = 0
+        try:
+            while position < len(text):
+                record, position = decoder.raw_decode(text, position)
+                yield record
+                while position < len(text) and text[position].isspace():
+                    position += 1
+            pending = ""
+        except json.JSONDecodeError as error:
+            if error.pos < len(text):
+                raise ValueError(f"Malformed JSON on line {number}: {error.msg}") from error
+            # Keep the unfinished value for the next line
+            pending = text[position:]
+    if pending.strip():
+        raise ValueError(f"Truncated JSON value at the end of the input (line {number})")
+
+
+def iter_object_records(store, key):
+    """ Stream every JSON record stored in one object, gunzipping ``.gz`` objects on the fly """
+    with closing(store.open(key)) as body:
+        stream = gzip.GzipFile(fileobj=body) if key.endswith(".gz") else body
+        # codecs' reader only needs read(), which S3 streaming bodies provide
+        for record in iter_lines_records(codecs.getreader("utf-8")(stream)):
+            yield record
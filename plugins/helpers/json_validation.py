@@ -0,0 +1,193 @@
+import codecs
+import gzip
+import json
+import os
+import tempfile
+from contextlib import closing
+
+from helpers.ddl import parse_columns, type_family  # Reads column types from the DDL
+from helpers.object_store import ObjectInfo
+
+# Value ranges of the integer column types
+_INTEGER_RANGES = {
+    "SMALLINT": 2 ** 15, "INT2": 2 ** 15,
+    "INT": 2 ** 31, "INTEGER": 2 ** 31, "INT4": 2 ** 31,
+    "BIGINT": 2 ** 63, "INT8": 2 ** 63,
+}
+
+# Redshift stores TEXT as VARCHAR(256)
+_TEXT_LENGTH = 256
+
+
+def column_rules(create_table_sql, json_fields=None):
+    """
+    Validation rules for a staging table: ``(field, column, sql_type, family, length)``
+    per column, in table order.
+
+    ``json_fields`` maps columns to JSON fields by position, like a JSONPaths file;
+    without it each column reads the field with the same name, ignoring case, the
+    way COPY's ``'auto'`` option does.
+    """
+    columns = parse_columns(create_table_sql)
+    if json_fields is not None and len(json_fields) != len(columns):
+        raise ValueError(f"{len(json_fields)} JSON fields given for {len(columns)} columns")
+    rules = []
+    for index, (name, sql_type, length) in enumerate(columns):
+        field = json_fields[index] if json_fields is not None else name
+        if length is None and sql_type == "TEXT":
+            length = _TEXT_LENGTH
+        rules.append((field, name, sql_type, type_family(sql_type), length))
+    return rules
+
+
+def field_value(record, field, case_insensitive=True):
+    """ The record's value for a JSON field (None if missing), matching the name like COPY does """
+    if field in record or not case_insensitive:
+        return record.get(field)
+    lowered = field.lower()
+    for key, value in record.items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+
+def _is_number(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def record_errors(record, rules, case_insensitive=True):
+    """ Problems that would make COPY reject the record or load it wrongly; empty if it is fine """
+    if not isinstance(record, dict):
+        return [f"expected a JSON object, got {type(record).__name__}"]
+
+    errors = []
+    present = 0
+    for field, column, sql_type, family, length in rules:
+        value = field_value(record, field, case_insensitive)
+        if value is None or value == "":
+            continue
+        present += 1
+        if family in ("integer", "timestamp"):
+            # Timestamps are loaded as epoch milliseconds
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            if isinstance(value, bool) or not isinstance(value, (int, str)):
+                errors.append(f"{column}: {value!r} is not an integer")
+                continue
+            try:
+                number = int(value)
+            except ValueError:
+                errors.append(f"{column}: {value!r} is not an integer")
+                continue
+            limit = _INTEGER_RANGES.get(sql_type, 2 ** 63)
+            if not -limit <= number < limit:
+                errors.append(f"{column}: {number} is out of range for {sql_type}")
+        elif family == "float":
+            if not _is_number(value):
+                errors.append(f"{column}: {value!r} is not a number")
+        elif family == "boolean":
+            if not isinstance(value, bool):
+                errors.append(f"{column}: {value!r} is not a boolean")
+        elif family == "text":
+            if isinstance(value, (dict, list)):
+                errors.append(f"{column}: nested {type(value).__name__} in a text column")
+            elif length is not None and len(str(value).encode("utf-8")) > length:
+                errors.append(f"{column}: {len(str(value).encode('utf-8'))} bytes is over {sql_type}({length})")
+    if not present:
+        errors.append("none of the table's fields are present")
+    return errors
+
+
+def iter_checked_values(lines, max_record_bytes=1024 * 1024):
+    """
+    Yield ``(record, None)`` for every JSON value in the lines and ``(None, text)``
+    for text that cannot be decoded.
+
+    Like helpers.json_records.iter_lines_records, values may span several lines,
+    but a syntax error (or a value growing past ``max_record_bytes``) only costs
+    the text it is in, and decoding carries on with the next line.
+    """
+    decoder = json.JSONDecoder()
+    pending = ""
+    for line in lines:
+        pending += line
+        text = pending.strip()
+        if not text:
+            pending = ""
+            continue
+        position = 0
+        try:
+            while position < len(text):
+                record, position = decoder.raw_decode(text, position)
+                yield record, None
+                while position < len(text) and text[position].isspace():
+                    position += 1
+            pending = ""
+        except json.JSONDecodeError as error:
+            rest = text[position:]
+            truncated = error.pos >= len(text)
+            if truncated and len(rest.encode("utf-8")) <= max_record_bytes:
+                pending = rest  # Unfinished value: wait for the next line
+            else:
+                yield None, rest
+                pending = ""
+    if pending.strip():
+        yield None, pending.strip()
+
+
+def validate_object(store, obj, rules, clean_store, clean_key, quarantine_key,
+                    case_insensitive=True, max_record_bytes=1024 * 1024):
+    """
+    Validate every record of one object (an ObjectInfo in ``store``), streaming.
+
+    Valid records are spooled to a temp file and bad ones, with their errors, to
+    another. If every record is valid nothing is written and the original object
+    is returned for loading; otherwise the clean records are uploaded to
+    ``clean_key`` (gzip when the source is) and the bad ones to ``quarantine_key``.
+
+    Returns ``(object_to_load or None, records, bad_records, clean?)``, where the
+    object is an ObjectInfo in ``store`` (clean) or ``clean_store`` (rewritten).
+    """
+    key = obj.key
+    compressed = key.endswith(".gz")
+    workdir = tempfile.mkdtemp(prefix="validate_")
+    clean_path = os.path.join(workdir, "clean")
+    bad_path = os.path.join(workdir, "bad")
+    records = bad = 0
+    try:
+        clean_file = gzip.open(clean_path, "wt", encoding="utf-8") if compressed \
+            else open(clean_path, "w", encoding="utf-8")
+        with clean_file, open(bad_path, "w", encoding="utf-8") as bad_file:
+            with closing(store.open(key)) as body:
+                stream = gzip.GzipFile(fileobj=body) if compressed else body
+                for record, text in iter_checked_values(codecs.getreader("utf-8")(stream), max_record_bytes):
+                    records += 1
+                    errors = ["not valid JSON"] if text is not None else record_errors(record, rules,
+                                                                                       case_insensitive)
+                    if errors:
+                        bad += 1
+                        bad_file.write(json.dumps({"source": key, "errors": errors,
+                                                   "record": record if text is None else text}) + "\n")
+                    else:
+                        clean_file.write(json.dumps(record) + "\n")
+
+        if not bad:
+            return obj, records, 0, True
+
+        clean_store.upload_file(bad_path, quarantine_key)
+        if records == bad:
+            return None, records, bad, False
+        clean_store.upload_file(clean_path, clean_key)
+        return ObjectInfo(clean_key, os.path.getsize(clean_path)), records, bad, False
+    finally:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
@@ -0,0 +1,62 @@
+from collections import namedtuple
+
+# One rejected row from stl_load_errors
+LoadError = namedtuple("LoadError", ["query", "filename", "line_number", "column", "reason", "value"])
+
+
+class LoadErrors:
+    """
+    Reads Redshift's ``stl_load_errors`` for the COPYs run on one connection.
+
+    A failed COPY only reports a generic error; the rows it rejected (file, line,
+    column and reason) are in ``stl_load_errors``, tagged with the session that
+    ran it. So are the rows a COPY skipped under ``MAXERROR``. Take a ``mark()``
+    before the COPY and read the errors ``since()`` it afterwards. The system
+    table is not transactional, so the errors stay readable after a rollback.
+    """
+
+    # Last load error of this session so far
+    mark_sql = """
+        SELECT COALESCE(MAX(query), 0) FROM stl_load_errors WHERE session = pg_backend_pid();
+    """
+
+    # Load errors of this session's COPYs after the mark
+    errors_sql = """
+        SELECT query, TRIM(filename), line_number, TRIM(colname), TRIM(err_reason), TRIM(raw_field_value)
+        FROM stl_load_errors
+        WHERE session = pg_backend_pid() AND query > {}
+        ORDER BY query, filename, line_number
+        LIMIT {};
+    """
+
+    def __init__(self, cursor, limit=1000):
+        """
+        :param cursor: Cursor of the connection that runs the COPYs.
+        :param limit: Most error rows to read back per COPY.
+        """
+        self.cursor = cursor
+        self.limit = limit
+
+    def mark(self):
+        """ Query id to read errors after; take it before running the COPY """
+        self.cursor.execute(LoadErrors.mark_sql)
+        return self.cursor.fetchone()[0]
+
+    def since(self, mark):
+        """ Errors of the COPYs run on this session after the mark """
+        self.cursor.execute(LoadErrors.errors_sql.format(int(mark), int(self.limit)))
+        return [LoadError(*row) for row in self.cursor.fetchall()]
+
+    @staticmethod
+    def files(errors):
+        """ The S3 URLs of the files the errors came from """
+        return {error.filename for error in errors}
+
+    @staticmethod
+    def describe(errors, most=5):
+        """ One line per error (the first ``most``), for logs and exception messages """
+        lines = [f"{error.filename} line {error.line_number}, column {error.column}: "
+                 f"{error.reason} ({error.value!r})" for error in errors[:most]]
+        if len(errors) > most:
+            lines.append(f"... and {len(errors) - most} more")
+        return "\n".join(lines)
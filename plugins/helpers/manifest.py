@@ -0,0 +1,87 @@
+import json
+import tempfile
+from contextlib import closing
+
+from helpers.object_store import ObjectInfo
+
+
+def balance(objects, num_groups):
+    """
+    Spread objects over ``num_groups`` groups with roughly equal total bytes.
+
+    Uses the largest-first greedy rule: each object goes to the currently
+    lightest group. Returns a list of groups (lists of ObjectInfo); empty
+    groups are dropped.
+    """
+    groups = [[] for _ in range(max(1, num_groups))]
+    totals = [0] * len(groups)
+    for obj in sorted(objects, key=lambda o: o.size, reverse=True):
+        lightest = totals.index(min(totals))
+        groups[lightest].append(obj)
+        totals[lightest] += obj.size
+    return [group for group in groups if group]
+
+
+def load_stats(objects, num_slices):
+    """
+    Report file count, bytes and expected slice skew for a set of files.
+
+    Skew is the heaviest slice's bytes divided by the average slice's bytes
+    (1.0 means perfectly even) when the files are spread across the slices.
+    """
+    total_bytes = sum(obj.size for obj in objects)
+    slice_bytes = [sum(obj.size for obj in group) for group in balance(objects, num_slices)]
+    slice_bytes += [0] * (max(1, num_slices) - len(slice_bytes))
+    mean = total_bytes / len(slice_bytes) if slice_bytes else 0
+    return {
+        "files": len(objects),
+        "bytes": total_bytes,
+        "slices": len(slice_bytes),
+        "skew": round(max(slice_bytes) / mean, 3) if mean else 0.0,
+    }
+
+
+def bundle_small_objects(store, objects, small_file_bytes, num_slices, bundle_prefix):
+    """
+    Concatenate small JSON objects into at most ``num_slices`` balanced bundles.
+
+    Objects of at least ``small_file_bytes`` are left untouched. Bundles are
+    written to ``bundle_prefix`` in the store, one object per line, which
+    Redshift's JSON COPY reads the same as separate files. The objects must be
+    uncompressed text: joined gzip or Parquet files would not load. Returns the
+    new list of objects to load.
+    """
+    large = [obj for obj in objects if obj.size >= small_file_bytes]
+    small = [obj for obj in objects if obj.size < small_file_bytes]
+    if len(small) <= 1:
+        return objects
+
+    bundles = []
+    for index, group in enumerate(balance(small, num_slices)):
+        key = f"{bundle_prefix}/bundle-{index:04d}.json"
+        # Spool the bundle to a temp file so memory stays bounded by one object
+        with tempfile.NamedTemporaryFile(suffix=".json") as spool:
+            for obj in sorted(group):
+                with closing(store.open(obj.key)) as body:
+                    spool.write(body.read().strip() + b"\n")
+            spool.flush()
+            store.upload_file(spool.name, key)
+            bundles.append(ObjectInfo(key, spool.tell()))
+    return large + bundles
+
+
+def build_manifest(store, objects):
+    """ Build a Redshift COPY manifest listing every object as mandatory """
+    return {
+        "entries": [
+            {"url": store.url(obj.key), "mandatory": True,
+             "meta": {"content_length": obj.size}}
+            for obj in objects
+        ]
+    }
+
+
+def write_manifest(store, key, objects):
+    """ Upload the manifest for the objects and return its URL """
+    store.write_bytes(key, json.dumps(build_manifest(store, objects), indent=2).encode("utf-8"))
+    return store.url(key)
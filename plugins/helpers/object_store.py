@@ -0,0 +1,107 @@
+import os
+from collections import namedtuple
+
+# A listed object: its key (relative to the bucket/root) and size in bytes
+ObjectInfo = namedtuple("ObjectInfo", ["key", "size"])
+
+
+class S3ObjectStore:
+    """
+    Thin wrapper around an S3 bucket used by the staging operators.
+
+    The boto3 client is created lazily from the Airflow AWS connection; a
+    stub client can be passed in instead (e.g. for tests).
+    """
+
+    def __init__(self, bucket, aws_credentials_id="aws_credentials", client=None):
+        """
+        :param bucket: S3 bucket name.
+        :param aws_credentials_id: Airflow connection holding the AWS credentials.
+        :param client: Optional boto3-compatible S3 client (skips AwsHook).
+        """
+        self.bucket = bucket
+        self.aws_credentials_id = aws_credentials_id
+        self._client = client
+
+    def __getstate__(self):
+        # boto3 clients cannot be pickled; a copy sent to a worker process makes its own
+        state = dict(self.__dict__)
+        state["_client"] = None
+        return state
+
+    @property
+    def client(self):
+        if self._client is None:
+            from airflow.contrib.hooks.aws_hook import AwsHook
+            self._client = AwsHook(self.aws_credentials_id).get_client_type('s3')
+        return self._client
+
+    def list_objects(self, prefix):
+        """ List every object under the prefix, following pagination """
+        objects = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                if not item['Key'].endswith('/'):
+                    objects.append(ObjectInfo(item['Key'], item['Size']))
+        return objects
+
+    def open(self, key):
+        """ Return a readable, streaming binary file object for the key """
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def write_bytes(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def upload_file(self, local_path, key):
+        self.client.upload_file(local_path, self.bucket, key)
+
+    def url(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+
+class LocalObjectStore:
+    """
+    A local directory standing in for an S3 bucket.
+
+    Keys are paths relative to ``root`` using '/' separators, exactly like S3 keys.
+    """
+
+    def __init__(self, root):
+        """
+        :param root: Directory that plays the role of the bucket.
+        """
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def list_objects(self, prefix):
+        """ List every file whose key starts with the prefix, sorted by key """
+        objects = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    objects.append(ObjectInfo(key, os.path.getsize(path)))
+        return sorted(objects)
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def write_bytes(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def upload_file(self, local_path, key):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(local_path, 'rb') as src, open(path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                dst.write(chunk)
+
+    def url(self, key):
+        return f"file://{self._path(key)}"
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+
+def partition_keys(key_template, context):
+    """
+    Render a key template once per day of the run's logical date window.
+
+    The window runs from ``execution_date`` up to (not including)
+    ``next_execution_date``; keys that render the same are only returned once,
+    so a template without date fields gives a single key.
+    e.g. ``log_data/{execution_date.year}/{ds}-events.json``
+    """
+    start = context["execution_date"]
+    end = context.get("next_execution_date") or start + timedelta(days=1)
+
+    keys = []
+    day = start
+    while day < end:
+        day_context = dict(context,
+                           execution_date=day,
+                           ds=day.strftime("%Y-%m-%d"),
+                           ds_nodash=day.strftime("%Y%m%d"))
+        key = key_template.format(**day_context)
+        if key not in keys:
+            keys.append(key)
+        day += timedelta(days=1)
+    return keys
@@ -0,0 +1,154 @@
+# Table spec the DAG factory (helpers.dag_factory.build_dag) builds the pipeline from.
+#
+# SQL is referenced by name (e.g. "CREATE_staging_events_TABLE_SQL") and looked up
+# in the SQL module the DAG passes in, so the spec stays plain data (it could live
+# in YAML). Dependencies are not listed by task: each fact and dimension names the
+# tables it "reads", and the factory wires it after the tasks that load them.
+#
+# - sources: staging tables loaded by StageToRedshiftOperator. "create_sql" is
+#   run first; "compact" adds a CompactJsonOperator in front of the COPY;
+#   "validate" adds a ValidateJsonOperator that quarantines records not matching
+#   the table and hands StageToRedshiftOperator a manifest of the clean files;
+#   every other key is passed to the operator as is.
+# - facts: loaded by LoadFactOperator ("sql" defaults to the operator's insert).
+#   Facts and dimensions with a "create_sql" get a create task before their load.
+# - dimensions: merged on "merge_key" by LoadDimensionOperator. With
+#   "dimension_grouping": "single" they share one task (one session and
+#   transaction); with "per_table" each table is its own task, so dimensions that
+#   only read staging tables load in parallel with the fact table. A dimension
+#   with "kind": "time" is its own LoadTimeDimensionOperator task, which adds only
+#   the run window's new timestamps (plus "calendar_grain" buckets, if set).
+# - rollups: summary tables refreshed for each run window by LoadRollupsOperator
+#   (see helpers.rollups), after the tables they read.
+# - quality: row count, null key and duplicate key checks for every fact and
+#   dimension "key", null checks for "not_null" columns, plus "extra_checks".
+#   "result_cache" (ResultCache arguments) reuses a check's last result while
+#   the tables it reads are unchanged, e.g. on retries and re-triggers.
+# - backfill: the "<dag_id>_backfill" DAG (helpers.dag_factory.build_backfill_dag)
+#   that reprocesses past days, e.g. after late event logs: per day it restages
+#   only the listed sources' partitions (the keys override the source's; a
+#   "validate" source is validated first, as in the daily run) and reloads only
+#   the tables that read them, for that day's window.
+# - backend: None for S3 and Redshift, {"kind": "local", "root": "/data/s3"} to read
+#   each bucket from a directory under root and load into the "redshift"
+#   connection's plain Postgres (see helpers.backends.LocalBackend), or
+#   {"kind": "connection"} to let the connection's extras choose when tasks run.
+PIPELINE_SPEC = {
+    "dag_id": "Sparkify_Data_Pipeline_dag",
+    "description": "Load and transform data in Redshift with Airflow",
+    "schedule_interval": "0 0 * * *",
+    "redshift_conn_id": "redshift",
+    "aws_credentials_id": "aws_credentials",
+    # COPYs allowed to run at once in Redshift, across all runs of the DAG (e.g. backfills)
+    "copy_slots": 2,
+    "dimension_grouping": "single",
+    # QueryProfiler arguments, e.g. {"mode": "explain"} to EXPLAIN every statement and
+    # keep the plans in a query_plans table, or {"mode": "dry_run"} to only EXPLAIN writes
+    "query_profile": None,
+    # Where the data lives and loads (helpers.backends.make_backend arguments); S3 and
+    # Redshift unless the "redshift" connection's extras say {"backend": "local", ...}
+    "backend": {"kind": "connection", "conn_id": "redshift"},
+
+    "sources": [
+        {
+            "name": "events",
+            "table": "staging_events",
+            "create_sql": "CREATE_staging_events_TABLE_SQL",
+            "s3_bucket": "udacity-dend",
+            # One file per day, so each run reads (and validates) only its own days
+            "s3_key": "log_data/{execution_date.year}/{execution_date.month:02d}/{ds}-events.json",
+            # Append the run's days instead of clearing the table and reloading the history;
+            # each run's load is recorded in stage_watermarks, so a rerun does not load it twice
+            "incremental": True,
+            "JSONPaths": "log_json_path.json",
+            "validate": {
+                "target_bucket": "goose-music-staging",
+                "prefix": "validated/log_data",
+                "json_fields": "staging_events_json_fields",
+                "max_bad_records": 1000,
+            },
+        },
+        {
+            "name": "songs",
+            "table": "staging_songs",
+            "create_sql": "CREATE_staging_songs_TABLE_SQL",
+            # Compact the many one-record song files into a few large gzip files first
+            "compact": {
+                "s3_bucket": "udacity-dend",
+                "source_prefix": "song_data",
+                "compacted_prefix": "song_data_compacted",
+            },
+            "s3_bucket": "goose-music-staging",
+            # Only the parts compacted by this run, so staging_songs holds the run's new
+            # songs and the song, artist and lookup merges only touch those
+            "s3_key": "song_data_compacted/part-{ts_nodash}-",
+            "JSONPaths": "auto",
+            "compression": "GZIP",
+            # A bad part only costs its own reload, skipping at most 100 bad rows
+            "retry_failed_files": True,
+            "retry_max_errors": 100,
+        },
+    ],
+
+    "facts": [
+        {
+            "table": "songplays",
+            "create_sql": "CREATE_songplays_TABLE_SQL",
+            "key": "play_id",
+            "reads": ["staging_events", "song_lookup"],
+            "not_null": ["user_id"],
+        },
+    ],
+
+    "dimensions": [
+        # Songs keyed on their normalized title/artist/duration, for the fact load's join
+        {"table": "song_lookup", "sql": "song_lookup_upsert", "merge_key": "match_key",
+         "create_sql": "CREATE_song_lookup_TABLE_SQL", "reads": ["staging_songs"]},
+        {"table": "users", "sql": "user_table_upsert", "merge_key": "user_id",
+         "create_sql": "CREATE_users_TABLE_SQL", "reads": ["staging_events"]},
+        {"table": "songs", "sql": "song_table_upsert", "merge_key": "song_id",
+         "create_sql": "CREATE_songs_TABLE_SQL", "reads": ["staging_songs"]},
+        {"table": "artists", "sql": "artist_table_upsert", "merge_key": "artist_id",
+         "create_sql": "CREATE_artists_TABLE_SQL", "reads": ["staging_songs"]},
+        {"table": "time", "kind": "time", "merge_key": "start_time",
+         "create_sql": "CREATE_time_TABLE_SQL", "reads": ["songplays"], "calendar_grain": None},
+    ],
+
+    "rollups": {
+        "tables": ["daily_song_plays", "hourly_level_plays", "daily_active_users"],
+        "reads": ["songplays"],
+    },
+
+    # airflow backfill -s 2018-11-01 -e 2018-11-07 Sparkify_Data_Pipeline_dag_backfill
+    "backfill": {
+        "max_active_runs": 4,  # Days reprocessed at once
+        "write_concurrency": 1,  # Days writing the fact, dimension and rollup tables at once
+        "sources": {
+            "events": {
+                "reload_where": "ts >= {{ execution_date.int_timestamp * 1000 }} "
+                                "AND ts < {{ next_execution_date.int_timestamp * 1000 }}",
+            },
+        },
+    },
+
+    "quality": {
+        # Compared with the data's own history rather than fixed counts, and limited
+        # to the run window (a range on the start_time sort key); a sample only saves
+        # aggregation work, since the rows of the window are still read
+        "extra_checks": [
+            {"table": "songplays", "metric": "row_count",
+             "where": "start_time >= '{{ ds }}' AND start_time < '{{ next_ds }}'",
+             "comparator": "within_stddev", "deviations": 3, "history_runs": 14,
+             "describe": "songplays of the day"},
+            {"table": "songplays", "metric": "approx_distinct", "column": "user_id",
+             "where": "start_time >= '{{ ds }}' AND start_time < '{{ next_ds }}'",
+             "comparator": "within_stddev", "deviations": 3, "history_runs": 14,
+             "describe": "approximate active users of the day"},
+            {"table": "songplays", "metric": "null_rate", "column": "song_id", "sample": 0.01,
+             "where": "start_time >= '{{ ds }}' AND start_time < '{{ next_ds }}'",
+             "comparator": "less_than", "value": 0.05,
+             "describe": "share of the day's songplays without a song_id (1% sample)"},
+        ],
+        "result_cache": {"ttl_seconds": 24 * 3600},
+    },
+}
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import logging
+import re
+from contextlib import closing
+
+# Plan steps worth a look: Redshift join redistribution, nested loops, full scans.
+# DS_DIST_NONE and DS_DIST_ALL_NONE (the join is collocated) are not listed.
+PLAN_PATTERNS = [
+    ("DS_BCAST_INNER", re.compile(r"\bDS_BCAST_INNER\b")),
+    ("DS_DIST_BOTH", re.compile(r"\bDS_DIST_BOTH\b")),
+    ("DS_DIST_ALL_INNER", re.compile(r"\bDS_DIST_ALL_INNER\b")),
+    ("DS_DIST_INNER", re.compile(r"\bDS_DIST_INNER\b")),
+    ("DS_DIST_OUTER", re.compile(r"\bDS_DIST_OUTER\b")),
+    ("Nested Loop", re.compile(r"\bNested Loop\b")),
+    ("Seq Scan on {}", re.compile(r"\bSeq Scan on (\w+)")),
+]
+
+# Statements EXPLAIN accepts, and those of them that only read
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+_READ_ONLY = ("SELECT",)
+
+
+def _first_word(sql):
+    words = sql.split()
+    return words[0].upper() if words else ""
+
+
+def plan_nodes(plan_lines):
+    """
+    The plan's node lines without costs and row estimates (which change with
+    the data), e.g. ``XN Hash Join DS_DIST_BOTH``. Conditions and filters are
+    left out too, since they hold each run's dates.
+    """
+    nodes = []
+    for index, line in enumerate(plan_lines):
+        text = line.strip()
+        if index and not text.startswith("->"):
+            continue
+        text = re.sub(r"\(cost=.*?\)|\(actual .*?\)", "", text.lstrip("-> "))
+        nodes.append(" ".join(text.split()))
+    return nodes
+
+
+def plan_findings(plan_lines):
+    """ Sorted, distinct PLAN_PATTERNS found in the plan, e.g. ``["DS_DIST_BOTH", "Seq Scan on users"]`` """
+    findings = set()
+    for node in plan_nodes(plan_lines):
+        for name, pattern in PLAN_PATTERNS:
+            for match in pattern.finditer(node):
+                findings.add(name.format(*match.groups()))
+    return sorted(findings)
+
+
+def statement_key(sql):
+    """ Identifies a statement across runs: a hash of the SQL with literals and whitespace normalized """
+    normalized = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    normalized = re.sub(r"\b\d+(\.\d+)?\b", "?", normalized)
+    normalized = " ".join(normalized.lower().split()).rstrip(";")
+    return hashlib.md5(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+class QueryProfiler:
+    """
+    EXPLAINs the statements SqlMetrics runs and keeps each plan, so plan changes
+    show up between runs.
+
+    - ``mode="explain"`` EXPLAINs each statement, then runs it; on Redshift the
+      per-step timings are read from ``svl_query_summary`` afterwards.
+    - ``mode="dry_run"`` EXPLAINs statements that write instead of running them;
+      SELECTs (e.g. data quality checks) still run. A statement that cannot be
+      explained (it reads a table an earlier, skipped statement would create)
+      is recorded with the error, after rolling back.
+
+    Every plan is stored in ``history_table`` per task and statement, written on
+    a connection of its own (``history_conn_id``) and committed straight away, so
+    the rollback after a failed dry-run EXPLAIN does not take the plans of the
+    task's earlier statements with it. When a
+    statement's plan picks up findings its previous plan did not have (e.g. the
+    fact join starts to DS_DIST_BOTH), it is reported as a plan regression:
+    logged, recorded as a ``PLAN_REGRESSION`` metric, and with
+    ``fail_on_regression`` raised as an error.
+    """
+
+    modes = ("explain", "dry_run")
+
+    # Bookkeeping table: one row per profiled statement run
+    create_sql = """
+        CREATE TABLE IF NOT EXISTS {} (
+            task_id VARCHAR(256) NOT NULL,
+            statement_key VARCHAR(32) NOT NULL,
+            plan_hash VARCHAR(32) NOT NULL,
+            findings VARCHAR(4096),
+            plan VARCHAR(65535),
+            seconds FLOAT,
+            steps VARCHAR(65535),
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+
+    # Previous plan of the same statement
+    previous_sql = """
+        SELECT plan_hash, findings FROM {}
+        WHERE task_id = %s AND statement_key = %s
+        ORDER BY recorded_at DESC
+        LIMIT 1;
+    """
+
+    insert_sql = """
+        INSERT INTO {} (task_id, statement_key, plan_hash, findings, plan, seconds, steps)
+        VALUES (%s, %s, %s, %s, %s, %s, %s);
+    """
+
+    # Actual time and rows of each step of a finished query (Redshift only)
+    steps_sql = """
+        SELECT stm, seg, step, TRIM(label), maxtime, rows, bytes, is_diskbased
+        FROM svl_query_summary
+        WHERE query = {}
+        ORDER BY stm, seg, step;
+    """
+
+    def __init__(self, mode="explain", history_table="query_plans", fail_on_regression=False,
+                 step_timings=True, history_conn_id="redshift"):
+        """
+        :param mode: "explain" or "dry_run".
+        :param history_table: Table the plans are stored in (None keeps no history).
+        :param fail_on_regression: Raise when a plan regresses instead of only reporting it.
+        :param step_timings: Read svl_query_summary for each statement run (Redshift).
+        :param history_conn_id: Connection the plan history is written on.
+        """
+        if mode not in QueryProfiler.modes:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.mode = mode
+        self.history_table = history_table
+        self.fail_on_regression = fail_on_regression
+        self.step_timings = step_timings
+        self.history_conn_id = history_conn_id
+
+    @property
+    def dry_run(self):
+        return self.mode == "dry_run"
+
+    @staticmethod
+    def explainable(sql):
+        # EXPLAIN takes one statement
+        return _first_word(sql) in _EXPLAINABLE and ";" not in sql.strip().rstrip(";")
+
+    def skips(self, sql):
+        """ True if the statement is not to be run (dry run and it writes) """
+        return self.dry_run and _first_word(sql) not in _READ_ONLY
+
+    def explain(self, cursor, sql, parameters=None):
+        """ The statement's plan as ``{"plan": [...], "findings": [...]}``, or None if it cannot be explained """
+        if not self.explainable(sql):
+            return None
+        try:
+            cursor.execute("EXPLAIN " + sql.strip().rstrip(";"), parameters)
+        except Exception as error:
+            if not self.dry_run:
+                raise  # Running it would fail the same way
+            cursor.connection.rollback()
+            return {"plan": [], "findings": [], "explain_error": str(error).strip()}
+        plan = [row[0] for row in cursor.fetchall()]
+        return {"plan": plan, "findings": plan_findings(plan)}
+
+    def history_connection(self):
+        """ A connection of its own for the plan history """
+        from hooks.pooled_postgres_hook import PooledPostgresHook
+        return PooledPostgresHook(postgres_conn_id=self.history_conn_id).get_conn()
+
+    def steps(self, cursor, query_id):
+        """ svl_query_summary rows of a finished query, slowest first """
+        cursor.execute(QueryProfiler.steps_sql.format(int(query_id)))
+        steps = [{"stm": stm, "seg": seg, "step": step, "label": label, "max_ms": round(maxtime / 1000.0, 1),
+                  "rows": rows, "bytes": size, "disk": is_diskbased == "t"}
+                 for stm, seg, step, label, maxtime, rows, size, is_diskbased in cursor.fetchall()]
+        return sorted(steps, key=lambda step: step["max_ms"], reverse=True)
+
+    def observe(self, cursor, task_id, sql, profile, seconds=None, query_id=None):
+        """
+        Store the plan (and step timings) of a statement and compare it with the
+        statement's previous plan. Returns the fields to add to its metrics record.
+        """
+        plan_hash = hashlib.md5("\n".join(plan_nodes(profile["plan"])).encode("utf-8")).hexdigest()
+        fields = {"plan_hash": plan_hash, "findings": profile["findings"]}
+        if profile.get("explain_error"):
+            fields["explain_error"] = profile["explain_error"]
+            return fields
+        if query_id is not None and self.step_timings:
+            fields["steps"] = self.steps(cursor, query_id)[:10]
+        if not self.history_table:
+            return fields
+
+        key = statement_key(sql)
+        with closing(self.history_connection()) as conn:
+            history = conn.cursor()
+            history.execute(QueryProfiler.create_sql.format(self.history_table))
+            history.execute(QueryProfiler.previous_sql.format(self.history_table), (task_id, key))
+            previous = history.fetchone()
+            if previous is not None and previous[0] != plan_hash:
+                before = set(json.loads(previous[1] or "[]"))
+                fields["plan_changed"] = True
+                fields["new_findings"] = [finding for finding in profile["findings"] if finding not in before]
+                logging.log(logging.WARNING if fields["new_findings"] else logging.INFO,
+                            f"Plan of {task_id} statement {key} changed; new findings: "
+                            f"{fields['new_findings'] or 'none'}\n" + "\n".join(profile["plan"]))
+
+            history.execute(QueryProfiler.insert_sql.format(self.history_table),
+                            (task_id, key, plan_hash, json.dumps(profile["findings"]),
+                             "\n".join(profile["plan"])[:65535], seconds,
+                             json.dumps(fields.get("steps", []))[:65535]))
+            conn.commit()
+        return fields
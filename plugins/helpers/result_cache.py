@@ -0,0 +1,123 @@
+import hashlib
+import json
+import re
+
+
+def tables_in(sql):
+    """ Tables a query reads: every name after FROM or JOIN (subqueries are skipped) """
+    return sorted(set(re.findall(r"\b(?:FROM|JOIN)\s+([A-Za-z_][\w.]*)", sql, re.IGNORECASE)))
+
+
+class ResultCache:
+    """
+    Caches the first row of read-only queries (e.g. data quality checks) in a
+    small table in the warehouse, so a retry or a manual re-trigger does not
+    scan tables that have not changed since.
+
+    An entry is keyed on the SQL text and holds a fingerprint of every table the
+    query reads. The fingerprint comes from metadata, not from a scan: on Redshift
+    the table's row count in ``svv_table_info`` and its last insert and delete
+    in ``stl_insert``/``stl_delete``; on Postgres the ``pg_stat_user_tables``
+    counters. ``fingerprint_sql`` can override it per table, e.g.
+    ``{"songplays": "SELECT COUNT(*), MAX(start_time) FROM songplays"}``.
+
+    Entries older than ``ttl_seconds`` are evicted, which also bounds how long
+    Redshift's system tables must remember a change.
+    """
+
+    # Bookkeeping table: one row per cached query
+    create_sql = """
+        CREATE TABLE IF NOT EXISTS {} (
+            cache_key VARCHAR(32) NOT NULL,
+            fingerprint VARCHAR(4096) NOT NULL,
+            result VARCHAR(65535),
+            cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+
+    evict_sql = """
+        DELETE FROM {} WHERE cached_at < CURRENT_TIMESTAMP - INTERVAL '{} seconds';
+    """
+
+    lookup_sql = """
+        SELECT fingerprint, result FROM {} WHERE cache_key = %s;
+    """
+
+    delete_sql = """
+        DELETE FROM {} WHERE cache_key = %s;
+    """
+
+    insert_sql = """
+        INSERT INTO {} (cache_key, fingerprint, result) VALUES (%s, %s, %s);
+    """
+
+    # Table metadata that changes whenever rows are written
+    redshift_table_sql = """
+        SELECT table_id, tbl_rows FROM svv_table_info WHERE "table" = %s;
+    """
+
+    redshift_changes_sql = """
+        SELECT (SELECT MAX(endtime) FROM stl_insert WHERE tbl = {0}),
+               (SELECT MAX(endtime) FROM stl_delete WHERE tbl = {0});
+    """
+
+    postgres_table_sql = """
+        SELECT n_live_tup, n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables WHERE relname = %s;
+    """
+
+    def __init__(self, cache_table="query_result_cache", ttl_seconds=24 * 3600, fingerprint_sql=None):
+        """
+        :param cache_table: Table the results are kept in.
+        :param ttl_seconds: Age after which a cached result is not used.
+        :param fingerprint_sql: Optional query per table whose first row fingerprints it.
+        """
+        self.cache_table = cache_table
+        self.ttl_seconds = ttl_seconds
+        self.fingerprint_sql = fingerprint_sql or {}
+        self.redshift = None
+
+    def prepare(self, cursor):
+        """ Create the cache table and evict expired entries; call once per connection """
+        cursor.execute("SELECT version()")
+        self.redshift = "redshift" in cursor.fetchone()[0].lower()
+        cursor.execute(ResultCache.create_sql.format(self.cache_table))
+        cursor.execute(ResultCache.evict_sql.format(self.cache_table, int(self.ttl_seconds)))
+
+    def table_fingerprint(self, cursor, table):
+        if table in self.fingerprint_sql:
+            cursor.execute(self.fingerprint_sql[table])
+            return list(cursor.fetchone() or [])
+        name = table.split(".")[-1]
+        if not self.redshift:
+            cursor.execute(ResultCache.postgres_table_sql, (name,))
+            return list(cursor.fetchone() or [])
+        cursor.execute(ResultCache.redshift_table_sql, (name,))
+        row = cursor.fetchone()
+        if row is None:
+            return []
+        table_id, rows = row
+        cursor.execute(ResultCache.redshift_changes_sql.format(int(table_id)))
+        return [rows] + list(cursor.fetchone())
+
+    def fingerprint(self, cursor, tables):
+        """ Fingerprint of the tables, as stored with the cached result """
+        return json.dumps({table: self.table_fingerprint(cursor, table) for table in tables}, default=str)
+
+    @staticmethod
+    def key(sql):
+        return hashlib.md5(" ".join(sql.split()).encode("utf-8")).hexdigest()
+
+    def get(self, cursor, sql, fingerprint):
+        """ ``(True, first row)`` if the query is cached for this fingerprint, else ``(False, None)`` """
+        cursor.execute(ResultCache.lookup_sql.format(self.cache_table), (self.key(sql),))
+        entry = cursor.fetchone()
+        if entry is None or entry[0] != fingerprint:
+            return False, None
+        return True, json.loads(entry[1])
+
+    def put(self, cursor, sql, fingerprint, row):
+        """ Cache the query's first row (None if it returned nothing) """
+        key = self.key(sql)
+        cursor.execute(ResultCache.delete_sql.format(self.cache_table), (key,))
+        cursor.execute(ResultCache.insert_sql.format(self.cache_table),
+                       (key, fingerprint, json.dumps(list(row) if row is not None else None, default=str)))
@@ -0,0 +1,93 @@
+from collections import namedtuple
+from datetime import timedelta
+
+
+class Rollup(namedtuple("Rollup", ["table", "grain", "bucket_column", "create_sql", "select_sql"])):
+    """
+    A summary table over ``songplays``, aggregated per time bucket.
+
+    ``grain`` is ``hour`` or ``day``; ``bucket_column`` holds the bucket start
+    (``DATE_TRUNC(grain, start_time)``). ``select_sql`` aggregates the fact rows
+    matching ``{window}``.
+    """
+
+    def bucket_range(self, start, end):
+        """ Widen [start, end) to whole buckets, so no bucket is half recomputed """
+        step = timedelta(hours=1) if self.grain == "hour" else timedelta(days=1)
+        floor = start.replace(minute=0, second=0, microsecond=0)
+        if self.grain == "day":
+            floor = floor.replace(hour=0)
+        ceiling = floor
+        while ceiling < end:
+            ceiling += step
+        return floor, ceiling
+
+    def window_sql(self, start, end, column="start_time"):
+        return (f"{column} >= '{start:%Y-%m-%d %H:%M:%S}' "
+                f"AND {column} < '{end:%Y-%m-%d %H:%M:%S}'")
+
+    def refresh_sql(self, source_table, start, end):
+        """ Statements that recompute the rollup's buckets in [start, end) from the fact table """
+        return [
+            f"DELETE FROM {self.table} WHERE {self.window_sql(start, end, self.bucket_column)};",
+            f"INSERT INTO {self.table} "
+            + self.select_sql.format(source=source_table, window=self.window_sql(start, end)),
+        ]
+
+
+# Rollups the dashboards read instead of scanning songplays
+ROLLUPS = {
+    # Plays and listeners per song and day (top songs per day)
+    "daily_song_plays": Rollup(
+        "daily_song_plays", "day", "play_date",
+        """
+        CREATE TABLE IF NOT EXISTS daily_song_plays (
+            play_date TIMESTAMP NOT NULL,
+            song_id VARCHAR(256),
+            artist_id VARCHAR(256),
+            plays BIGINT NOT NULL,
+            listeners BIGINT NOT NULL
+        );
+        """,
+        """
+        SELECT DATE_TRUNC('day', start_time), song_id, MAX(artist_id),
+               COUNT(*), COUNT(DISTINCT user_id)
+        FROM {source}
+        WHERE {window}
+        GROUP BY 1, 2;
+        """),
+    # Plays and active users per hour and subscription level
+    "hourly_level_plays": Rollup(
+        "hourly_level_plays", "hour", "play_hour",
+        """
+        CREATE TABLE IF NOT EXISTS hourly_level_plays (
+            play_hour TIMESTAMP NOT NULL,
+            level VARCHAR(50),
+            plays BIGINT NOT NULL,
+            active_users BIGINT NOT NULL
+        );
+        """,
+        """
+        SELECT DATE_TRUNC('hour', start_time), level, COUNT(*), COUNT(DISTINCT user_id)
+        FROM {source}
+        WHERE {window}
+        GROUP BY 1, 2;
+        """),
+    # Daily active users per subscription level
+    "daily_active_users": Rollup(
+        "daily_active_users", "day", "play_date",
+        """
+        CREATE TABLE IF NOT EXISTS daily_active_users (
+            play_date TIMESTAMP NOT NULL,
+            level VARCHAR(50),
+            active_users BIGINT NOT NULL,
+            plays BIGINT NOT NULL
+        );
+        """,
+        """
+        SELECT DATE_TRUNC('day', start_time), level, COUNT(DISTINCT user_id), COUNT(*)
+        FROM {source}
+        WHERE {window}
+        GROUP BY 1, 2;
+        """),
+}
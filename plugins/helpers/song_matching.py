@@ -0,0 +1,14 @@
+# Normalized identity of a song, used to match log events to songs on one column.
+# Case and surrounding spaces are ignored and the duration is compared to the
+# millisecond, so the same expression gives the same key for staging_songs
+# (title, artist_name, duration) and staging_events (song, artist, length).
+# A NULL in any part gives a NULL key, which never matches.
+SONG_MATCH_KEY = (
+    "MD5(LOWER(TRIM({title})) || '|' || LOWER(TRIM({artist})) || '|' "
+    "|| CAST(CAST({duration} AS DECIMAL(12, 3)) AS VARCHAR))"
+)
+
+
+def song_match_key(title, artist, duration):
+    """ SQL expression for the match key of the given title, artist and duration columns """
+    return SONG_MATCH_KEY.format(title=title, artist=artist, duration=duration)
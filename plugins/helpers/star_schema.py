@@ -0,0 +1,60 @@
+from collections import namedtuple
+
+
+class TableLayout(namedtuple("TableLayout", ["diststyle", "distkey", "sortkey"])):
+    """
+    Redshift physical layout of a table: distribution style/key and sort key.
+
+    ``diststyle`` is ALL, EVEN, KEY or AUTO; ``distkey`` is only used with KEY;
+    ``sortkey`` is a tuple of columns (compound sort key).
+    """
+
+    def clause(self):
+        """ Table attributes for CREATE TABLE, e.g. ``DISTSTYLE KEY DISTKEY (song_id) SORTKEY (start_time)`` """
+        parts = [f"DISTSTYLE {self.diststyle}"]
+        if self.diststyle == "KEY":
+            parts.append(f"DISTKEY ({self.distkey})")
+        if self.sortkey:
+            parts.append(f"SORTKEY ({', '.join(self.sortkey)})")
+        return " ".join(parts)
+
+    def svv_diststyle(self):
+        """ How svv_table_info reports this distribution style """
+        return f"KEY({self.distkey})" if self.diststyle == "KEY" else self.diststyle
+
+
+# Layouts for the star schema:
+# - songplays and songs share song_id as distribution key, so their join is collocated
+# - the small dimensions and the song lookup are copied to every node (DISTSTYLE ALL)
+# - songplays is sorted on start_time, so time-range filters skip blocks
+STAR_SCHEMA_LAYOUTS = {
+    "songplays": TableLayout("KEY", "song_id", ("start_time",)),
+    "songs": TableLayout("KEY", "song_id", ("song_id",)),
+    "users": TableLayout("ALL", None, ("user_id",)),
+    "artists": TableLayout("ALL", None, ("artist_id",)),
+    "time": TableLayout("ALL", None, ("start_time",)),
+    "song_lookup": TableLayout("ALL", None, ("match_key",)),
+}
+
+
+def create_table_sql(create_sql, layout):
+    """ Add a layout's table attributes to a ``CREATE TABLE (...);`` statement """
+    body = create_sql.rstrip().rstrip(";").rstrip()
+    return f"{body}\n{layout.clause()};\n"
+
+
+def deep_copy_sql(table, layout):
+    """
+    Statements that rebuild a table in place with a new layout (deep copy).
+
+    The copy is created with ``LIKE``, so columns, defaults and NOT NULL carry
+    over; the old table is dropped with CASCADE, which also drops the
+    (informational) foreign keys that point at it.
+    """
+    return [
+        f"CREATE TABLE {table}_deep_copy (LIKE {table}) {layout.clause()};",
+        f"INSERT INTO {table}_deep_copy SELECT * FROM {table};",
+        f"ALTER TABLE {table} RENAME TO {table}_old;",
+        f"ALTER TABLE {table}_deep_copy RENAME TO {table};",
+        f"DROP TABLE {table}_old CASCADE;",
+    ]
@@ -0,0 +1,80 @@
+class PartitionWatermark:
+    """
+    Tracks which S3 partitions have already been loaded into each staging table.
+
+    The watermark lives in a small bookkeeping table in Redshift, so re-runs and
+    catch-up backfills can skip partitions that were loaded by an earlier run.
+    """
+
+    # Bookkeeping table: one row per (staging table, S3 path) that was loaded
+    create_sql = """
+        CREATE TABLE IF NOT EXISTS {} (
+            table_name VARCHAR(256) NOT NULL,
+            s3_path VARCHAR(1024) NOT NULL,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+
+    # Look up whether a partition was already loaded
+    exists_sql = """
+        SELECT COUNT(*) FROM {}
+        WHERE table_name = '{}' AND s3_path = '{}';
+    """
+
+    # Record a loaded partition (run in the same transaction as the COPY)
+    insert_sql = """
+        INSERT INTO {} (table_name, s3_path) VALUES ('{}', '{}');
+    """
+
+    # Every path loaded into a table
+    paths_sql = """
+        SELECT s3_path FROM {} WHERE table_name = '{}';
+    """
+
+    # Drop a table's paths once they are no longer needed
+    delete_sql = """
+        DELETE FROM {} WHERE table_name = '{}';
+    """
+
+    def __init__(self, redshift, watermark_table="stage_watermarks"):
+        """
+        :param redshift: PostgresHook connected to Redshift.
+        :param watermark_table: Name of the bookkeeping table.
+        """
+        self.redshift = redshift
+        self.watermark_table = watermark_table
+
+    @staticmethod
+    def _quote(value):
+        # Escape single quotes so paths can be embedded in SQL literals
+        return str(value).replace("'", "''")
+
+    def ensure_table(self):
+        """ Create the watermark table if it does not exist yet """
+        self.redshift.run(PartitionWatermark.create_sql.format(self.watermark_table))
+
+    def is_loaded(self, table, s3_path):
+        """ Return True if this S3 path was already loaded into the table """
+        record = self.redshift.get_first(PartitionWatermark.exists_sql.format(
+            self.watermark_table, self._quote(table), self._quote(s3_path)))
+        return bool(record and record[0])
+
+    def mark_loaded_sql(self, table, s3_path):
+        """ SQL that records the S3 path as loaded for the table """
+        return PartitionWatermark.insert_sql.format(
+            self.watermark_table, self._quote(table), self._quote(s3_path))
+
+    def loaded_paths(self, table):
+        """ Every S3 path recorded as loaded for the table """
+        records = self.redshift.get_records(PartitionWatermark.paths_sql.format(
+            self.watermark_table, self._quote(table)))
+        return {record[0] for record in records}
+
+    def mark_all_loaded_sql(self, table, s3_paths):
+        """ SQL that records several S3 paths as loaded for the table in one statement """
+        values = ", ".join(f"('{self._quote(table)}', '{self._quote(s3_path)}')" for s3_path in s3_paths)
+        return f"INSERT INTO {self.watermark_table} (table_name, s3_path) VALUES {values};"
+
+    def forget_sql(self, table):
+        """ SQL that drops every path recorded for the table """
+        return PartitionWatermark.delete_sql.format(self.watermark_table, self._quote(table))
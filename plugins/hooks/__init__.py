@@ -0,0 +1,7 @@
+from hooks.pooled_postgres_hook import PooledPostgresHook, ConnectionPool, PooledConnection
+
+__all__ = [
+    'PooledPostgresHook',
+    'ConnectionPool',
+    'PooledConnection',
+]
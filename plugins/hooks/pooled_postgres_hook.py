@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+import time
+
+from airflow.hooks.postgres_hook import PostgresHook  # Connects to Redshift
+
+
+class PooledConnection:
+    """
+    A pooled DB-API connection. Behaves like the wrapped connection, except that
+    ``close()`` hands it back to its pool instead of closing it.
+    """
+
+    # Attributes kept on the wrapper; everything else is read from and written to the connection
+    _own = ("_pool", "_raw", "_released", "created_at", "released_at", "wait_seconds")
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+        self.created_at = time.monotonic()
+        self.released_at = self.created_at
+        self.wait_seconds = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        # e.g. DbApiHook.run() sets ``conn.autocommit``
+        if name in PooledConnection._own:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._raw, name, value)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self)
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections for one Airflow connection id in one process.
+
+    - At most ``max_size`` connections are handed out at once; callers beyond
+      that wait (up to ``acquire_timeout`` seconds) and the wait is recorded.
+    - Idle connections older than ``max_age`` seconds are recycled.
+    - Connections idle for more than ``check_after`` seconds are health-checked
+      with ``SELECT 1`` before reuse and replaced if the check fails.
+    """
+
+    def __init__(self, connect, max_size=4, max_age=3600, check_after=30, acquire_timeout=600):
+        self.connect = connect
+        self.max_size = max_size
+        self.max_age = max_age
+        self.check_after = check_after
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "created": 0, "recycled": 0, "failed_checks": 0,
+                      "waits": 0, "wait_seconds": 0.0}
+
+    def acquire(self):
+        """ Take a healthy connection from the pool, creating one if needed """
+        start = time.monotonic()
+        waited = 0.0
+        if not self._slots.acquire(blocking=False):
+            self._count("waits")
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                raise TimeoutError(f"No pooled connection free after {self.acquire_timeout}s "
+                                   f"(pool size {self.max_size})")
+            waited = time.monotonic() - start
+            self._count("wait_seconds", waited)
+            logging.info(f"Waited {waited:.3f}s for a pooled connection")
+
+        try:
+            connection = self._reuse()
+            if connection is None:
+                connection = PooledConnection(self, self.connect())
+                self._count("created")
+        except Exception:
+            self._slots.release()
+            raise
+
+        connection._released = False
+        connection.wait_seconds = waited
+        self._count("acquired")
+        return connection
+
+    def _count(self, name, amount=1):
+        # Threads share the pool, and += on a dict entry is not atomic
+        with self._lock:
+            self.stats[name] += amount
+
+    def _reuse(self):
+        """ Pop an idle connection that is young enough and still answers """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection = self._idle.pop()
+
+            now = time.monotonic()
+            if now - connection.created_at > self.max_age:
+                self._count("recycled")
+                self._discard(connection)
+                continue
+            if now - connection.released_at > self.check_after and not self._healthy(connection):
+                self._count("failed_checks")
+                self._discard(connection)
+                continue
+            return connection
+
+    @staticmethod
+    def _healthy(connection):
+        try:
+            cursor = connection._raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            connection._raw.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(connection):
+        try:
+            connection._raw.close()
+        except Exception:
+            pass
+
+    def release(self, connection):
+        """ Return a connection: roll back anything uncommitted and keep it idle """
+        try:
+            if getattr(connection._raw, "closed", 0):
+                return
+            try:
+                connection._raw.rollback()
+                if getattr(connection._raw, "autocommit", False):
+                    connection._raw.autocommit = False
+            except Exception:
+                self._discard(connection)
+                return
+            connection.released_at = time.monotonic()
+            with self._lock:
+                self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._discard(connection)
+
+
+# One pool per (process, connection id); forked workers get their own pools
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PooledPostgresHook(PostgresHook):
+    """
+    PostgresHook whose ``get_conn()`` hands out connections from a per-process pool.
+
+    Airflow runs every task instance in its own ``airflow run`` process, so the
+    pool only reuses connections within one task: the task's statements and
+    helpers (watermark lookups, COPY slots, plan history) share its connections
+    instead of reconnecting. A task holds at most ``pool_size`` connections at
+    once; the staging task uses up to three (its load, a watermark lookup and a
+    COPY slot). Sharing connections across tasks, and capping how many Redshift
+    sees during a backfill, is left to the PgBouncer in docker-compose.yaml
+    (``pgbouncer/pgbouncer.ini``), which the ``redshift`` connection points at.
+
+    ``closing(hook.get_conn())`` and ``hook.run()`` work unchanged: closing a pooled
+    connection returns it to the pool.
+    """
+
+    def __init__(self, *args, pool_size=4, max_age=3600, check_after=30, acquire_timeout=600, **kwargs):
+        super(PooledPostgresHook, self).__init__(*args, **kwargs)
+        self.pool_size = pool_size
+        self.max_age = max_age
+        self.check_after = check_after
+        self.acquire_timeout = acquire_timeout
+
+    @property
+    def pool(self):
+        conn_id = getattr(self, self.conn_name_attr)
+        key = (os.getpid(), conn_id)
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = ConnectionPool(super(PooledPostgresHook, self).get_conn,
+                                             max_size=self.pool_size,
+                                             max_age=self.max_age,
+                                             check_after=self.check_after,
+                                             acquire_timeout=self.acquire_timeout)
+            return _pools[key]
+
+    def get_conn(self):
+        return self.pool.acquire()
+
+    def pool_stats(self):
+        """ Counters for this connection's pool: acquisitions, creations, recycles and waits """
+        pool = self.pool
+        with pool._lock:
+            return dict(pool.stats, size=pool.max_size)
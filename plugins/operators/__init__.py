@@ -1,13 +1,31 @@
-# Import the custom operator classes from their respective files
-from operators.stage_redshift import StageToRedshiftOperator
-from operators.load_fact import LoadFactOperator
-from operators.load_dimension import LoadDimensionOperator
-from operators.data_quality import DataQualityOperator
+# The custom operator classes, imported from their respective files on first use
+# (module __getattr__, PEP 562): importing one operator module, as the DAG files
+# do, then loads only that operator instead of all of them
+import importlib
+
+_MODULES = {
+    'StageToRedshiftOperator': 'operators.stage_to_redshift',
+    'LoadFactOperator': 'operators.load_to_fact_table',
+    'LoadDimensionOperator': 'operators.load_to_dimension_table',
+    'DataQualityOperator': 'operators.data_quality_check',
+    'CompactJsonOperator': 'operators.compact_json',
+    'ConvertJsonOperator': 'operators.convert_json',
+    'RebuildTableLayoutOperator': 'operators.rebuild_table_layout',
+    'CreateTableOperator': 'operators.create_table',
+    'LoadRollupsOperator': 'operators.load_rollups',
+    'LoadTimeDimensionOperator': 'operators.load_time_dimension',
+    'ValidateJsonOperator': 'operators.validate_json',
+}
 
 # Define the list of modules that can be imported when using "from operators import *"
-__all__ = [
-    'StageToRedshiftOperator',
-    'LoadFactOperator',
-    'LoadDimensionOperator',
-    'DataQualityOperator'
-]
+__all__ = list(_MODULES)
+
+
+def __getattr__(name):
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_MODULES[name]), name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
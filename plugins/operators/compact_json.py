@@ -0,0 +1,127 @@
+import gzip
+import json
+import os
+import tempfile
+from contextlib import closing
+
+from airflow.models import BaseOperator  # Base class for all Airflow Operators
+from airflow.utils.decorators import apply_defaults  # Handles default arguments
+
+from helpers.backends import RedshiftBackend  # S3, or a local directory standing in for it
+from helpers.json_records import iter_object_records  # Streams JSON records from objects
+
+
+class CompactJsonOperator(BaseOperator):
+    """
+    Custom Airflow Operator that compacts many small JSON objects in S3 into a few
+    large gzip-compressed, newline-delimited JSON files.
+
+    Features:
+    - Streams one source object at a time into a gzip part file on local disk, so
+      memory stays bounded no matter how many files there are.
+    - Rolls over to a new part once ``target_file_bytes`` of JSON has been written.
+    - Incremental: every run writes an index segment listing the source keys it
+      folded in; later runs list the index prefix and only compact new keys.
+
+    The compacted prefix can then be staged with
+    ``StageToRedshiftOperator(..., compression="GZIP")``.
+    """
+    # Set UI color for the task in Airflow DAGs
+    ui_color = '#6B8E23'
+
+    @apply_defaults
+    def __init__(self,
+                 aws_credentials_id="",  # AWS credentials ID (Airflow)
+                 s3_bucket="",  # Bucket holding the small source files
+                 source_prefix="",  # Prefix of the small source files (e.g. song_data)
+                 target_bucket="",  # Bucket for compacted files (defaults to s3_bucket)
+                 compacted_prefix="",  # Prefix the compacted parts are written to
+                 target_file_bytes=128 * 1024 * 1024,  # Uncompressed size per part
+                 source_store=None,  # Optional store override for the source files
+                 target_store=None,  # Optional store override for the compacted files
+                 backend=None,  # Backend whose object stores to use (default RedshiftBackend, i.e. S3)
+                 *args, **kwargs):
+        super(CompactJsonOperator, self).__init__(*args, **kwargs)
+
+        # Store parameters for later use
+        self.aws_credentials_id = aws_credentials_id
+        self.s3_bucket = s3_bucket
+        self.source_prefix = source_prefix
+        self.target_bucket = target_bucket or s3_bucket
+        self.compacted_prefix = compacted_prefix
+        self.target_file_bytes = target_file_bytes
+        self.source_store = source_store
+        self.target_store = target_store
+        self.backend = backend or RedshiftBackend()
+
+    @property
+    def index_prefix(self):
+        return f"{self.compacted_prefix}/_index/"
+
+    def compacted_keys(self, target):
+        """ Source keys already folded into the compacted prefix, from the index segments """
+        done = set()
+        for segment in target.list_objects(self.index_prefix):
+            with closing(target.open(segment.key)) as body:
+                with gzip.GzipFile(fileobj=body) as lines:
+                    done.update(line.decode("utf-8").rstrip("\n") for line in lines if line.strip())
+        return done
+
+    def execute(self, context):
+        """ Compacts the new source files and records them in a new index segment """
+        source = self.source_store or self.backend.object_store(self.s3_bucket, self.aws_credentials_id)
+        target = self.target_store or self.backend.object_store(self.target_bucket, self.aws_credentials_id)
+
+        # Only fold in files that no earlier run has compacted
+        done = self.compacted_keys(target)
+        new_objects = [obj for obj in source.list_objects(self.source_prefix) if obj.key not in done]
+        self.log.info(f"{len(new_objects)} new file(s) under {self.source_prefix} "
+                      f"({len(done)} already compacted)")
+        if not new_objects:
+            return {"files": 0, "records": 0, "parts": 0}
+
+        run_tag = context["ts_nodash"]
+        parts = []
+        records = 0
+        workdir = tempfile.mkdtemp(prefix="compact_")
+        part_path, part, part_bytes = None, None, 0
+        try:
+            for obj in new_objects:
+                # Start a new part when the current one is full
+                if part is None or part_bytes >= self.target_file_bytes:
+                    if part is not None:
+                        part.close()
+                        parts.append(self.upload_part(target, part_path, run_tag, len(parts)))
+                    part_path = os.path.join(workdir, f"part-{len(parts):05d}.json.gz")
+                    part, part_bytes = gzip.open(part_path, "wb"), 0
+
+                for record in iter_object_records(source, obj.key):
+                    line = (json.dumps(record) + "\n").encode("utf-8")
+                    part.write(line)
+                    part_bytes += len(line)
+                    records += 1
+
+            part.close()
+            parts.append(self.upload_part(target, part_path, run_tag, len(parts)))
+
+            # Write the index segment last, so a failed run is simply redone
+            index_path = os.path.join(workdir, "index.keys.gz")
+            with gzip.open(index_path, "wb") as index:
+                for obj in new_objects:
+                    index.write((obj.key + "\n").encode("utf-8"))
+            target.upload_file(index_path, f"{self.index_prefix}{run_tag}.keys.gz")
+        finally:
+            for name in os.listdir(workdir):
+                os.remove(os.path.join(workdir, name))
+            os.rmdir(workdir)
+
+        self.log.info(f"Compacted {len(new_objects)} file(s) and {records} record(s) "
+                      f"into {len(parts)} part(s) under {self.compacted_prefix}")
+        return {"files": len(new_objects), "records": records, "parts": len(parts)}
+
+    def upload_part(self, target, part_path, run_tag, index):
+        """ Upload a finished part file and remove it from local disk """
+        key = f"{self.compacted_prefix}/part-{run_tag}-{index:05d}.json.gz"
+        target.upload_file(part_path, key)
+        os.remove(part_path)
+        return key
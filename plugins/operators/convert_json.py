@@ -0,0 +1,227 @@
+import codecs
+import csv
+import gzip
+import json
+import os
+import tempfile
+from contextlib import closing
+
+from airflow.models import BaseOperator  # Base class for all Airflow Operators
+from airflow.utils.decorators import apply_defaults  # Handles default arguments
+
+from helpers.ddl import parse_columns, type_family  # Reads column types from the DDL
+from helpers.json_validation import column_rules, field_value, iter_checked_values, record_errors
+from helpers.backends import RedshiftBackend  # S3, or a local directory standing in for it
+
+
+class ConvertJsonOperator(BaseOperator):
+    """
+    Custom Airflow Operator that converts raw JSON files in S3 into column-typed
+    Parquet (or gzip CSV) files matching a staging table's DDL.
+
+    Features:
+    - Columns and types come from the staging table's CREATE TABLE statement
+      (e.g. ``CREATE_staging_events_TABLE_SQL``), in table order, so Redshift can
+      COPY the files positionally with ``FORMAT AS PARQUET`` or ``FORMAT AS CSV``.
+    - ``json_fields`` maps the table's columns to JSON fields by position, like a
+      JSONPaths file (e.g. ``staging_events_json_fields`` for the camelCase event
+      logs). Without it each column reads the field of the same name, ignoring
+      case like COPY's ``'auto'``, and the task fails if a column matches no field
+      in any record, rather than loading the column as all NULL.
+    - Records are checked like ValidateJsonOperator does: text that is not JSON,
+      values that are not objects and values of the wrong type are written, with
+      their errors, to ``quarantine_prefix`` and left out. The task fails if more
+      than ``max_bad_records`` records are bad.
+    - Records are streamed and written in batches of ``batch_rows``, so memory is
+      bounded by one batch; a new file starts every ``rows_per_file`` rows.
+    - Parquet output needs ``pyarrow`` on the worker; CSV output does not.
+
+    The pipeline spec does not use it: events are validated and loaded
+    incrementally as JSON, and songs are compacted first. It converts a prefix
+    in one go, e.g. to load a large history as Parquet.
+    """
+    # Set UI color for the task in Airflow DAGs
+    ui_color = '#4682B4'
+    # Template fields allow dynamic values using Airflow's templating engine
+    template_fields = ("source_prefix", "target_prefix", "quarantine_prefix")
+
+    output_formats = ("parquet", "csv")
+
+    @apply_defaults
+    def __init__(self,
+                 aws_credentials_id="",  # AWS credentials ID (Airflow)
+                 s3_bucket="",  # Bucket holding the raw JSON files
+                 source_prefix="",  # Prefix of the raw JSON files
+                 target_bucket="",  # Bucket for converted files (defaults to s3_bucket)
+                 target_prefix="",  # Prefix the converted files are written to
+                 create_table_sql="",  # CREATE TABLE of the staging table to match
+                 json_fields=None,  # JSON field per column, in table order
+                 quarantine_prefix="",  # Prefix for the bad records (in the target bucket)
+                 max_bad_records=0,  # Fail if more records than this are bad (None = never)
+                 output_format="parquet",  # "parquet" or "csv" (gzip-compressed)
+                 batch_rows=50000,  # Rows held in memory before a batch is written
+                 rows_per_file=5000000,  # Rows per output file
+                 source_store=None,  # Optional store override for the source files
+                 target_store=None,  # Optional store override for the converted files
+                 backend=None,  # Backend whose object stores to use (default RedshiftBackend, i.e. S3)
+                 *args, **kwargs):
+        super(ConvertJsonOperator, self).__init__(*args, **kwargs)
+
+        if output_format not in ConvertJsonOperator.output_formats:
+            raise ValueError(f"Unknown output format: {output_format}")
+
+        # Store parameters for later use
+        self.aws_credentials_id = aws_credentials_id
+        self.s3_bucket = s3_bucket
+        self.source_prefix = source_prefix
+        self.target_bucket = target_bucket or s3_bucket
+        self.target_prefix = target_prefix
+        self.create_table_sql = create_table_sql
+        self.json_fields = json_fields
+        self.quarantine_prefix = quarantine_prefix
+        self.max_bad_records = max_bad_records
+        self.output_format = output_format
+        self.batch_rows = batch_rows
+        self.rows_per_file = rows_per_file
+        self.source_store = source_store
+        self.target_store = target_store
+        self.backend = backend or RedshiftBackend()
+
+    @staticmethod
+    def coerce(value, family):
+        """
+        Convert a JSON value, already checked by record_errors, to the column's
+        type; empty strings become NULL
+        """
+        if value is None or value == "":
+            return None
+        if family in ("integer", "timestamp"):
+            return int(value)  # Timestamps are epoch milliseconds, like COPY's TIMEFORMAT
+        if family == "float":
+            return float(value)
+        if family == "boolean":
+            return value
+        return str(value)
+
+    def arrow_schema(self, columns):
+        import pyarrow as pa  # Optional dependency, only needed for Parquet
+
+        # Parquet types Redshift loads into each column type without conversion
+        exact_types = {
+            "SMALLINT": pa.int16(), "INT2": pa.int16(),
+            "INT": pa.int32(), "INTEGER": pa.int32(), "INT4": pa.int32(),
+            "REAL": pa.float32(), "FLOAT4": pa.float32(),
+        }
+        family_types = {
+            "integer": pa.int64(),
+            "float": pa.float64(),
+            "boolean": pa.bool_(),
+            "timestamp": pa.int64(),
+        }
+        return pa.schema([(name, exact_types.get(sql_type, family_types.get(type_family(sql_type), pa.string())))
+                          for name, sql_type, _ in columns])
+
+    def open_writer(self, path, columns):
+        """ Writer for one output file: returns (write_batch, close) callables """
+        if self.output_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = self.arrow_schema(columns)
+            writer = pq.ParquetWriter(path, schema, compression="snappy")
+
+            def write_batch(rows):
+                table = pa.Table.from_pydict(
+                    {name: [row[i] for row in rows] for i, (name, _, _) in enumerate(columns)},
+                    schema=schema)
+                writer.write_table(table)
+            return write_batch, writer.close
+
+        handle = gzip.open(path, "wt", newline="")
+        writer = csv.writer(handle)
+        return writer.writerows, handle.close
+
+    def execute(self, context):
+        """ Streams the raw JSON files into typed files under the target prefix """
+        source = self.source_store or self.backend.object_store(self.s3_bucket, self.aws_credentials_id)
+        target = self.target_store or self.backend.object_store(self.target_bucket, self.aws_credentials_id)
+
+        columns = parse_columns(self.create_table_sql)
+        rules = column_rules(self.create_table_sql, self.json_fields)
+        by_name = self.json_fields is None
+        extension = "parquet" if self.output_format == "parquet" else "csv.gz"
+        # Columns no record has a field for yet (only checked when matching by name)
+        unmatched = {field.lower() for field, _, _, _, _ in rules} if by_name else set()
+
+        workdir = tempfile.mkdtemp(prefix="convert_")
+        bad_path = os.path.join(workdir, "bad.json")
+        files, rows, bad, batch = [], 0, 0, []
+        write_batch = close = path = None
+        try:
+            with open(bad_path, "w", encoding="utf-8") as bad_file:
+                for obj in source.list_objects(self.source_prefix):
+                    with closing(source.open(obj.key)) as body:
+                        stream = gzip.GzipFile(fileobj=body) if obj.key.endswith(".gz") else body
+                        for record, text in iter_checked_values(codecs.getreader("utf-8")(stream)):
+                            errors = ["not valid JSON"] if text is not None else record_errors(record, rules,
+                                                                                               by_name)
+                            if not errors:
+                                try:
+                                    row = [self.coerce(field_value(record, field, by_name), family)
+                                           for field, _, _, family, _ in rules]
+                                except (TypeError, ValueError) as error:
+                                    errors = [str(error)]
+                            if errors:
+                                bad += 1
+                                bad_file.write(json.dumps({"source": obj.key, "errors": errors,
+                                                           "record": record if text is None else text}) + "\n")
+                                continue
+                            if unmatched:
+                                unmatched.difference_update(key.lower() for key in record)
+
+                            if write_batch is None:
+                                path = os.path.join(workdir, f"part-{len(files):05d}.{extension}")
+                                write_batch, close = self.open_writer(path, columns)
+                            batch.append(row)
+                            rows += 1
+
+                            if len(batch) >= self.batch_rows:
+                                write_batch(batch)
+                                batch = []
+                            if rows % self.rows_per_file == 0:
+                                if batch:
+                                    write_batch(batch)
+                                    batch = []
+                                close()
+                                files.append(self.upload(target, path, len(files), extension))
+                                write_batch = None
+
+            if write_batch is not None:
+                if batch:
+                    write_batch(batch)
+                close()
+                files.append(self.upload(target, path, len(files), extension))
+            if bad and self.quarantine_prefix:
+                target.upload_file(bad_path, f"{self.quarantine_prefix}/bad-records.json")
+        finally:
+            for name in os.listdir(workdir):
+                os.remove(os.path.join(workdir, name))
+            os.rmdir(workdir)
+
+        self.log.info(f"Converted {rows} record(s) under {self.source_prefix} into "
+                      f"{len(files)} {self.output_format} file(s) under {self.target_prefix}, "
+                      f"{bad} bad record(s) left out")
+        if self.max_bad_records is not None and bad > self.max_bad_records:
+            raise ValueError(f"{bad} bad record(s) under {self.source_prefix}, "
+                             f"more than the {self.max_bad_records} allowed")
+        if rows and unmatched:
+            raise ValueError(f"No record has a field for column(s) {', '.join(sorted(unmatched))}; "
+                             f"map the columns to their JSON fields with json_fields")
+        return {"rows": rows, "files": files, "bad_records": bad}
+
+    def upload(self, target, path, index, extension):
+        """ Upload a finished file and remove it from local disk """
+        key = f"{self.target_prefix}/part-{index:05d}.{extension}"
+        target.upload_file(path, key)
+        os.remove(path)
+        return key
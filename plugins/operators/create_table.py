@@ -0,0 +1,50 @@
+from contextlib import closing  # Closes the Redshift connection when done
+from airflow.models import BaseOperator  # Base class for custom Airflow operators
+from airflow.utils.decorators import apply_defaults  # Allows default values for parameters
+
+from helpers.instrumentation import SqlMetrics  # Records SQL timings
+from helpers.backends import RedshiftBackend  # Adapts the DDL for a local stand-in
+
+
+class CreateTableOperator(BaseOperator):
+    """
+    Custom Airflow Operator that runs a table's CREATE TABLE statement in Redshift.
+
+    Does the job of PostgresOperator for the create tasks, but loads the database
+    hook only when the task runs, so the DAG file does not import PostgresHook
+    (and psycopg2) every time the scheduler parses it. With LocalBackend the
+    Redshift table attributes (DISTSTYLE, SORTKEY, ...) are dropped for Postgres.
+    """
+
+    # Set UI color in Airflow
+    ui_color = '#EDEDED'
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",  # Connection ID for Redshift (set in Airflow)
+                 table="",  # Table the statement creates (for logs and metrics)
+                 create_sql="",  # CREATE TABLE statement
+                 metrics_sink=None,  # Optional sink for SQL timings
+                 backend=None,  # RedshiftBackend (default) or LocalBackend (see helpers.backends)
+                 *args, **kwargs):
+
+        super(CreateTableOperator, self).__init__(*args, **kwargs)
+
+        # Store parameters for later use
+        self.redshift_conn_id = redshift_conn_id
+        self.table = table
+        self.create_sql = create_sql
+        self.metrics_sink = metrics_sink
+        self.backend = backend or RedshiftBackend()
+
+    def execute(self, context):
+        from hooks.pooled_postgres_hook import PooledPostgresHook
+
+        self.log.info(f'Creating {self.table} if it does not exist...')
+        redshift = PooledPostgresHook(postgres_conn_id=self.redshift_conn_id)
+        metrics = SqlMetrics(self.task_id, self.metrics_sink, query_ids=False)
+        with closing(redshift.get_conn()) as conn:
+            metrics.acquired(conn)
+            metrics.run(conn.cursor(), self.backend.ddl(self.create_sql), table=self.table)
+            conn.commit()
+        metrics.publish(context)
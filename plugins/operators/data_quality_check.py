@@ -1,22 +1,45 @@
 import logging  # Used for logging messages in Airflow
-from airflow.hooks.postgres_hook import PostgresHook  # Connects to Redshift
+from contextlib import closing  # Closes the shared connection when done
 from airflow.models import BaseOperator  # Base class for custom Airflow operators
 from airflow.utils.decorators import apply_defaults  # Allows default values for parameters
 
+from helpers.data_checks import DataCheck, MetricHistory, fuse_checks  # Check definitions and fusing
+from helpers.instrumentation import SqlMetrics  # Records SQL timings
+from helpers.result_cache import tables_in  # Tables a check query reads
+from helpers.backends import RedshiftBackend  # Adapts Redshift-only SQL for a local stand-in
+
 
 class DataQualityOperator(BaseOperator):
     """
     Custom Airflow Operator to perform data quality checks in Amazon Redshift.
 
     Features:
-    - Runs a SQL query to check data quality.
-    - Compares the result against an expected value.
-    - If the check fails, it raises an error to stop the pipeline.
+    - Runs a list of checks (``checks``), each a dict such as
+      ``{"table": "songplays", "metric": "null_count", "column": "user_id",
+      "comparator": "zero_nulls"}`` or ``{"sql": ..., "comparator": "equals", "value": 320}``.
+    - Fuses table metrics on the same table into one aggregate query, so e.g.
+      ``songplays`` is scanned once for its row count, null and duplicate checks.
+    - Runs every query over a single connection.
+    - Reports every failed check together and then raises an error to stop the pipeline.
+    - ``check_sql``/``expected_value`` still work as a single equality check.
+    - Volume and distribution checks that keep working as data grows: null rates,
+      approximate distinct counts, sampled scans, and ``within_stddev``
+      comparisons against the check's own history. Every measured value is stored
+      per run date in ``metric_history_table``.
+    - ``checks`` is templated, so a ``where`` can limit a check to the run window,
+      e.g. ``start_time >= '{{ execution_date }}'``.
+    - With a ``result_cache`` (helpers.result_cache.ResultCache), a query whose
+      tables have the same metadata fingerprint as when it last ran reuses that
+      result, so retries and re-triggers skip scans of unchanged tables.
+    - ``backend`` adapts the check queries to where they run, e.g. LocalBackend
+      counts distinct values exactly on Postgres, which has no APPROXIMATE.
 
     """
 
     # Set UI color in Airflow
     ui_color = '#89DA59'  # Light green color in Airflow UI
+    # Check dicts are rendered, e.g. for run window filters
+    template_fields = ("checks",)
 
     @apply_defaults
     def __init__(self,
@@ -24,6 +47,12 @@ class DataQualityOperator(BaseOperator):
                  check_sql="",  # SQL query to check data quality
                  expected_value=0,  # Expected result of the SQL query
                  describe="",  # Description of the check (for logging)
+                 checks=None,  # List of check dicts (see DataCheck)
+                 metrics_sink=None,  # Optional sink for SQL timings
+                 query_profiler=None,  # Optional QueryProfiler (EXPLAIN each statement, dry runs)
+                 result_cache=None,  # Optional ResultCache for results of unchanged tables
+                 metric_history_table="dq_metric_history",  # Measured values per run (None = keep none)
+                 backend=None,  # RedshiftBackend (default) or LocalBackend (see helpers.backends)
                  *args, **kwargs):
 
         super(DataQualityOperator, self).__init__(*args, **kwargs)
@@ -33,39 +62,94 @@ class DataQualityOperator(BaseOperator):
         self.check_sql = check_sql
         self.expected_value = expected_value
         self.describe = describe
+        self.checks = list(checks or [])
+        self.metrics_sink = metrics_sink
+        self.query_profiler = query_profiler
+        self.result_cache = result_cache
+        self.metric_history_table = metric_history_table
+        self.backend = backend or RedshiftBackend()
+
+    def all_checks(self):
+        """ The configured checks, including the single check_sql/expected_value pair """
+        checks = [DataCheck.from_dict(check) for check in self.checks]
+        if self.check_sql:
+            checks.insert(0, DataCheck(sql=self.check_sql,
+                                       comparator="equals",
+                                       value=self.expected_value,
+                                       describe=self.describe or None))
+        return checks
+
+    def run_check_query(self, cursor, metrics, sql, group):
+        """ First row of a check query, from the result cache if its tables have not changed """
+        tables = [group[0].table] if group[0].table else tables_in(sql)
+        if self.result_cache is None or not tables:
+            metrics.run(cursor, sql, table=group[0].table)
+            return cursor.fetchone()
+
+        fingerprint = self.result_cache.fingerprint(cursor, tables)
+        hit, row = self.result_cache.get(cursor, sql, fingerprint)
+        if hit:
+            self.log.info(f"{', '.join(tables)} unchanged since the last run of this query, using its result")
+            metrics.record(sql, 0.0, None, table=group[0].table, cached=True)
+            return row
+        metrics.run(cursor, sql, table=group[0].table)
+        row = cursor.fetchone()
+        self.result_cache.put(cursor, sql, fingerprint, row)
+        return row
 
     def execute(self, context):
         """
-        Executes the SQL query and checks if the data quality condition is met.
+        Executes the SQL queries and checks if every data quality condition is met.
         """
-        self.log.info(f'Running Data Quality Check: {self.describe}')
-
-        # Connect to Redshift
-        redshift_hook = PostgresHook(self.redshift_conn_id)
-
-        # Log the expected value and SQL query
-        self.log.info("\n".join([
-            f"Checking: {self.describe}",
-            f"Expected value: {self.expected_value}",
-            f"SQL Query: {self.check_sql}"
-        ]))
-
-        # Run the SQL query in Redshift
-        records = redshift_hook.get_records(self.check_sql)
-
-        # Check if the query returned any records
-        if len(records) < 1 or len(records[0]) < 1:
-            raise ValueError(f"Data Quality Check FAILED: No records returned for {self.describe}")
-
-        actual_value = records[0][0]  # Extract the first value from the result
-
-        # Compare actual vs expected value
-        if int(actual_value) != int(self.expected_value):
-            raise ValueError(f"Data Quality Check FAILED for {self.describe}.\n"
-                             f"Expected: {self.expected_value}\n"
-                             f"Actual: {actual_value}")
-
-        # If the check passes, log success
-        self.log.info(f"Data Quality Check PASSED for {self.describe}.\n"
-                      f"Expected: {self.expected_value}\n"
-                      f"Actual: {actual_value}")
+        checks = self.all_checks()
+        queries = [(self.backend.sql(sql), group) for sql, group in fuse_checks(checks)]
+        self.log.info(f'Running {len(checks)} Data Quality Check(s) in {len(queries)} query(ies)')
+
+        # Connect to Redshift once for all the checks
+        from hooks.pooled_postgres_hook import PooledPostgresHook
+        redshift_hook = PooledPostgresHook(postgres_conn_id=self.redshift_conn_id)
+        metrics = SqlMetrics(self.task_id, self.metrics_sink, query_ids=False, profiler=self.query_profiler)
+        failures = []
+        with closing(redshift_hook.get_conn()) as conn:
+            metrics.acquired(conn)
+            cursor = conn.cursor()
+            if self.result_cache is not None:
+                self.result_cache.prepare(cursor)
+            history = MetricHistory(self.metric_history_table) if self.metric_history_table else None
+            if history is not None:
+                history.ensure_table(cursor)
+            conn.commit()
+            for sql, group in queries:
+                self.log.info(f"SQL Query: {sql}")
+                try:
+                    row = self.run_check_query(cursor, metrics, sql, group)
+                    # Keep the cached result even if a later query fails
+                    conn.commit()
+                except Exception as error:
+                    # Keep going so every failure is reported together
+                    conn.rollback()
+                    failures.extend(f"{check.describe}: query failed ({error})" for check in group)
+                    continue
+
+                for position, check in enumerate(group):
+                    actual = row[position] if row is not None and len(row) > position else None
+                    earlier = None
+                    if history is not None:
+                        earlier = history.values(cursor, check, context["ds"]) if check.uses_history else None
+                        history.record(cursor, check, context["ds"], actual)
+                    if check.passes(actual, earlier):
+                        self.log.info(f"Data Quality Check PASSED for {check.describe}.\n"
+                                      f"Expected: {check.expectation(earlier)}\n"
+                                      f"Actual: {actual}")
+                    else:
+                        failures.append(f"{check.describe}: expected {check.expectation(earlier)}, "
+                                        f"actual {actual}")
+                conn.commit()
+
+        metrics.publish(context)
+
+        # Report every failed check at once
+        if failures:
+            raise ValueError("Data Quality Check FAILED:\n" + "\n".join(failures))
+
+        self.log.info(f"All {len(checks)} Data Quality Check(s) PASSED")
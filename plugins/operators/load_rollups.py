@@ -0,0 +1,69 @@
+from contextlib import closing  # Closes the Redshift connection when done
+from airflow.models import BaseOperator  # Base class for custom Airflow operators
+from airflow.utils.decorators import apply_defaults  # Allows default values for parameters
+
+from helpers.instrumentation import SqlMetrics  # Records SQL timings and row counts
+from helpers.rollups import ROLLUPS  # Rollup table definitions
+
+
+class LoadRollupsOperator(BaseOperator):
+    """
+    Custom Airflow Operator that keeps the analytics rollup tables (daily plays by
+    song, hourly plays by level, daily active users) up to date.
+
+    Features:
+    - Only the run window's buckets are recomputed: the window is widened to whole
+      hours/days, its rollup rows are deleted and re-aggregated from the
+      ``songplays`` rows in that range (a range scan on the start_time sort key).
+      Re-running a window gives the same result, and distinct counts stay exact.
+    - Each rollup is refreshed in its own transaction.
+    """
+
+    # Set UI color in Airflow
+    ui_color = '#B0C4DE'
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",  # Connection ID for Redshift (set in Airflow)
+                 rollups=None,  # Names of the rollups to refresh (default: all of ROLLUPS)
+                 source_table="songplays",  # Fact table the rollups aggregate
+                 metrics_sink=None,  # Optional sink for SQL timings and row counts
+                 query_profiler=None,  # Optional QueryProfiler (EXPLAIN each statement, dry runs)
+                 *args, **kwargs):
+
+        super(LoadRollupsOperator, self).__init__(*args, **kwargs)
+
+        unknown = [name for name in (rollups or []) if name not in ROLLUPS]
+        if unknown:
+            raise ValueError(f"Unknown rollup(s): {', '.join(unknown)}")
+
+        # Store parameters for later use
+        self.redshift_conn_id = redshift_conn_id
+        self.rollups = list(rollups or ROLLUPS)
+        self.source_table = source_table
+        self.metrics_sink = metrics_sink
+        self.query_profiler = query_profiler
+
+    def execute(self, context):
+        from hooks.pooled_postgres_hook import PooledPostgresHook
+
+        window_start, window_end = context["execution_date"], context["next_execution_date"]
+        redshift = PooledPostgresHook(postgres_conn_id=self.redshift_conn_id)
+        metrics = SqlMetrics(self.task_id, self.metrics_sink, profiler=self.query_profiler)
+        rows = {}
+        with closing(redshift.get_conn()) as conn:
+            metrics.acquired(conn)
+            cursor = conn.cursor()
+            for name in self.rollups:
+                rollup = ROLLUPS[name]
+                start, end = rollup.bucket_range(window_start, window_end)
+                self.log.info(f'Refreshing {rollup.table} for {start} to {end}...')
+
+                metrics.run(cursor, rollup.create_sql, table=rollup.table)
+                for statement in rollup.refresh_sql(self.source_table, start, end):
+                    rows[rollup.table] = metrics.run(cursor, statement, table=rollup.table)
+                conn.commit()
+                self.log.info(f'{rollup.table}: {rows[rollup.table]} bucket row(s) for the window')
+
+        metrics.publish(context)
+        return rows
@@ -0,0 +1,145 @@
+from contextlib import closing  # Closes the Redshift connection when done
+from datetime import datetime, timedelta
+
+from airflow.models import BaseOperator  # Base class for custom Airflow operators
+from airflow.utils.decorators import apply_defaults  # Allows default values for parameters
+
+from helpers.instrumentation import SqlMetrics  # Records SQL timings and row counts
+
+
+class LoadTimeDimensionOperator(BaseOperator):
+    """
+    Custom Airflow Operator that adds the run window's new timestamps to the
+    ``time`` dimension.
+
+    Features:
+    - Reads only the fact rows in the run window (``execution_date`` to
+      ``next_execution_date``, a range on the start_time sort key), takes the
+      distinct ``start_time`` values and inserts those not in ``time`` yet, so a
+      run costs O(new distinct timestamps) and never creates duplicate keys.
+    - ``calendar_grain`` (``second``, ``minute``, ``hour`` or ``day``) also fills
+      in every bucket of the window at that grain, computed on the worker, so the
+      calendar is complete even for periods without plays.
+    """
+
+    # Set UI color in Airflow
+    ui_color = '#80BD9E'
+
+    # Distinct new timestamps of the window, anti-joined against the dimension
+    insert_sql = """
+        INSERT INTO {table} (start_time, hour, day, week, month, year, day_of_week)
+        SELECT new.start_time,
+               EXTRACT(hour FROM new.start_time),
+               EXTRACT(day FROM new.start_time),
+               EXTRACT(week FROM new.start_time),
+               EXTRACT(month FROM new.start_time),
+               EXTRACT(year FROM new.start_time),
+               EXTRACT(dow FROM new.start_time)
+        FROM (SELECT DISTINCT start_time FROM {source}
+              WHERE start_time >= '{start}' AND start_time < '{end}') new
+        LEFT JOIN {table} existing
+        ON existing.start_time = new.start_time
+           AND existing.start_time >= '{start}' AND existing.start_time < '{end}'
+        WHERE existing.start_time IS NULL;
+    """
+
+    grains = {
+        "second": timedelta(seconds=1),
+        "minute": timedelta(minutes=1),
+        "hour": timedelta(hours=1),
+        "day": timedelta(days=1),
+    }
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",  # Connection ID for Redshift (set in Airflow)
+                 table="time",  # Time dimension table
+                 source_table="songplays",  # Fact table holding start_time
+                 calendar_grain=None,  # Also fill every bucket of the window at this grain
+                 batch_rows=1000,  # Calendar rows per INSERT statement
+                 metrics_sink=None,  # Optional sink for SQL timings and row counts
+                 query_profiler=None,  # Optional QueryProfiler (EXPLAIN each statement, dry runs)
+                 *args, **kwargs):
+
+        super(LoadTimeDimensionOperator, self).__init__(*args, **kwargs)
+
+        if calendar_grain is not None and calendar_grain not in LoadTimeDimensionOperator.grains:
+            raise ValueError(f"Unknown calendar grain: {calendar_grain}")
+
+        # Store parameters for later use
+        self.redshift_conn_id = redshift_conn_id
+        self.table = table
+        self.source_table = source_table
+        self.calendar_grain = calendar_grain
+        self.batch_rows = batch_rows
+        self.metrics_sink = metrics_sink
+        self.query_profiler = query_profiler
+
+    @staticmethod
+    def naive(moment):
+        """ Drop the timezone (the dimension stores UTC without one) """
+        return datetime(*moment.timetuple()[:6])
+
+    @staticmethod
+    def time_row(moment):
+        """ Column values for one timestamp, as EXTRACT computes them (ISO week, Sunday = 0) """
+        return (f"'{moment:%Y-%m-%d %H:%M:%S}'", moment.hour, moment.day, moment.isocalendar()[1],
+                moment.month, moment.year, (moment.weekday() + 1) % 7)
+
+    def calendar(self, start, end):
+        """ Bucket starts at the calendar grain in [start, end) """
+        step = LoadTimeDimensionOperator.grains[self.calendar_grain]
+        moment = start.replace(microsecond=0)
+        if self.calendar_grain in ("minute", "hour", "day"):
+            moment = moment.replace(second=0)
+        if self.calendar_grain in ("hour", "day"):
+            moment = moment.replace(minute=0)
+        if self.calendar_grain == "day":
+            moment = moment.replace(hour=0)
+        if moment < start:
+            moment += step
+        while moment < end:
+            yield moment
+            moment += step
+
+    def fill_calendar(self, cursor, metrics, start, end):
+        """ Insert the window's calendar buckets that are not in the dimension yet """
+        cursor.execute(f"SELECT start_time FROM {self.table} "
+                       f"WHERE start_time >= '{start:%Y-%m-%d %H:%M:%S}' "
+                       f"AND start_time < '{end:%Y-%m-%d %H:%M:%S}'")
+        existing = {self.naive(row[0]) for row in cursor.fetchall()}
+        missing = [moment for moment in self.calendar(start, end)
+                   if self.naive(moment) not in existing]
+
+        inserted = 0
+        for first in range(0, len(missing), self.batch_rows):
+            values = ",\n".join("(" + ", ".join(str(value) for value in self.time_row(moment)) + ")"
+                                for moment in missing[first:first + self.batch_rows])
+            sql = (f"INSERT INTO {self.table} (start_time, hour, day, week, month, year, day_of_week) "
+                   f"VALUES\n{values};")
+            inserted += metrics.run(cursor, sql, table=self.table) or 0
+        return inserted
+
+    def execute(self, context):
+        from hooks.pooled_postgres_hook import PooledPostgresHook
+
+        start, end = context["execution_date"], context["next_execution_date"]
+        redshift = PooledPostgresHook(postgres_conn_id=self.redshift_conn_id)
+        metrics = SqlMetrics(self.task_id, self.metrics_sink, profiler=self.query_profiler)
+        with closing(redshift.get_conn()) as conn:
+            metrics.acquired(conn)
+            cursor = conn.cursor()
+
+            calendar_rows = 0
+            if self.calendar_grain:
+                calendar_rows = self.fill_calendar(cursor, metrics, start, end)
+                self.log.info(f'Added {calendar_rows} {self.calendar_grain} bucket(s) to {self.table}')
+
+            new_rows = metrics.run(cursor, LoadTimeDimensionOperator.insert_sql.format(
+                table=self.table, source=self.source_table,
+                start=f"{start:%Y-%m-%d %H:%M:%S}", end=f"{end:%Y-%m-%d %H:%M:%S}"), table=self.table)
+            conn.commit()
+
+        self.log.info(f'Added {new_rows} new timestamp(s) from {self.source_table} to {self.table}')
+        metrics.publish(context)
+        return {"calendar_rows": calendar_rows, "new_rows": new_rows}
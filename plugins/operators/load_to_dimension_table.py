@@ -1,8 +1,10 @@
 import logging  # Used for logging messages in Airflow
-from airflow.hooks.postgres_hook import PostgresHook  # Connects to Redshift
+from contextlib import closing  # Closes the shared connection when done
 from airflow.models import BaseOperator  # Base class for custom Airflow operators
 from airflow.utils.decorators import apply_defaults  # Allows default values for parameters
 
+from helpers.instrumentation import SqlMetrics  # Records SQL timings and row counts
+
 
 class LoadDimensionOperator(BaseOperator):
     """
@@ -10,11 +12,34 @@ class LoadDimensionOperator(BaseOperator):
 
     Features:
     - Can either append new data or delete (truncate) old data before inserting new records.
-    - Uses PostgresHook to connect to Redshift and execute SQL commands.
+    - Merge (upsert) mode: when ``merge_key`` is set, the delta is staged into a temp
+      table, rows with matching keys are deleted and the delta is inserted, all in one
+      transaction. The SQL statement must return one row per key.
+    - SQL statements are Jinja templates rendered by Airflow, so a merge can read
+      only the run window's rows (e.g. ``ts >= {{ execution_date.int_timestamp * 1000 }}``)
+      and touch only the keys that changed in it.
+    - Several tables in one task: ``tables`` maps ``table_name -> sql_statement`` (or to
+      a dict with ``sql_statement``, ``merge_key`` and ``append_data``). All tables load
+      in one session; ``transaction_grouping`` is ``"single"`` (one commit at the end)
+      or ``"per_table"`` (commit after each table). Every statement's time is logged.
+    - Uses PooledPostgresHook to connect to Redshift and execute SQL commands.
     """
 
     # Set UI color in Airflow
     ui_color = '#80BD9E'  # Greenish color in Airflow UI
+    # The statements are rendered with the task context (run window), nested ones in ``tables`` too
+    template_fields = ("sql_statement", "tables")
+
+    # Statements for merge mode: stage the delta, delete matching keys, insert
+    merge_sql = [
+        "CREATE TEMP TABLE {delta} (LIKE {table});",
+        "INSERT INTO {delta} {sql_statement}",
+        "DELETE FROM {table} USING {delta} WHERE {key_match};",
+        "INSERT INTO {table} SELECT * FROM {delta};",
+        "DROP TABLE {delta};",
+    ]
+
+    transaction_groupings = ("single", "per_table")
 
     @apply_defaults
     def __init__(self,
@@ -22,35 +47,99 @@ class LoadDimensionOperator(BaseOperator):
                  table_name="",  # Name of the dimension table
                  sql_statement="",  # SQL query to insert data
                  append_data=True,  # If True, keep old data; If False, delete old data first
+                 merge_key=None,  # Primary key column(s); if set, upsert instead of append
+                 tables=None,  # Mapping of table_name -> sql_statement (or dict of options)
+                 transaction_grouping="single",  # "single" or "per_table" commits
+                 metrics_sink=None,  # Optional sink for SQL timings and row counts
+                 query_profiler=None,  # Optional QueryProfiler (EXPLAIN each statement, dry runs)
                  *args, **kwargs):
 
         super(LoadDimensionOperator, self).__init__(*args, **kwargs)
 
+        if transaction_grouping not in LoadDimensionOperator.transaction_groupings:
+            raise ValueError(f"Unknown transaction grouping: {transaction_grouping}")
+
         # Store parameters for later use
         self.redshift_conn_id = redshift_conn_id
         self.table_name = table_name
         self.sql_statement = sql_statement
         self.append_data = append_data
+        self.merge_key = merge_key
+        self.tables = tables or {}
+        self.transaction_grouping = transaction_grouping
+        self.metrics_sink = metrics_sink
+        self.query_profiler = query_profiler
+
+    def table_specs(self):
+        """ (table_name, sql_statement, append_data, merge_key) for every table to load """
+        specs = []
+        if self.table_name:
+            specs.append((self.table_name, self.sql_statement, self.append_data, self.merge_key))
+        for table_name, spec in self.tables.items():
+            if isinstance(spec, str):
+                spec = {"sql_statement": spec}
+            specs.append((table_name,
+                          spec["sql_statement"],
+                          spec.get("append_data", self.append_data),
+                          spec.get("merge_key")))
+        return specs
+
+    @staticmethod
+    def load_statements(table_name, sql_statement, append_data, merge_key):
+        """ Build the statements that load one dimension table """
+        if merge_key:
+            keys = [merge_key] if isinstance(merge_key, str) else list(merge_key)
+            delta = f"{table_name}_delta"
+            key_match = " AND ".join(f"{table_name}.{key} = {delta}.{key}" for key in keys)
+            return [statement.format(table=table_name,
+                                     delta=delta,
+                                     key_match=key_match,
+                                     sql_statement=sql_statement)
+                    for statement in LoadDimensionOperator.merge_sql]
+        if append_data:
+            # Just insert new data without deleting old records
+            return [f'INSERT INTO {table_name} {sql_statement}']
+        # First, delete (truncate) old data, then insert new data
+        return [f'TRUNCATE TABLE {table_name};', f'INSERT INTO {table_name} {sql_statement}']
 
     def execute(self, context):
         """
-        Executes the SQL command to load data into the dimension table.
+        Executes the SQL commands to load data into the dimension table(s).
         """
-        self.log.info(f'Loading data into {self.table_name} dimension table...')
+        specs = self.table_specs()
+        self.log.info(f'Loading {len(specs)} dimension table(s) '
+                      f'with {self.transaction_grouping} transaction grouping...')
 
-        # Connect to Redshift
-        redshift = PostgresHook(postgres_conn_id=self.redshift_conn_id)
+        # Connect to Redshift once for every table
+        from hooks.pooled_postgres_hook import PooledPostgresHook
+        redshift = PooledPostgresHook(postgres_conn_id=self.redshift_conn_id)
+        metrics = SqlMetrics(self.task_id, self.metrics_sink, profiler=self.query_profiler)
+        timings = {}
+        with closing(redshift.get_conn()) as conn:
+            metrics.acquired(conn)
+            cursor = conn.cursor()
+            for table_name, sql_statement, append_data, merge_key in specs:
+                if merge_key:
+                    self.log.info(f'Merging delta into {table_name} on {merge_key}...')
+                elif append_data:
+                    self.log.info(f'Appending data to {table_name}...')
+                else:
+                    self.log.info(f'Truncating {table_name} before inserting new data...')
 
-        # Check whether we need to keep (append) old data or delete (truncate) first
-        if self.append_data:
-            # Just insert new data without deleting old records
-            sql_query = f'INSERT INTO {self.table_name} {self.sql_statement}'
-            self.log.info(f'Appending data to {self.table_name}...')
-        else:
-            # First, delete (truncate) old data, then insert new data
-            sql_query = f'TRUNCATE TABLE {self.table_name}; INSERT INTO {self.table_name} {self.sql_statement}'
-            self.log.info(f'Truncating {self.table_name} before inserting new data...')
-
-        # Run the SQL command in Redshift
-        redshift.run(sql_query)
-        self.log.info(f'Successfully loaded data into {self.table_name}')
+                first = len(metrics.records)
+                for statement in self.load_statements(table_name, sql_statement, append_data, merge_key):
+                    metrics.run(cursor, statement, table=table_name)
+                    record = metrics.records[-1]
+                    self.log.info(f"{table_name}: {record['statement']} took {record['seconds']}s "
+                                  f"({record['rows']} row(s))")
+
+                if self.transaction_grouping == "per_table":
+                    conn.commit()
+                timings[table_name] = round(sum(record["seconds"] for record in metrics.records[first:]), 3)
+                self.log.info(f'Successfully loaded data into {table_name} in {timings[table_name]}s')
+
+            if self.transaction_grouping == "single":
+                conn.commit()
+
+        metrics.publish(context)
+        return timings
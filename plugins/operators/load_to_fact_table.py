@@ -1,56 +1,120 @@
-from airflow.hooks.postgres_hook import PostgresHook  # Allows us to connect to Redshift
+from contextlib import closing  # Closes the Redshift connection when done
 from airflow.models import BaseOperator  # Inherits from Airflow's BaseOperator
 from airflow.utils.decorators import apply_defaults  # Helps with initializing parameters
 
+from helpers.instrumentation import SqlMetrics  # Records SQL timings and row counts
+from helpers.song_matching import song_match_key  # Normalized song match key
+
 
 class LoadFactOperator(BaseOperator):
     """
     Airflow Operator to load data into a Fact Table in Redshift.
+
+    The insert is a Jinja template rendered by Airflow: only events whose ``ts``
+    falls in the run window (``execution_date`` to ``next_execution_date``) are
+    joined to the songs, and plays whose ``play_id`` is already among the
+    window's rows of ``songplays`` are skipped, so the load costs O(new events)
+    and retries are idempotent. ``play_id`` hashes the play's start time,
+    session and item in the session.
+
+    Events are matched to songs through ``song_lookup`` on a single hashed key
+    (see helpers.song_matching) instead of comparing title, artist and duration.
+    With ``count_matches`` the matched and unmatched events of the window are
+    counted and recorded with the load's metrics.
     """
     ui_color = '#F98866'  # Color for visualization in Airflow UI
-    # SQL query to insert data into the 'songplays' fact table
+    # The SQL statement is rendered with the task context, so the window shows in the UI
+    template_fields = ("sql_statement", "match_counts_sql")
+    # SQL query to insert the run window's plays into the 'songplays' fact table
     songplay_table_insert = """
-        INSERT INTO songplays (playid, start_time, userid, level, songid, artistid, sessionid, location, user_agent)
+        INSERT INTO songplays (play_id, start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
         SELECT DISTINCT
-            md5(events.ts::TEXT) AS songplay_id,  -- Generates a unique ID for each songplay
-            events.start_time, 
-            events.userid, 
-            events.level, 
-            songs.song_id, 
-            songs.artist_id, 
-            events.sessionid, 
-            events.location, 
-            events.useragent
-        FROM 
-            (SELECT TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second' AS start_time, *
-             FROM staging_events
-             WHERE page='NextSong') events
-        LEFT JOIN staging_songs songs
-        ON events.song = songs.title
-           AND events.artist = songs.artist_name
-           AND events.length = songs.duration
-        WHERE (songs.song_id IS NOT NULL OR songs.artist_id IS NOT NULL)
-        AND events.userid IS NOT NULL;
+            events.play_id,  -- Unique ID for each songplay
+            events.start_time,
+            events.user_id,
+            events.level,
+            songs.song_id,
+            songs.artist_id,
+            events.session_id,
+            events.location,
+            events.user_agent
+        FROM
+            -- A session can play two songs in the same millisecond; item_in_session tells them apart
+            (SELECT MD5(start_time::VARCHAR || '|' || session_id::VARCHAR || '|' || item_in_session::VARCHAR) AS play_id,
+                    """ + song_match_key("song", "artist", "length") + """ AS match_key, *
+             FROM (SELECT TIMESTAMP 'epoch' + ts/1000 * INTERVAL '1 second' AS start_time, *
+                   FROM staging_events
+                   WHERE page='NextSong'
+                     -- Run window, in epoch milliseconds like staging_events.ts
+                     AND ts >= {{ execution_date.int_timestamp * 1000 }}
+                     AND ts < {{ next_execution_date.int_timestamp * 1000 }}) windowed) events
+        JOIN song_lookup songs
+        ON songs.match_key = events.match_key
+        -- Anti-join: skip plays loaded by an earlier try or run. Only the window's plays can
+        -- match, so the range on the start_time sort key keeps it from scanning all of songplays
+        LEFT JOIN songplays existing
+        ON existing.play_id = events.play_id
+        AND existing.start_time >= TIMESTAMP 'epoch' + {{ execution_date.int_timestamp }} * INTERVAL '1 second'
+        AND existing.start_time < TIMESTAMP 'epoch' + {{ next_execution_date.int_timestamp }} * INTERVAL '1 second'
+        WHERE events.user_id IS NOT NULL
+        AND existing.play_id IS NULL;
+    """
+
+    # Events of the run window, and how many of them match a song
+    match_counts_sql = """
+        SELECT COUNT(*), COUNT(songs.match_key)
+        FROM (SELECT """ + song_match_key("song", "artist", "length") + """ AS match_key
+              FROM staging_events
+              WHERE page='NextSong' AND user_id IS NOT NULL
+                AND ts >= {{ execution_date.int_timestamp * 1000 }}
+                AND ts < {{ next_execution_date.int_timestamp * 1000 }}) events
+        LEFT JOIN song_lookup songs
+        ON songs.match_key = events.match_key;
     """
 
     @apply_defaults
-    def __init__(self, redshift_conn_id="", *args, **kwargs):
+    def __init__(self, redshift_conn_id="", sql_statement=None, count_matches=True, metrics_sink=None,
+                 query_profiler=None, *args, **kwargs):
         """
         Initialize the LoadFactOperator.
 
         :param redshift_conn_id: The connection ID for Redshift in Airflow.
+        :param sql_statement: Optional templated insert; defaults to songplay_table_insert.
+        :param count_matches: Count matched and unmatched events of the window.
+        :param metrics_sink: Optional sink for SQL timings and row counts.
+        :param query_profiler: Optional QueryProfiler that EXPLAINs the insert first.
         """
         super(LoadFactOperator, self).__init__(*args, **kwargs)
         self.redshift_conn_id = redshift_conn_id
+        self.sql_statement = sql_statement or LoadFactOperator.songplay_table_insert
+        self.count_matches = count_matches
+        self.match_counts_sql = LoadFactOperator.match_counts_sql
+        self.metrics_sink = metrics_sink
+        self.query_profiler = query_profiler
 
     def execute(self, context):
         """
         Execute the operator: Connect to Redshift and run the SQL query.
         """
         self.log.info('Connecting to Redshift...')
-        redshift = PostgresHook(postgres_conn_id=self.redshift_conn_id)
+        from hooks.pooled_postgres_hook import PooledPostgresHook
+        redshift = PooledPostgresHook(postgres_conn_id=self.redshift_conn_id)
 
         self.log.info('Loading data into the fact table (songplays)...')
-        redshift.run(LoadFactOperator.songplay_table_insert)
+        self.log.info(f'Rendered insert: {self.sql_statement}')
+        metrics = SqlMetrics(self.task_id, self.metrics_sink, profiler=self.query_profiler)
+        with closing(redshift.get_conn()) as conn:
+            metrics.acquired(conn)
+            cursor = conn.cursor()
+            rows = metrics.run(cursor, self.sql_statement, table="songplays")
+            if self.count_matches:
+                cursor.execute(self.match_counts_sql)
+                events, matched = cursor.fetchone()
+                self.log.info(f'{matched} of {events} event(s) in the window matched a song, '
+                              f'{events - matched} did not')
+                metrics.record(self.match_counts_sql, 0.0, events, table="songplays",
+                               matched=matched, unmatched=events - matched)
+            conn.commit()
+        metrics.publish(context)
 
-        self.log.info('Fact table load complete!')
+        self.log.info(f'Fact table load complete! {rows} row(s) inserted')
@@ -0,0 +1,94 @@
+from contextlib import closing  # Closes the Redshift connection when done
+from airflow.models import BaseOperator  # Base class for custom Airflow operators
+from airflow.utils.decorators import apply_defaults  # Allows default values for parameters
+
+from helpers.instrumentation import SqlMetrics  # Records SQL timings and row counts
+from helpers.star_schema import STAR_SCHEMA_LAYOUTS, deep_copy_sql  # Target layouts
+
+
+class RebuildTableLayoutOperator(BaseOperator):
+    """
+    Custom Airflow Operator that migrates existing tables to their distribution and
+    sort key layout by deep copy.
+
+    Features:
+    - Reads each table's current layout from ``svv_table_info`` and skips tables
+      that already have the target DISTSTYLE/DISTKEY and first sort key.
+    - Rebuilds the others in place (CREATE ... LIKE with the new keys, INSERT SELECT,
+      swap names), one transaction per table.
+    - Checks row skew (``skew_rows``) after each rebuild and fails if it is above
+      ``max_skew``.
+    """
+
+    # Set UI color in Airflow
+    ui_color = '#D2B48C'
+
+    # Current layout and skew of a table
+    table_info_sql = """
+        SELECT diststyle, sortkey1, skew_rows
+        FROM svv_table_info
+        WHERE "table" = '{}';
+    """
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",  # Connection ID for Redshift (set in Airflow)
+                 layouts=None,  # Mapping of table -> TableLayout (defaults to the star schema)
+                 max_skew=None,  # Fail if skew_rows is above this after a rebuild
+                 metrics_sink=None,  # Optional sink for SQL timings and row counts
+                 *args, **kwargs):
+
+        super(RebuildTableLayoutOperator, self).__init__(*args, **kwargs)
+
+        # Store parameters for later use
+        self.redshift_conn_id = redshift_conn_id
+        self.layouts = layouts or STAR_SCHEMA_LAYOUTS
+        self.max_skew = max_skew
+        self.metrics_sink = metrics_sink
+
+    def table_info(self, cursor, table):
+        cursor.execute(RebuildTableLayoutOperator.table_info_sql.format(table))
+        return cursor.fetchone()
+
+    def execute(self, context):
+        """
+        Rebuilds every table whose layout differs from the target layout.
+        """
+        from hooks.pooled_postgres_hook import PooledPostgresHook
+        redshift = PooledPostgresHook(postgres_conn_id=self.redshift_conn_id)
+        metrics = SqlMetrics(self.task_id, self.metrics_sink)
+        skews = {}
+        too_skewed = []
+        with closing(redshift.get_conn()) as conn:
+            metrics.acquired(conn)
+            cursor = conn.cursor()
+            for table, layout in self.layouts.items():
+                info = self.table_info(cursor, table)
+                if info is None:
+                    self.log.info(f'{table} does not exist, skipping')
+                    continue
+
+                diststyle, sortkey1, skew = info
+                skew = float(skew) if skew is not None else None
+                first_sortkey = layout.sortkey[0] if layout.sortkey else None
+                if diststyle == layout.svv_diststyle() and sortkey1 == first_sortkey:
+                    self.log.info(f'{table} already has {layout.clause()}, skipping')
+                    skews[table] = skew
+                    continue
+
+                self.log.info(f'Rebuilding {table} from {diststyle}/{sortkey1} to {layout.clause()}...')
+                for statement in deep_copy_sql(table, layout):
+                    metrics.run(cursor, statement, table=table)
+                conn.commit()
+
+                _, _, skew = self.table_info(cursor, table)
+                skew = float(skew) if skew is not None else None
+                skews[table] = skew
+                self.log.info(f'Rebuilt {table}; row skew is now {skew}')
+                if self.max_skew is not None and skew is not None and skew > self.max_skew:
+                    too_skewed.append(f'{table} ({skew})')
+
+        metrics.publish(context)
+        if too_skewed:
+            raise ValueError(f'Row skew above {self.max_skew} after rebuild: {", ".join(too_skewed)}')
+        return skews
@@ -1,29 +1,80 @@
-from airflow.hooks.postgres_hook import PostgresHook  # Connects to Redshift
+from contextlib import closing, contextmanager  # Closes the Redshift connection when done
+
 from airflow.models import BaseOperator  # Base class for all Airflow Operators
 from airflow.utils.decorators import apply_defaults  # Handles default arguments
-from airflow.contrib.hooks.aws_hook import AwsHook  # Connects to AWS for credentials
+
+from helpers.watermark import PartitionWatermark  # Tracks already-loaded partitions
+from helpers.partitions import partition_keys  # Renders s3_key per day of the run window
+from helpers.backends import RedshiftBackend  # S3 and Redshift, or a local stand-in
+from helpers import manifest  # Builds balanced COPY manifests
+from helpers.instrumentation import SqlMetrics  # Records SQL timings and row counts
+from helpers.copy_slots import CopySlots  # Limits concurrent COPYs warehouse-wide
+from helpers.load_errors import LoadErrors  # Reads the rows a COPY rejected
 
 
 class StageToRedshiftOperator(BaseOperator):
     """
     Custom Airflow Operator to load JSON data from S3 into Amazon Redshift.
     This operator uses Redshift's COPY command to efficiently load data.
+
+    Features:
+    - Full mode (default): clears the staging table and COPYs the whole S3 prefix.
+    - Incremental mode: COPYs only the S3 partitions for the run's date window
+      (``s3_key`` is formatted per day, e.g. ``log_data/{execution_date.year}/{ds}-events.json``)
+      and records each loaded partition in a watermark table, so re-runs and
+      backfills skip partitions that are already loaded.
+    - ``reload_where`` (incremental mode) reprocesses the run's partitions even if
+      they were loaded before, e.g. when late files arrived: the rows matching the
+      condition (the run window) are deleted and the partitions COPYed again in
+      one transaction, so other days in the table are left alone.
+    - Manifest mode: lists the prefix itself, optionally bundles small files into
+      balanced groups (one per slice), COPYs through a manifest and reports the
+      file count, bytes and slice skew of each load. Only uncompressed JSON and
+      CSV files can be bundled.
+    - ``compression="GZIP"`` loads compressed files, e.g. the parts written by
+      CompactJsonOperator.
+    - ``data_format`` is ``"json"`` (default), ``"csv"`` or ``"parquet"``; CSV and
+      Parquet files (e.g. from ConvertJsonOperator) are loaded by column position.
+    - ``copy_slots=N`` caps the COPYs running at once across all workers and DAG
+      runs through a lock table in Redshift; an Airflow ``pool`` can be used on top.
+      Time spent queued for the pool and waiting for a slot is recorded as metrics.
+    - ``manifest_url`` COPYs a manifest written by another task instead of
+      ``s3_key`` (e.g. the clean manifest from ValidateJsonOperator); if it renders
+      empty, there is nothing to load. In incremental mode the manifest takes the
+      place of the run's partitions in the watermark table.
+    - ``max_errors`` adds ``MAXERROR``; the rows a COPY skipped or failed on are
+      read back from ``stl_load_errors`` and logged with their file and line.
+    - ``retry_failed_files`` (full mode): when the COPY fails, the files named in
+      ``stl_load_errors`` are set aside and the rest is loaded and committed, with
+      each file recorded in the watermark table for the run. The failed files are
+      then COPYed again with ``MAXERROR retry_max_errors``, or the task fails, and
+      an Airflow retry reloads only the files not recorded yet instead of clearing
+      the table and starting over.
+    - ``backend`` (default RedshiftBackend) carries out the storage and COPY side;
+      ``LocalBackend`` runs the same loads from a local directory into Postgres.
     """
     # Set UI color for the task in Airflow DAGs
     ui_color = '#358140'
     # Template fields allow dynamic values using Airflow's templating engine
-    template_fields = ("s3_key",)
+    template_fields = ("s3_key", "manifest_url", "reload_where")
     # SQL COPY command to load data from S3 into Redshift
     copy_sql = """
         COPY {}  -- Target table in Redshift
         FROM '{}'  -- S3 file path
         ACCESS_KEY_ID '{}'  -- AWS credentials
         SECRET_ACCESS_KEY '{}'
-        FORMAT AS JSON '{}'  -- Define JSON structure
-        TIMEFORMAT AS 'epochmillisecs'  -- Convert timestamp format
+        {}  -- File format (JSON structure, CSV or PARQUET) and conversions
         region 'us-west-2'  -- AWS region where S3 bucket is stored
+        {}  -- Extra COPY options (e.g. MANIFEST, GZIP)
     """
 
+    # COPY format clause per data format; Parquet takes no conversion options
+    format_sql = {
+        "json": "FORMAT AS JSON '{}' TIMEFORMAT AS 'epochmillisecs'",
+        "csv": "FORMAT AS CSV TIMEFORMAT AS 'epochmillisecs'",
+        "parquet": "FORMAT AS PARQUET",
+    }
+
     @apply_defaults
     def __init__(self,
                  redshift_conn_id="",  # Redshift connection ID (Airflow)
@@ -32,9 +83,36 @@ class StageToRedshiftOperator(BaseOperator):
                  s3_bucket="",  # S3 bucket name
                  s3_key="",  # S3 key (file path)
                  JSONPaths="",  # JSON Path file for schema
+                 incremental=False,  # If True, only load the run's partitions
+                 reload_where=None,  # Rows of the run's partitions, deleted and reloaded (incremental)
+                 watermark_table="stage_watermarks",  # Table tracking loaded partitions
+                 use_manifest=False,  # If True, list the prefix and COPY via a manifest
+                 manifest_prefix="manifests",  # S3 prefix for manifests and bundles
+                 group_small_files=False,  # If True, bundle small files per slice
+                 small_file_bytes=1024 * 1024,  # Files below this size get bundled
+                 num_slices=None,  # Cluster slices (from the backend, i.e. stv_slices, if None)
+                 object_store=None,  # Optional store override (e.g. LocalObjectStore)
+                 compression=None,  # Compression of the source files (e.g. GZIP)
+                 metrics_sink=None,  # Optional sink for SQL timings and row counts
+                 query_profiler=None,  # Optional QueryProfiler (EXPLAIN each statement, dry runs)
+                 data_format="json",  # "json", "csv" or "parquet"
+                 copy_slots=None,  # Max COPYs running at once in Redshift (None = no limit)
+                 copy_slot_table="copy_slots",  # Lock table holding the COPY slots
+                 manifest_url=None,  # Prebuilt COPY manifest to load instead of s3_key
+                 max_errors=None,  # MAXERROR for the COPY (None = fail on the first bad row)
+                 retry_failed_files=False,  # If True, set failed files aside and load the rest
+                 retry_max_errors=None,  # MAXERROR for the second COPY of the failed files
+                 inspect_load_errors=True,  # Read stl_load_errors (Redshift only)
+                 backend=None,  # RedshiftBackend (default) or LocalBackend (see helpers.backends)
                  *args, **kwargs):
         super(StageToRedshiftOperator, self).__init__(*args, **kwargs)
 
+        if data_format not in StageToRedshiftOperator.format_sql:
+            raise ValueError(f"Unknown data format: {data_format}")
+        # Bundles are the files' bytes joined by newlines: only plain text survives that
+        if group_small_files and (compression or data_format == "parquet"):
+            raise ValueError(f"group_small_files cannot bundle {compression or data_format} files")
+
         # Store parameters for later use
         self.redshift_conn_id = redshift_conn_id
         self.aws_credentials_id = aws_credentials_id
@@ -42,42 +120,364 @@ class StageToRedshiftOperator(BaseOperator):
         self.s3_bucket = s3_bucket
         self.s3_key = s3_key
         self.JSONPaths = JSONPaths
+        self.incremental = incremental
+        self.reload_where = reload_where
+        self.watermark_table = watermark_table
+        self.use_manifest = use_manifest
+        self.manifest_prefix = manifest_prefix
+        self.group_small_files = group_small_files
+        self.small_file_bytes = small_file_bytes
+        self.num_slices = num_slices
+        self.object_store = object_store
+        self.compression = compression
+        self.metrics_sink = metrics_sink
+        self.query_profiler = query_profiler
+        self.data_format = data_format
+        self.copy_slots = copy_slots
+        self.copy_slot_table = copy_slot_table
+        self.manifest_url = manifest_url
+        self.max_errors = max_errors
+        self.retry_failed_files = retry_failed_files
+        self.retry_max_errors = retry_max_errors
+        self.inspect_load_errors = inspect_load_errors
+        self.backend = backend or RedshiftBackend()
+
+    def json_path(self):
+        """ Return the JSON Paths file location, or 'auto' for auto schema detection """
+        if self.JSONPaths == "auto":
+            return self.JSONPaths
+        return f"s3://{self.s3_bucket}/{self.JSONPaths}"
+
+    def partition_keys(self, context):
+        """ Render ``s3_key`` once per day of the run's logical date window """
+        return partition_keys(self.s3_key, context)
+
+    def format_clause(self):
+        """ The COPY format clause for the configured data format """
+        return StageToRedshiftOperator.format_sql[self.data_format].format(self.json_path())
+
+    def copy_options(self, use_manifest, max_errors=None):
+        """ Extra COPY options for the manifest, compression and error settings """
+        options = []
+        if use_manifest:
+            options.append("MANIFEST")
+        if self.compression:
+            options.append(self.compression.upper())
+        max_errors = self.max_errors if max_errors is None else max_errors
+        if max_errors:
+            options.append(f"MAXERROR {int(max_errors)}")
+        return " ".join(options)
+
+    def slice_count(self, redshift):
+        """ Number of slices in the cluster, used to balance manifest files """
+        if self.num_slices:
+            return self.num_slices
+        return self.backend.slice_count(redshift)
+
+    def store(self):
+        """ Where the source files live: the override, else the backend's store for the bucket """
+        return self.object_store or self.backend.object_store(self.s3_bucket, self.aws_credentials_id)
+
+    def copy_statement(self, redshift, credentials, rendered_key, context):
+        """
+        Build the COPY for one S3 location.
+
+        Returns the SQL and the load statistics (None unless a manifest is built).
+        """
+        if self.manifest_url is not None:
+            if not self.manifest_url:
+                return None, None
+            return StageToRedshiftOperator.copy_sql.format(
+                self.table,
+                self.manifest_url,
+                credentials.access_key,
+                credentials.secret_key,
+                self.format_clause(),
+                self.copy_options(use_manifest=True)
+            ), None
+
+        if not self.use_manifest:
+            s3_path = f"s3://{self.s3_bucket}/{rendered_key}"
+            return StageToRedshiftOperator.copy_sql.format(
+                self.table,
+                s3_path,
+                credentials.access_key,
+                credentials.secret_key,
+                self.format_clause(),
+                self.copy_options(use_manifest=False)
+            ), None
+
+        # List the prefix ourselves instead of letting Redshift do it
+        store = self.store()
+        objects = store.list_objects(rendered_key)
+        if not objects:
+            return None, {"files": 0, "bytes": 0, "slices": 0, "skew": 0.0}
+
+        num_slices = self.slice_count(redshift)
+        run_prefix = f"{self.manifest_prefix}/{self.table}/{context['ds_nodash']}/{rendered_key.strip('/')}"
+        if self.group_small_files:
+            objects = manifest.bundle_small_objects(
+                store, objects, self.small_file_bytes, num_slices, f"{run_prefix}/bundles")
+
+        stats = manifest.load_stats(objects, num_slices)
+        manifest_url = manifest.write_manifest(store, f"{run_prefix}/copy.manifest", objects)
+        return StageToRedshiftOperator.copy_sql.format(
+            self.table,
+            manifest_url,
+            credentials.access_key,
+            credentials.secret_key,
+            self.format_clause(),
+            self.copy_options(use_manifest=True)
+        ), stats
+
+    def get_credentials(self):
+        """ AWS credentials for the COPY, from the backend """
+        return self.backend.credentials(self.aws_credentials_id)
+
+    def checked_copy(self, conn, cursor, metrics, formatted_sql, rendered_key):
+        """
+        Run the COPY through the backend, which reports the rows it rejected
+        (on Redshift from stl_load_errors).
+
+        Skipped rows (under MAXERROR) are logged and recorded as LOAD_ERRORS. If the
+        COPY fails, the transaction is rolled back, the errors are logged and the
+        exception is raised again with the errors attached as ``load_errors``.
+        """
+        try:
+            skipped = self.backend.copy(self, cursor, metrics, formatted_sql, inspect=self.inspect_load_errors)
+        except Exception as error:
+            conn.rollback()
+            if getattr(error, "load_errors", None):
+                self.log.error(f"COPY of {rendered_key} failed:\n{LoadErrors.describe(error.load_errors)}")
+            raise
+
+        if skipped:
+            self.log.warning(f"COPY of {rendered_key} skipped {len(skipped)} row(s):\n"
+                             f"{LoadErrors.describe(skipped)}")
+            metrics.record("LOAD_ERRORS", 0.0, len(skipped), table=self.table,
+                           files=sorted(LoadErrors.files(skipped)))
+        return skipped
+
+    def record_queue_wait(self, context, metrics):
+        """ Record how long the task sat queued (e.g. waiting for its Airflow pool) """
+        task_instance = context.get("ti") or context.get("task_instance")
+        queued = getattr(task_instance, "queued_dttm", None)
+        started = getattr(task_instance, "start_date", None)
+        if queued is not None and started is not None:
+            metrics.record("QUEUE_WAIT", max((started - queued).total_seconds(), 0.0), None,
+                           table=self.table, pool=getattr(task_instance, "pool", None))
+
+    @contextmanager
+    def copy_slot(self, redshift, context, metrics, rendered_key):
+        """ Hold one of the warehouse-wide COPY slots (if limited) around a COPY """
+        if not self.copy_slots:
+            yield
+            return
+
+        slots = CopySlots(redshift, self.copy_slots, self.copy_slot_table)
+        slots.ensure_table()
+        holder = f"{self.task_id}:{context.get('ts')}:{rendered_key}"
+        with slots.slot(holder) as waited:
+            self.log.info(f"Got a COPY slot after {waited:.1f}s")
+            metrics.record("COPY_SLOT_WAIT", waited, None, table=self.table)
+            yield
+
+    def log_stats(self, rendered_key, stats):
+        if stats is not None:
+            self.log.info(f"Load of {rendered_key}: {stats['files']} file(s), "
+                          f"{stats['bytes']} bytes over {stats['slices']} slices, "
+                          f"skew {stats['skew']}")
 
     def execute(self, context):
         """ Executes the COPY command to load data into Redshift """
+        if self.query_profiler is not None and self.query_profiler.dry_run:
+            self.log.info(f"Dry run: not staging {self.s3_key} into {self.table}")
+            return None
 
         # Get AWS credentials from Airflow
         self.log.info("Fetching AWS credentials...")
-        aws_hook = AwsHook(self.aws_credentials_id)
-        credentials = aws_hook.get_credentials()
+        credentials = self.get_credentials()
 
         # Connect to Redshift
         self.log.info("Connecting to Redshift...")
-        redshift = PostgresHook(postgres_conn_id=self.redshift_conn_id)
+        # Imported here rather than at module level to keep DAG parsing fast
+        from hooks.pooled_postgres_hook import PooledPostgresHook
+        redshift = PooledPostgresHook(postgres_conn_id=self.redshift_conn_id)
 
-        # Clear existing data in the target table (if needed)
-        self.log.info(f"Clearing data from Redshift table {self.table}")
-        redshift.run(f"DELETE FROM {self.table}")
+        metrics = SqlMetrics(self.task_id, self.metrics_sink, profiler=self.query_profiler)
+        self.record_queue_wait(context, metrics)
+        if self.incremental:
+            loaded = self.stage_partitions(redshift, credentials, context, metrics)
+            metrics.publish(context)
+            return loaded
 
         # Format S3 path dynamically based on execution context
         rendered_key = self.s3_key.format(**context)  # Handles templated values
-        s3_path = f"s3://{self.s3_bucket}/{rendered_key}"  # Full S3 path
-        json_path = f"s3://{self.s3_bucket}/{self.JSONPaths}"  # JSON Paths file
+        if self.retry_failed_files and self.manifest_url is None:
+            with self.copy_slot(redshift, context, metrics, rendered_key):
+                loaded = self.stage_files(redshift, credentials, rendered_key, context, metrics)
+            metrics.publish(context)
+            return loaded
+
+        formatted_sql, stats = self.copy_statement(redshift, credentials, rendered_key, context)
+
+        with self.copy_slot(redshift, context, metrics, rendered_key), \
+                closing(redshift.get_conn()) as conn:
+            metrics.acquired(conn)
+            cursor = conn.cursor()
+
+            # Clear existing data in the target table (if needed)
+            self.log.info(f"Clearing data from Redshift table {self.table}")
+            metrics.run(cursor, f"DELETE FROM {self.table}", table=self.table)
+
+            if formatted_sql is None:
+                self.log.info(f"No files found under {rendered_key}, nothing to stage")
+            else:
+                # Log and execute the COPY command
+                self.log.info(f"Running COPY command: {formatted_sql}")
+                self.checked_copy(conn, cursor, metrics, formatted_sql, rendered_key)
+                self.log_stats(rendered_key, stats)
+            conn.commit()
+
+        metrics.publish(context)
+        self.log.info("Data successfully staged to Redshift!")
+        return stats
+
+    def stage_partitions(self, redshift, credentials, context, metrics):
+        """
+        COPY only the partitions of the run window that are not loaded yet, or
+        with ``reload_where`` all of them again, replacing the window's rows.
+        """
+        watermark = PartitionWatermark(redshift, self.watermark_table)
+        watermark.ensure_table()
+        reload = bool(self.reload_where)
+
+        loaded = {}
+        with closing(redshift.get_conn()) as conn:
+            metrics.acquired(conn)
+            cursor = conn.cursor()
+            if reload:
+                self.log.info(f"Replacing the rows of {self.table} where {self.reload_where}")
+                metrics.run(cursor, f"DELETE FROM {self.table} WHERE {self.reload_where}", table=self.table)
 
-        # Handle case where JSON Path is 'auto' for song data
-        if rendered_key == "song_data":
-            json_path = self.JSONPaths  # Set to 'auto' for auto schema detection
+            # A prebuilt manifest already covers the run's partitions
+            by_manifest = self.manifest_url is not None
+            for rendered_key in [self.manifest_url] if by_manifest else self.partition_keys(context):
+                s3_path = rendered_key if by_manifest else f"s3://{self.s3_bucket}/{rendered_key}"
+                seen = watermark.is_loaded(self.table, s3_path)
 
-        # Format final SQL COPY command
+                # Skip partitions that a previous run already loaded
+                if seen and not reload:
+                    self.log.info(f"Partition {s3_path} already loaded into {self.table}, skipping")
+                    continue
+
+                formatted_sql, stats = self.copy_statement(redshift, credentials, rendered_key, context)
+                if formatted_sql is None:
+                    self.log.info(f"No files found under {rendered_key}, nothing to stage")
+                    continue
+
+                # COPY and watermark commit together, so a failed COPY is retried next time
+                self.log.info(f"Running COPY command: {formatted_sql}")
+                with self.copy_slot(redshift, context, metrics, rendered_key):
+                    self.checked_copy(conn, cursor, metrics, formatted_sql, rendered_key)
+                    if not seen:
+                        cursor.execute(watermark.mark_loaded_sql(self.table, s3_path))
+                    if not reload:
+                        conn.commit()
+                self.log_stats(rendered_key, stats)
+                loaded[rendered_key] = stats
+
+            # A reload replaces the window's rows all at once
+            if reload:
+                conn.commit()
+
+        self.log.info(f"Staged {len(loaded)} {'reloaded' if reload else 'new'} partition(s) into {self.table}")
+        return loaded
+
+    def copy_files(self, conn, cursor, metrics, credentials, store, objects, manifest_key,
+                   clear, max_errors=None):
+        """ COPY a list of files through a manifest, clearing the table first if asked """
+        if clear:
+            self.log.info(f"Clearing data from Redshift table {self.table}")
+            metrics.run(cursor, f"DELETE FROM {self.table}", table=self.table)
+        if not objects:
+            return []
+        manifest_url = manifest.write_manifest(store, manifest_key, objects)
         formatted_sql = StageToRedshiftOperator.copy_sql.format(
             self.table,
-            s3_path,
+            manifest_url,
             credentials.access_key,
             credentials.secret_key,
-            json_path
+            self.format_clause(),
+            self.copy_options(use_manifest=True, max_errors=max_errors)
         )
+        self.log.info(f"Running COPY of {len(objects)} file(s): {formatted_sql}")
+        return self.checked_copy(conn, cursor, metrics, formatted_sql, manifest_key)
 
-        # Log and execute the COPY command
-        self.log.info(f"Running COPY command: {formatted_sql}")
-        redshift.run(formatted_sql)
-        self.log.info("Data successfully staged to Redshift!")
+    def stage_files(self, redshift, credentials, rendered_key, context, metrics):
+        """
+        Full-mode load that keeps the files that loaded when others fail.
+
+        Every file committed is recorded in the watermark table under
+        ``<table>@<ts_nodash>``, so a retry of the same run skips it (and the
+        DELETE). The records are dropped once the whole prefix is in, so clearing
+        a successful task reloads from scratch as usual.
+        """
+        store = self.store()
+        watermark = PartitionWatermark(redshift, self.watermark_table)
+        watermark.ensure_table()
+        run = f"{self.table}@{context['ts_nodash']}"
+        done = watermark.loaded_paths(run)
+        pending = [obj for obj in store.list_objects(rendered_key) if store.url(obj.key) not in done]
+        if done:
+            self.log.info(f"{len(done)} file(s) already loaded by an earlier try, "
+                          f"{len(pending)} left")
+        run_prefix = f"{self.manifest_prefix}/{self.table}/{context['ds_nodash']}/{rendered_key.strip('/')}"
+
+        clear = not done  # Only the run's first commit clears the table
+        failed, failed_errors = [], []
+        attempt = 0
+        with closing(redshift.get_conn()) as conn:
+            metrics.acquired(conn)
+            cursor = conn.cursor()
+
+            # Set aside the files each failed COPY names until the rest loads
+            while pending or clear:
+                attempt += 1
+                try:
+                    self.copy_files(conn, cursor, metrics, credentials, store, pending,
+                                    f"{run_prefix}/attempt-{attempt}.manifest", clear)
+                except Exception as error:
+                    bad = LoadErrors.files(getattr(error, "load_errors", []))
+                    newly_failed = [obj for obj in pending if store.url(obj.key) in bad]
+                    if not newly_failed:
+                        raise  # Not a problem with particular files
+                    self.log.warning(f"Setting aside {len(newly_failed)} file(s) that failed to load")
+                    failed.extend(newly_failed)
+                    failed_errors.extend(error.load_errors)
+                    pending = [obj for obj in pending if store.url(obj.key) not in bad]
+                    continue
+                if pending:
+                    cursor.execute(watermark.mark_all_loaded_sql(run, [store.url(obj.key) for obj in pending]))
+                conn.commit()
+                self.log.info(f"Loaded and committed {len(pending)} file(s) into {self.table}")
+                pending, clear = [], False
+
+            if failed:
+                if self.retry_max_errors is None:
+                    raise ValueError(f"{len(failed)} file(s) failed to load into {self.table}; "
+                                     f"the other files are committed and a retry only reloads these:\n"
+                                     f"{LoadErrors.describe(failed_errors)}")
+                self.log.info(f"Retrying {len(failed)} failed file(s) with MAXERROR {self.retry_max_errors}")
+                self.copy_files(conn, cursor, metrics, credentials, store, failed,
+                                f"{run_prefix}/retry.manifest", False, self.retry_max_errors)
+                cursor.execute(watermark.mark_all_loaded_sql(run, [store.url(obj.key) for obj in failed]))
+                conn.commit()
+
+            # The whole prefix is in; a later rerun of this run starts from scratch
+            cursor.execute(watermark.forget_sql(run))
+            conn.commit()
+
+        self.log.info(f"Staged {rendered_key} into {self.table} in {attempt} COPY attempt(s), "
+                      f"{len(failed)} file(s) retried")
+        return {"attempts": attempt, "retried_files": [obj.key for obj in failed]}
@@ -0,0 +1,132 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from airflow.models import BaseOperator  # Base class for all Airflow Operators
+from airflow.utils.decorators import apply_defaults  # Handles default arguments
+
+from helpers import manifest  # Builds COPY manifests
+from helpers.json_validation import column_rules, validate_object  # Per-record schema checks
+from helpers.partitions import partition_keys  # Renders source_prefix per day of the run window
+from helpers.backends import RedshiftBackend  # S3, or a local directory standing in for it
+
+
+def _validate(arguments):
+    """ Process pool entry point: validate one object """
+    return validate_object(*arguments)
+
+
+class ValidateJsonOperator(BaseOperator):
+    """
+    Custom Airflow Operator that checks raw JSON files against a staging table's
+    schema before they are COPYed, and writes a manifest of the clean data.
+
+    Features:
+    - Only the run's files are read: ``source_prefix`` is rendered per day of the
+      run window like StageToRedshiftOperator's ``s3_key`` (e.g.
+      ``log_data/{execution_date.year}/{ds}-events.json``), so the work follows
+      the day's data rather than the whole history.
+    - Column types and VARCHAR sizes come from the staging table's CREATE TABLE
+      statement (e.g. ``CREATE_staging_events_TABLE_SQL``); ``json_fields`` maps
+      columns to JSON fields like a JSONPaths file.
+    - Files are validated in parallel by a process pool, each one streamed, so
+      memory per worker stays constant.
+    - Files with no bad records are loaded as they are. For the others, the clean
+      records are rewritten under ``clean_prefix`` and the bad ones, with their
+      errors, go to ``quarantine_prefix``.
+    - Writes a COPY manifest of the files to load and returns its URL, for
+      ``StageToRedshiftOperator(manifest_url=...)``; returns "" when there is
+      nothing to load.
+    - Fails if more than ``max_bad_records`` records are bad.
+    """
+    # Set UI color for the task in Airflow DAGs
+    ui_color = '#CD853F'
+    # Template fields allow dynamic values using Airflow's templating engine
+    template_fields = ("source_prefix", "clean_prefix", "quarantine_prefix", "manifest_key")
+
+    @apply_defaults
+    def __init__(self,
+                 aws_credentials_id="",  # AWS credentials ID (Airflow)
+                 s3_bucket="",  # Bucket holding the raw JSON files
+                 source_prefix="",  # Prefix of the raw JSON files (formatted per day of the run window)
+                 target_bucket="",  # Bucket for clean files, quarantine and manifest
+                 clean_prefix="",  # Prefix for rewritten files without the bad records
+                 quarantine_prefix="",  # Prefix for the bad records
+                 manifest_key="",  # Key of the COPY manifest to write
+                 create_table_sql="",  # CREATE TABLE of the staging table to check against
+                 json_fields=None,  # JSON field per column, in table order
+                 processes=4,  # Worker processes (0 validates in this process)
+                 max_bad_records=None,  # Fail if more records than this are bad
+                 max_record_bytes=1024 * 1024,  # Larger unfinished values count as bad
+                 source_store=None,  # Optional store override for the raw files
+                 target_store=None,  # Optional store override for the outputs
+                 backend=None,  # Backend whose object stores to use (default RedshiftBackend, i.e. S3)
+                 *args, **kwargs):
+        super(ValidateJsonOperator, self).__init__(*args, **kwargs)
+
+        # Store parameters for later use
+        self.aws_credentials_id = aws_credentials_id
+        self.s3_bucket = s3_bucket
+        self.source_prefix = source_prefix
+        self.target_bucket = target_bucket or s3_bucket
+        self.clean_prefix = clean_prefix
+        self.quarantine_prefix = quarantine_prefix
+        self.manifest_key = manifest_key
+        self.create_table_sql = create_table_sql
+        self.json_fields = json_fields
+        self.processes = processes
+        self.max_bad_records = max_bad_records
+        self.max_record_bytes = max_record_bytes
+        self.source_store = source_store
+        self.target_store = target_store
+        self.backend = backend or RedshiftBackend()
+
+    def execute(self, context):
+        """ Validates every file under the prefix and writes the clean manifest """
+        source = self.source_store or self.backend.object_store(self.s3_bucket, self.aws_credentials_id)
+        target = self.target_store or self.backend.object_store(self.target_bucket, self.aws_credentials_id)
+
+        rules = column_rules(self.create_table_sql, self.json_fields)
+        prefixes = partition_keys(self.source_prefix, context)
+        objects = []
+        for prefix in prefixes:
+            objects.extend(obj for obj in source.list_objects(prefix) if obj not in objects)
+        self.log.info(f"Validating {len(objects)} file(s) under {', '.join(prefixes)} "
+                      f"with {self.processes or 1} process(es)")
+
+        # Outputs keep the source key, so files of different days cannot collide
+        work = [(source, obj, rules, target,
+                 f"{self.clean_prefix}/{obj.key}",
+                 f"{self.quarantine_prefix}/{obj.key}.bad.json",
+                 self.json_fields is None, self.max_record_bytes)
+                for obj in objects]
+
+        if self.processes:
+            with ProcessPoolExecutor(max_workers=self.processes) as pool:
+                results = list(pool.map(_validate, work))
+        else:
+            results = [_validate(arguments) for arguments in work]
+
+        untouched, rewritten = [], []
+        records = bad = 0
+        for obj, (loaded, file_records, file_bad, clean) in zip(objects, results):
+            records += file_records
+            bad += file_bad
+            if loaded is not None:
+                (untouched if clean else rewritten).append(loaded)
+            if file_bad:
+                self.log.info(f"{obj.key}: {file_bad} of {file_records} record(s) quarantined")
+
+        self.log.info(f"{records} record(s) checked, {bad} quarantined under {self.quarantine_prefix}; "
+                      f"{len(untouched)} file(s) clean, {len(rewritten)} rewritten")
+        if self.max_bad_records is not None and bad > self.max_bad_records:
+            raise ValueError(f"{bad} bad record(s) under {', '.join(prefixes)}, "
+                             f"more than the {self.max_bad_records} allowed")
+        if not untouched and not rewritten:
+            self.log.info("No records to load for this run")
+            return ""
+
+        # Clean files stay in the source bucket, rewritten ones are in the target bucket
+        entries = (manifest.build_manifest(source, untouched)["entries"]
+                   + manifest.build_manifest(target, rewritten)["entries"])
+        target.write_bytes(self.manifest_key, json.dumps({"entries": entries}, indent=2).encode("utf-8"))
+        return target.url(self.manifest_key)
@@ -1,10 +1,13 @@
+-- Hand-run DDL for the star schema. The DISTSTYLE/DISTKEY/SORTKEY clauses must match
+-- helpers/star_schema.py STAR_SCHEMA_LAYOUTS (tests/test_star_schema.py checks them).
 CREATE TABLE IF NOT EXISTS artists (
     artistid VARCHAR(256) NOT NULL PRIMARY KEY,
     name VARCHAR(256),
     location VARCHAR(256),
     latitude NUMERIC(18,0),
     longitude NUMERIC(18,0)
-);
+)
+DISTSTYLE ALL SORTKEY (artistid);
 
 CREATE TABLE IF NOT EXISTS songs (
     songid VARCHAR(256) NOT NULL PRIMARY KEY,
@@ -13,7 +16,8 @@ CREATE TABLE IF NOT EXISTS songs (
     year INT4,
     duration NUMERIC(18,0),
     CONSTRAINT fk_artist FOREIGN KEY (artistid) REFERENCES artists(artistid)
-);
+)
+DISTSTYLE KEY DISTKEY (songid) SORTKEY (songid);
 
 CREATE TABLE IF NOT EXISTS users (
     userid INT4 NOT NULL PRIMARY KEY,
@@ -21,7 +25,8 @@ CREATE TABLE IF NOT EXISTS users (
     last_name VARCHAR(256),
     gender VARCHAR(256),
     level VARCHAR(256)
-);
+)
+DISTSTYLE ALL SORTKEY (userid);
 
 CREATE TABLE IF NOT EXISTS time (
     start_time TIMESTAMP NOT NULL PRIMARY KEY,
@@ -31,7 +36,15 @@ CREATE TABLE IF NOT EXISTS time (
     month INT,
     year INT,
     dayofweek INT
-);
+)
+DISTSTYLE ALL SORTKEY (start_time);
+
+CREATE TABLE IF NOT EXISTS song_lookup (
+    match_key CHAR(32) PRIMARY KEY,
+    song_id VARCHAR(256),
+    artist_id VARCHAR(256)
+)
+DISTSTYLE ALL SORTKEY (match_key);
 
 CREATE TABLE IF NOT EXISTS songplays (
     playid VARCHAR(32) NOT NULL PRIMARY KEY,
@@ -47,4 +60,5 @@ CREATE TABLE IF NOT EXISTS songplays (
     CONSTRAINT fk_user FOREIGN KEY (userid) REFERENCES users(userid),
     CONSTRAINT fk_song FOREIGN KEY (songid) REFERENCES songs(songid),
     CONSTRAINT fk_artist FOREIGN KEY (artistid) REFERENCES artists(artistid)
-);
+)
+DISTSTYLE KEY DISTKEY (songid) SORTKEY (start_time);
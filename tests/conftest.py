@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The DAGs import plugins and SQL modules the way Airflow puts them on the path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "plugins"), os.path.join(ROOT, "dags")]
@@ -0,0 +1,88 @@
+class FakeConnection:
+    """
+    DB-API connection stand-in: each cursor keeps its own result set, and
+    ``results`` maps the start of a statement to the rows it returns, or to a
+    function of the statement and its parameters returning them
+    (``descriptions`` to its ``cursor.description``). Data sent with
+    ``copy_expert`` is kept in ``copied`` as (statement, text) pairs.
+    """
+
+    def __init__(self, results=None, version="PostgreSQL 13.0", descriptions=None):
+        self.results = dict(results or {})
+        self.results.setdefault("SELECT version()", [(version,)])
+        self.descriptions = dict(descriptions or {})
+        self.statements = []
+        self.copied = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = None
+        self.rowcount = -1
+        self.description = None
+
+    def execute(self, sql, parameters=None):
+        statement = " ".join(sql.split())
+        self.connection.statements.append(statement)
+        self.rows = []
+        for prefix, rows in self.connection.results.items():
+            if statement.startswith(prefix):
+                self.rows = list(rows(statement, parameters) if callable(rows) else rows)
+                break
+        self.rowcount = len(self.rows)
+        self.description = next((description for prefix, description in self.connection.descriptions.items()
+                                 if statement.startswith(prefix)), None)
+
+    def copy_expert(self, sql, stream):
+        self.connection.statements.append(sql)
+        self.connection.copied.append((sql, stream.read()))
+
+    def fetchone(self):
+        if self.rows is None:
+            raise RuntimeError("no results to fetch")
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        if self.rows is None:
+            raise RuntimeError("no results to fetch")
+        rows, self.rows = self.rows, []
+        return rows
+
+
+class FakeHook:
+    """ PooledPostgresHook stand-in: every connection it hands out is the one FakeConnection """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def get_conn(self):
+        return self.connection
+
+    def run(self, sql, autocommit=False, parameters=None):
+        self.connection.cursor().execute(sql, parameters)
+        self.connection.commit()
+
+    def get_first(self, sql, parameters=None):
+        cursor = self.connection.cursor()
+        cursor.execute(sql, parameters)
+        return cursor.fetchone()
+
+    def get_records(self, sql, parameters=None):
+        cursor = self.connection.cursor()
+        cursor.execute(sql, parameters)
+        return cursor.fetchall()
@@ -0,0 +1,149 @@
+import gzip
+import json
+import sys
+import types
+from types import SimpleNamespace
+
+import pytest
+
+from helpers.backends import ConnectionBackend, LocalBackend, RedshiftBackend, make_backend
+from helpers.instrumentation import SqlMetrics
+from helpers.manifest import write_manifest
+from helpers.object_store import LocalObjectStore
+
+from fakes import FakeConnection
+
+# StageToRedshiftOperator.copy_sql; its comments name options the COPY may not use
+COPY_SQL = """
+    COPY {}  -- Target table in Redshift
+    FROM '{}'  -- S3 file path
+    ACCESS_KEY_ID 'local'  -- AWS credentials
+    SECRET_ACCESS_KEY 'local'
+    {}  -- File format (JSON structure, CSV or PARQUET) and conversions
+    region 'us-west-2'  -- AWS region where S3 bucket is stored
+    {}  -- Extra COPY options (e.g. MANIFEST, GZIP)
+"""
+
+JSON_FORMAT = "FORMAT AS JSON '{}' TIMEFORMAT AS 'epochmillisecs'"
+
+# (name, type OID) of staging_events' columns as the cursor describes them
+DESCRIPTION = [("artist", 1043), ("ts", 1114), ("user_id", 23)]
+
+EVENTS = [
+    {"artist": "Muse", "ts": 1541030400000, "userId": 7},
+    {"artist": "", "ts": 1541030401000, "userId": 8, "extra": True},
+    {"artist": {"name": "Blur"}, "ts": 1541030402000},
+]
+
+
+def write_lines(path, records, compress=False):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    text = "".join(line + "\n" for line in records)
+    path.write_bytes(gzip.compress(text.encode("utf-8")) if compress else text.encode("utf-8"))
+
+
+def copy(backend, source, data_format=JSON_FORMAT.format("auto"), options="", table="staging_events"):
+    """ Run one COPY like the staging operator does; returns (connection, rows, errors) """
+    conn = FakeConnection(descriptions={f"SELECT * FROM {table} LIMIT 0": DESCRIPTION})
+    metrics = SqlMetrics("stage", query_ids=False)
+    operator = SimpleNamespace(table=table, object_store=None)
+    errors = backend.copy(operator, conn.cursor(), metrics, COPY_SQL.format(table, source, data_format, options))
+    return conn, metrics.records[-1]["rows"], errors
+
+
+def loaded(conn):
+    return "".join(text for _, text in conn.copied).splitlines()
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    json_lines = [json.dumps(event) for event in EVENTS]
+    write_lines(tmp_path / "udacity-dend" / "log_data" / "2018-11-01-events.json", json_lines[:2])
+    write_lines(tmp_path / "udacity-dend" / "log_data" / "2018-11-02-events.json", json_lines[2:])
+    return tmp_path
+
+
+def test_auto_reads_fields_named_like_the_columns(bucket):
+    conn, rows, errors = copy(LocalBackend(str(bucket)), "s3://udacity-dend/log_data")
+    assert (rows, errors) == (3, [])
+    # Comments are not options: no MANIFEST, no GZIP
+    assert loaded(conn) == [
+        "Muse,2018-11-01T00:00:00,",
+        ",2018-11-01T00:00:01,",
+        '"{""name"": ""Blur""}",2018-11-01T00:00:02,',
+    ]
+    assert conn.copied[0][0] == "COPY staging_events (artist, ts, user_id) FROM STDIN WITH (FORMAT csv)"
+
+
+def test_jsonpaths_pick_fields_by_position(bucket):
+    store = LocalObjectStore(str(bucket / "udacity-dend"))
+    store.write_bytes("log_json_path.json", json.dumps(
+        {"jsonpaths": ["$['artist']['name']", "$.ts", "$['userId']"]}).encode("utf-8"))
+    conn, rows, _ = copy(LocalBackend(str(bucket)), "s3://udacity-dend/log_data",
+                         data_format=JSON_FORMAT.format("s3://udacity-dend/log_json_path.json"))
+    assert loaded(conn) == [",2018-11-01T00:00:00,7", ",2018-11-01T00:00:01,8", "Blur,2018-11-01T00:00:02,"]
+
+
+def test_gzip_manifest_and_batches(bucket):
+    store = LocalObjectStore(str(bucket / "udacity-dend"))
+    write_lines(bucket / "udacity-dend" / "gz" / "events.json.gz", [json.dumps(event) for event in EVENTS],
+                compress=True)
+    url = write_manifest(store, "manifests/events.manifest", store.list_objects("gz"))
+    conn, rows, _ = copy(LocalBackend(str(bucket), batch_rows=2), url, options="MANIFEST GZIP")
+    assert rows == 3
+    # Two rows per COPY FROM STDIN, the last batch holding the rest
+    assert [len(text.splitlines()) for _, text in conn.copied] == [2, 1]
+
+
+def test_maxerror_skips_bad_records_and_reports_them(bucket):
+    write_lines(bucket / "udacity-dend" / "log_data" / "2018-11-03-events.json", ["[1, 2]", '{"artist": ]'])
+    conn, rows, errors = copy(LocalBackend(str(bucket)), "s3://udacity-dend/log_data", options="MAXERROR 2")
+    assert rows == 3
+    assert [(error.line_number, error.value) for error in errors] == [(1, "[1, 2]"), (2, '{"artist": ]')]
+    assert errors[0].filename.endswith("2018-11-03-events.json")
+
+    with pytest.raises(ValueError) as failure:
+        copy(LocalBackend(str(bucket)), "s3://udacity-dend/log_data", options="MAXERROR 1")
+    assert len(failure.value.load_errors) == 2
+
+
+def test_csv_passes_through_and_parquet_is_refused(bucket):
+    write_lines(bucket / "udacity-dend" / "csv" / "events.csv", ["Muse,2018-11-01 00:00:00,7"])
+    conn, _, _ = copy(LocalBackend(str(bucket)), "s3://udacity-dend/csv",
+                      data_format="FORMAT AS CSV TIMEFORMAT AS 'epochmillisecs'")
+    assert loaded(conn) == ["Muse,2018-11-01 00:00:00,7"]
+    with pytest.raises(ValueError):
+        copy(LocalBackend(str(bucket)), "s3://udacity-dend/parquet", data_format="FORMAT AS PARQUET")
+
+
+def test_local_ddl_and_sql_drop_redshift_features():
+    backend = LocalBackend("/data/s3")
+    assert backend.ddl("CREATE TABLE t (\n  a INT\n)\nDISTSTYLE ALL SORTKEY (a);") == "CREATE TABLE t (\n  a INT\n);\n"
+    assert backend.sql("SELECT APPROXIMATE COUNT(DISTINCT a) FROM t") == "SELECT COUNT(DISTINCT a) FROM t"
+
+
+def test_make_backend():
+    assert isinstance(make_backend(None), RedshiftBackend)
+    assert make_backend({"kind": "local", "root": "/data/s3"}).root == "/data/s3"
+    with pytest.raises(ValueError):
+        make_backend({"kind": "bigquery"})
+
+
+def test_connection_backend_reads_the_extras_when_first_used(monkeypatch):
+    lookups = []
+
+    def get_connection(conn_id):
+        lookups.append(conn_id)
+        return SimpleNamespace(extra_dejson={"backend": "local", "local_root": "/data/s3"})
+
+    base_hook = types.ModuleType("airflow.hooks.base_hook")
+    base_hook.BaseHook = SimpleNamespace(get_connection=get_connection)
+    for name in ("airflow", "airflow.hooks"):
+        monkeypatch.setitem(sys.modules, name, sys.modules.get(name, types.ModuleType(name)))
+    monkeypatch.setitem(sys.modules, "airflow.hooks.base_hook", base_hook)
+
+    backend = make_backend({"kind": "connection", "conn_id": "warehouse"})
+    assert lookups == []
+    assert backend.name == "local"
+    assert backend.object_store("udacity-dend", None).root == "/data/s3/udacity-dend"
+    assert lookups == ["warehouse"]
@@ -0,0 +1,59 @@
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip("airflow")
+
+from helpers.object_store import LocalObjectStore  # noqa: E402
+from operators.compact_json import CompactJsonOperator  # noqa: E402
+
+
+def compactor(tmp_path, **options):
+    return CompactJsonOperator(task_id="Compact_songs_data",
+                               source_prefix="song_data",
+                               compacted_prefix="song_data_compacted",
+                               source_store=LocalObjectStore(tmp_path / "source"),
+                               target_store=LocalObjectStore(tmp_path / "target"),
+                               **options)
+
+
+def part_records(store, prefix):
+    records = []
+    for obj in store.list_objects(prefix):
+        with gzip.GzipFile(fileobj=store.open(obj.key)) as part:
+            records.extend(json.loads(line) for line in part)
+    return records
+
+
+def test_compacts_only_new_files_into_tagged_parts(tmp_path):
+    source = LocalObjectStore(tmp_path / "source")
+    source.write_bytes("song_data/A/a.json", b'{"song_id": "A"}')
+    # Pretty-printed, like some of the song files
+    source.write_bytes("song_data/B/b.json", b'{\n  "song_id": "B"\n}\n')
+    operator = compactor(tmp_path, target_file_bytes=10)
+
+    assert operator.execute({"ts_nodash": "20181101T000000"}) == {"files": 2, "records": 2, "parts": 2}
+    target = LocalObjectStore(tmp_path / "target")
+    assert [obj.key for obj in target.list_objects("song_data_compacted/part-")] == [
+        "song_data_compacted/part-20181101T000000-00000.json.gz",
+        "song_data_compacted/part-20181101T000000-00001.json.gz",
+    ]
+    assert sorted(operator.compacted_keys(target)) == ["song_data/A/a.json", "song_data/B/b.json"]
+
+    source.write_bytes("song_data/C/c.json", b'{"song_id": "C"}\n')
+    assert operator.execute({"ts_nodash": "20181102T000000"}) == {"files": 1, "records": 1, "parts": 1}
+    # The second run's part holds only the new file
+    assert part_records(target, "song_data_compacted/part-20181102T000000-") == [{"song_id": "C"}]
+    assert operator.execute({"ts_nodash": "20181103T000000"}) == {"files": 0, "records": 0, "parts": 0}
+
+
+def test_bad_file_fails_before_the_index_is_written(tmp_path):
+    source = LocalObjectStore(tmp_path / "source")
+    source.write_bytes("song_data/A/a.json", b'{"song_id": "A"}\n{"song_id": ]\n')
+    operator = compactor(tmp_path)
+
+    with pytest.raises(ValueError, match="line 2"):
+        operator.execute({"ts_nodash": "20181101T000000"})
+    # Nothing was recorded as compacted, so the next run tries the file again
+    assert operator.compacted_keys(LocalObjectStore(tmp_path / "target")) == set()
@@ -0,0 +1,72 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+pytest.importorskip("airflow")
+
+import statements_for_sql  # noqa: E402
+from helpers.object_store import LocalObjectStore  # noqa: E402
+from operators.convert_json import ConvertJsonOperator  # noqa: E402
+
+EVENT = {"artist": "Muse", "firstName": "Ann", "itemInSession": 2, "length": 230.5, "page": "NextSong",
+         "registration": 1540919166796.0, "sessionId": "139", "ts": 1541030400000, "userId": "7"}
+
+
+def converter(tmp_path, lines, **options):
+    store = LocalObjectStore(tmp_path)
+    store.write_bytes("log_data/2018-11-01-events.json", "".join(line + "\n" for line in lines).encode("utf-8"))
+    return store, ConvertJsonOperator(task_id="Convert_events",
+                                      source_prefix="log_data/",
+                                      target_prefix="converted/log_data",
+                                      quarantine_prefix="converted/quarantine",
+                                      create_table_sql=statements_for_sql.CREATE_staging_events_TABLE_SQL,
+                                      output_format="csv",
+                                      source_store=store,
+                                      target_store=store,
+                                      **options)
+
+
+def read_csv(store, key):
+    with gzip.GzipFile(fileobj=store.open(key)) as part:
+        return list(csv.reader(io.TextIOWrapper(part, encoding="utf-8")))
+
+
+def test_bad_records_are_quarantined(tmp_path):
+    lines = [json.dumps(EVENT),
+             json.dumps([EVENT]),  # Not an object
+             json.dumps(dict(EVENT, sessionId="abc")),  # Not an integer
+             '{"artist": "Blur", "ts": ]',  # Not JSON
+             json.dumps(dict(EVENT, userId="", length=None))]
+    store, operator = converter(tmp_path, lines, json_fields=statements_for_sql.staging_events_json_fields,
+                                max_bad_records=3)
+
+    result = operator.execute({})
+    assert result == {"rows": 2, "files": ["converted/log_data/part-00000.csv.gz"], "bad_records": 3}
+    rows = read_csv(store, "converted/log_data/part-00000.csv.gz")
+    # Table order; camelCase fields mapped, numbers typed, missing and empty values NULL
+    assert rows[0] == ["Muse", "", "Ann", "", "2", "", "230.5", "", "", "", "NextSong", "1540919166796",
+                       "139", "", "", "1541030400000", "", "7"]
+    assert rows[1][6] == "" and rows[1][17] == ""
+
+    with store.open("converted/quarantine/bad-records.json") as quarantine:
+        bad = [json.loads(line) for line in quarantine]
+    assert [entry["errors"] for entry in bad] == [["expected a JSON object, got list"],
+                                                  ["session_id: 'abc' is not an integer"],
+                                                  ["not valid JSON"]]
+
+
+def test_too_many_bad_records_fail_the_task(tmp_path):
+    _, operator = converter(tmp_path, [json.dumps(EVENT), "[]"],
+                            json_fields=statements_for_sql.staging_events_json_fields)
+    with pytest.raises(ValueError, match="1 bad record\\(s\\) under log_data/, more than the 0 allowed"):
+        operator.execute({})
+
+
+def test_columns_without_a_field_fail_instead_of_loading_nulls(tmp_path):
+    # The event logs name their fields in camelCase, so matching by name misses user_id and others
+    _, operator = converter(tmp_path, [json.dumps(EVENT)])
+    with pytest.raises(ValueError, match="item_in_session, .*user_id; map the columns"):
+        operator.execute({})
@@ -0,0 +1,81 @@
+import re
+
+import pytest
+
+from helpers import copy_slots
+from helpers.copy_slots import CopySlots
+
+from fakes import FakeConnection, FakeHook
+
+
+class SlotTable:
+    """ copy_slots in memory, answering the statements CopySlots runs """
+
+    def __init__(self, *holders):
+        self.holders = list(holders)
+
+    def results(self):
+        return {
+            "SELECT COUNT(*) FROM copy_slots": lambda statement, parameters: [(len(self.holders),)],
+            "INSERT INTO copy_slots": self.insert,
+            "DELETE FROM copy_slots WHERE holder": self.delete,
+        }
+
+    def insert(self, statement, parameters=None):
+        self.holders.append(re.search(r"VALUES \('(.*)'\)", statement).group(1).replace("''", "'"))
+        return []
+
+    def delete(self, statement, parameters=None):
+        self.holders.remove(re.search(r"holder = '(.*)'", statement).group(1).replace("''", "'"))
+        return []
+
+
+def slots(table, **options):
+    conn = FakeConnection(table.results())
+    return conn, CopySlots(FakeHook(conn), 2, poll_seconds=0, **options)
+
+
+def test_slots_are_taken_under_the_table_lock():
+    table = SlotTable()
+    conn, limit = slots(table)
+    assert limit.try_acquire("Stage_events:2018-11-01")
+    assert limit.try_acquire("Stage_songs:2018-11-01")
+    assert not limit.try_acquire("Stage_events:2018-11-02")
+    assert table.holders == ["Stage_events:2018-11-01", "Stage_songs:2018-11-01"]
+    # Every attempt locks first, drops stale slots, then counts
+    assert conn.statements[:4] == [
+        "LOCK copy_slots;",
+        "DELETE FROM copy_slots WHERE acquired_at < CURRENT_TIMESTAMP - INTERVAL '10800 seconds';",
+        "SELECT COUNT(*) FROM copy_slots;",
+        "INSERT INTO copy_slots (holder) VALUES ('Stage_events:2018-11-01');",
+    ]
+    assert [statement for statement in conn.statements if statement.startswith("LOCK")] == ["LOCK copy_slots;"] * 3
+    # A refused attempt commits too, so the lock is not held while waiting
+    assert conn.commits == 3
+
+
+def test_slot_waits_for_a_release_and_gives_it_back(monkeypatch):
+    table = SlotTable("a", "b")
+    _, limit = slots(table)
+    polls = []
+
+    def sleep(seconds):
+        polls.append(seconds)
+        if len(polls) == 2:
+            table.holders.remove("a")
+
+    monkeypatch.setattr(copy_slots.time, "sleep", sleep)
+    with pytest.raises(RuntimeError):
+        with limit.slot("o'brien") as waited:
+            assert table.holders == ["b", "o'brien"]
+            assert waited >= 0
+            raise RuntimeError("COPY failed")
+    assert len(polls) == 2
+    # Released even though the COPY failed
+    assert table.holders == ["b"]
+
+
+def test_gives_up_after_the_timeout():
+    _, limit = slots(SlotTable("a", "b"), timeout=0)
+    with pytest.raises(TimeoutError, match="No COPY slot free in copy_slots"):
+        limit.acquire("c")
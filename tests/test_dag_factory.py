@@ -0,0 +1,87 @@
+import copy
+
+import pytest
+
+pytest.importorskip("airflow")
+
+import statements_for_sql  # noqa: E402
+from helpers.dag_factory import build_backfill_dag, build_dag  # noqa: E402
+from helpers.pipeline_spec import PIPELINE_SPEC  # noqa: E402
+
+DEFAULT_ARGS = {"owner": "goose"}
+
+
+def upstream(dag, task_id):
+    return set(dag.task_dict[task_id].upstream_task_ids)
+
+
+def test_tasks_follow_the_tables_they_read():
+    dag = build_dag(PIPELINE_SPEC, statements_for_sql, DEFAULT_ARGS)
+
+    # Sources: create (and compact or validate) before the COPY
+    assert upstream(dag, "create_staging_events_table") == {"Begin_execution"}
+    assert upstream(dag, "Validate_events_data") == {"create_staging_events_table"}
+    assert upstream(dag, "Stage_events_from_s3_to_redshift") == {"Validate_events_data"}
+    assert upstream(dag, "Stage_songs_from_s3_to_redshift") == {"create_staging_songs_table", "Compact_song_data"}
+    assert dag.task_dict["Stage_events_from_s3_to_redshift"].manifest_url == \
+        "{{ ti.xcom_pull(task_ids='Validate_events_data') }}"
+
+    # The dimensions share one task, after everything they read
+    assert upstream(dag, "Load_dim_tables") == {
+        "Stage_events_from_s3_to_redshift", "Stage_songs_from_s3_to_redshift",
+        "create_song_lookup_table", "create_users_table", "create_songs_table", "create_artists_table",
+    }
+    assert set(dag.task_dict["Load_dim_tables"].tables) == {"song_lookup", "users", "songs", "artists"}
+    # The fact load joins song_lookup, which the dimension task loads
+    assert upstream(dag, "Load_songplays_fact_table") == {
+        "Stage_events_from_s3_to_redshift", "Load_dim_tables", "create_songplays_table"}
+    assert upstream(dag, "Load_time_dim_table") == {"Load_songplays_fact_table", "create_time_table"}
+    assert upstream(dag, "Load_rollup_tables") == {"Load_songplays_fact_table"}
+
+    assert upstream(dag, "Run_data_quality_checks") == {
+        "Load_songplays_fact_table", "Load_dim_tables", "Load_time_dim_table", "Load_rollup_tables"}
+    assert upstream(dag, "Stop_execution") == {"Run_data_quality_checks"}
+
+
+def test_per_table_dimensions_only_wait_for_their_sources():
+    spec = copy.deepcopy(PIPELINE_SPEC)
+    spec["dimension_grouping"] = "per_table"
+    dag = build_dag(spec, statements_for_sql, DEFAULT_ARGS)
+
+    assert "Load_dim_tables" not in dag.task_dict
+    assert upstream(dag, "Load_users_dim_table") == {"Stage_events_from_s3_to_redshift", "create_users_table"}
+    assert upstream(dag, "Load_songs_dim_table") == {"Stage_songs_from_s3_to_redshift", "create_songs_table"}
+    assert upstream(dag, "Load_songplays_fact_table") == {
+        "Stage_events_from_s3_to_redshift", "Load_song_lookup_dim_table", "create_songplays_table"}
+    assert dag.task_dict["Load_users_dim_table"].merge_key == "user_id"
+
+
+def test_unknown_grouping_is_rejected():
+    spec = dict(PIPELINE_SPEC, dimension_grouping="parallel")
+    with pytest.raises(ValueError, match="Unknown dimension grouping"):
+        build_dag(spec, statements_for_sql, DEFAULT_ARGS)
+
+
+def test_backfill_validates_and_reloads_only_what_reads_the_events():
+    dag = build_backfill_dag(PIPELINE_SPEC, statements_for_sql, DEFAULT_ARGS)
+
+    assert dag.is_paused_upon_creation
+    assert set(dag.task_dict) == {
+        "Begin_execution", "Validate_events_data", "Stage_events_from_s3_to_redshift",
+        "Load_songplays_fact_table", "Load_users_dim_table", "Load_time_dim_table", "Load_rollup_tables",
+        "Stop_execution",
+    }
+    # Late files go through the same validation and clean manifest as the daily run
+    assert upstream(dag, "Validate_events_data") == {"Begin_execution"}
+    assert upstream(dag, "Stage_events_from_s3_to_redshift") == {"Validate_events_data"}
+    stage = dag.task_dict["Stage_events_from_s3_to_redshift"]
+    assert stage.manifest_url == "{{ ti.xcom_pull(task_ids='Validate_events_data') }}"
+    assert stage.incremental and stage.reload_where.startswith("ts >= ")
+
+    assert upstream(dag, "Load_songplays_fact_table") == {"Stage_events_from_s3_to_redshift"}
+    assert upstream(dag, "Load_users_dim_table") == {"Stage_events_from_s3_to_redshift"}
+    assert upstream(dag, "Load_time_dim_table") == {"Load_songplays_fact_table"}
+    assert upstream(dag, "Load_rollup_tables") == {"Load_songplays_fact_table"}
+    assert upstream(dag, "Stop_execution") == {"Load_users_dim_table", "Load_time_dim_table", "Load_rollup_tables"}
+    # Days write the shared tables one at a time
+    assert dag.task_dict["Load_songplays_fact_table"].task_concurrency == 1
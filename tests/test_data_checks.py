@@ -0,0 +1,76 @@
+import pytest
+
+from helpers.data_checks import DataCheck, fuse_checks
+from helpers.pipeline_spec import PIPELINE_SPEC
+
+
+def test_table_metrics_share_one_scan():
+    checks = [
+        DataCheck(table="users", metric="row_count", comparator="greater_than", value=0),
+        DataCheck(table="users", metric="null_count", column="user_id", comparator="zero_nulls"),
+        DataCheck(table="songs", metric="duplicate_count", column="song_id", comparator="equals", value=0),
+        DataCheck(sql="SELECT COUNT(*) FROM songplays", comparator="greater_than", value=0),
+    ]
+    queries = fuse_checks(checks)
+    assert [sql for sql, _ in queries] == [
+        "SELECT COUNT(*) FROM songplays",
+        "SELECT COUNT(*), COALESCE(SUM(CASE WHEN user_id IS NULL THEN 1 ELSE 0 END), 0) FROM users",
+        "SELECT COUNT(song_id) - COUNT(DISTINCT song_id) FROM songs",
+    ]
+    assert [group for _, group in queries] == [checks[3:], checks[:2], checks[2:3]]
+
+
+def test_filters_and_samples_get_their_own_scan():
+    window = "start_time >= '2018-11-01'"
+    checks = [
+        DataCheck(table="songplays", where=window, comparator="greater_than", value=0),
+        DataCheck(table="songplays", where=window, sample=0.1, comparator="greater_than", value=0),
+        DataCheck(table="songplays", comparator="greater_than", value=0),
+    ]
+    assert [sql for sql, _ in fuse_checks(checks)] == [
+        f"SELECT COUNT(*) FROM songplays WHERE ({window})",
+        f"SELECT COUNT(*) / 0.1 FROM songplays WHERE ({window}) AND RANDOM() < 0.1",
+        "SELECT COUNT(*) FROM songplays",
+    ]
+
+
+def test_comparators():
+    assert DataCheck(table="t", comparator="equals", value=3).passes(3)
+    assert not DataCheck(table="t", comparator="equals", value=3).passes(4)
+    assert DataCheck(table="t", comparator="greater_than", value=0).passes("1")
+    assert not DataCheck(table="t", comparator="less_than", value=0).passes(0)
+    assert DataCheck(table="t", comparator="range", min=1, max=3).passes(3)
+    assert not DataCheck(table="t", comparator="range", min=1, max=3).passes(3.5)
+    assert DataCheck(table="t", comparator="zero_nulls").passes(0)
+    assert not DataCheck(table="t", comparator="zero_nulls").passes(None)
+
+
+def test_within_stddev_waits_for_history():
+    check = DataCheck(table="t", comparator="within_stddev", min_history=3, history_runs=4)
+    assert check.passes(1000, history=[10, 11])
+    history = [10, 12, 10, 12, 500]  # Only the last four runs count
+    assert check.passes(11, history=history)
+    assert not check.passes(20, history=history)
+
+
+def test_invalid_checks_are_rejected():
+    with pytest.raises(ValueError):
+        DataCheck()
+    with pytest.raises(ValueError):
+        DataCheck(table="t", metric="median")
+    with pytest.raises(ValueError):
+        DataCheck(table="t", comparator="about")
+    with pytest.raises(ValueError):
+        DataCheck(table="t", metric="duplicate_count", column="a", sample=0.5)
+    with pytest.raises(ValueError):
+        DataCheck(table="t", sample=1.5)
+
+
+def test_spec_checks_read_only_the_run_window():
+    window = "start_time >= '{{ ds }}' AND start_time < '{{ next_ds }}'"
+    checks = [DataCheck(**check) for check in PIPELINE_SPEC["quality"]["extra_checks"]]
+    # A sample still reads every row the where lets through, so sampled checks are windowed too
+    assert [check.where for check in checks] == [window] * len(checks)
+    assert any(check.sample for check in checks)
+    for sql, _ in fuse_checks(checks):
+        assert f"WHERE ({window})" in sql
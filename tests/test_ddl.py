@@ -0,0 +1,42 @@
+from helpers.ddl import parse_columns, type_family, without_table_attributes
+
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS staging_events (
+    artist VARCHAR(256),  -- Artist name (e.g. "Muse")
+    length DOUBLE PRECISION,
+    ts BIGINT NOT NULL,
+    start_time TIMESTAMP WITHOUT TIME ZONE,
+    level CHAR(4) DEFAULT 'free',
+    price NUMERIC(10, 2),
+    flag BOOLEAN,
+    user_id INT ENCODE az64,
+    PRIMARY KEY (ts)
+)
+DISTSTYLE KEY DISTKEY (artist) SORTKEY (ts);
+"""
+
+
+def test_parse_columns_reads_types_and_lengths():
+    assert parse_columns(CREATE_SQL) == [
+        ("artist", "VARCHAR", 256),
+        ("length", "DOUBLE PRECISION", None),
+        ("ts", "BIGINT", None),
+        ("start_time", "TIMESTAMP WITHOUT TIME ZONE", None),
+        ("level", "CHAR", 4),
+        ("price", "NUMERIC", None),
+        ("flag", "BOOLEAN", None),
+        ("user_id", "INT", None),
+    ]
+
+
+def test_type_family():
+    families = [type_family(sql_type) for _, sql_type, _ in parse_columns(CREATE_SQL)]
+    assert families == ["text", "float", "integer", "timestamp", "text", "float", "boolean", "integer"]
+    assert type_family("SUPER") == "other"
+
+
+def test_without_table_attributes_keeps_the_column_list():
+    sql = without_table_attributes(CREATE_SQL)
+    assert sql.endswith("PRIMARY KEY (ts)\n);\n")
+    assert "DISTSTYLE" not in sql and "SORTKEY" not in sql
+    assert parse_columns(sql) == parse_columns(CREATE_SQL)
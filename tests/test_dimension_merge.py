@@ -0,0 +1,115 @@
+import sqlite3
+
+import pytest
+
+import statements_for_sql
+from helpers.pipeline_spec import PIPELINE_SPEC
+
+from fakes import FakeConnection, FakeHook
+
+DAY = 24 * 3600 * 1000
+WINDOW_START = 1541030400000  # 2018-11-01, epoch milliseconds like staging_events.ts
+
+
+def render_window(sql, start, end):
+    """ What Airflow renders the run window's Jinja expressions to """
+    return (sql.replace("{{ execution_date.int_timestamp * 1000 }}", str(start))
+               .replace("{{ next_execution_date.int_timestamp * 1000 }}", str(end)))
+
+
+def merge_users(db, start, end):
+    """ LoadDimensionOperator's merge, in SQL sqlite accepts: stage the delta, replace its keys """
+    db.execute("CREATE TEMP TABLE users_delta AS "
+               + render_window(statements_for_sql.user_table_upsert, start, end).rstrip().rstrip(";"))
+    db.execute("DELETE FROM users WHERE user_id IN (SELECT user_id FROM users_delta)")
+    db.execute("INSERT INTO users SELECT * FROM users_delta")
+    db.execute("DROP TABLE users_delta")
+
+
+def staged(*events):
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE staging_events (user_id INT, first_name TEXT, last_name TEXT, gender TEXT, "
+               "level TEXT, page TEXT, ts BIGINT)")
+    db.execute("CREATE TABLE users (user_id INT, first_name TEXT, last_name TEXT, gender TEXT, level TEXT)")
+    db.executemany("INSERT INTO staging_events VALUES (?, 'A', 'B', 'F', ?, ?, ?)", events)
+    return db
+
+
+def levels(db):
+    return dict(db.execute("SELECT user_id, level FROM users ORDER BY user_id"))
+
+
+def test_user_merge_only_touches_the_windows_users():
+    db = staged(
+        (1, "paid", "NextSong", WINDOW_START - DAY),  # Staged by an earlier run
+        (2, "free", "NextSong", WINDOW_START + 10),
+        (2, "paid", "NextSong", WINDOW_START + 20),  # Latest of the window wins
+        (3, "free", "Home", WINDOW_START + 30),  # Not a play
+    )
+    db.execute("INSERT INTO users VALUES (1, 'A', 'B', 'F', 'free')")
+
+    merge_users(db, WINDOW_START, WINDOW_START + DAY)
+    # User 1 is not re-merged from its old events
+    assert levels(db) == {1: "free", 2: "paid"}
+
+
+def test_backfilled_day_keeps_later_levels():
+    db = staged(
+        (1, "free", "NextSong", WINDOW_START + 10),
+        (1, "paid", "NextSong", WINDOW_START + DAY + 10),  # A later day, already merged
+        (2, "free", "NextSong", WINDOW_START + 20),
+    )
+    db.execute("INSERT INTO users VALUES (1, 'A', 'B', 'F', 'paid')")
+
+    merge_users(db, WINDOW_START, WINDOW_START + DAY)
+    assert levels(db) == {1: "paid", 2: "free"}
+
+
+def test_song_merges_read_only_the_runs_compacted_parts():
+    songs = next(source for source in PIPELINE_SPEC["sources"] if source["name"] == "songs")
+    prefix = songs["s3_key"].format(ts_nodash="20181101T000000")
+    # CompactJsonOperator names its parts part-<ts_nodash>-<index>
+    assert "song_data_compacted/part-20181101T000000-00000.json.gz".startswith(prefix)
+    assert not "song_data_compacted/part-20181031T000000-00000.json.gz".startswith(prefix)
+
+
+def test_merge_statements_replace_the_deltas_keys():
+    pytest.importorskip("airflow")
+    from operators.load_to_dimension_table import LoadDimensionOperator
+
+    assert LoadDimensionOperator.load_statements("song_lookup", "SELECT ...", True, ("match_key", "song_id")) == [
+        "CREATE TEMP TABLE song_lookup_delta (LIKE song_lookup);",
+        "INSERT INTO song_lookup_delta SELECT ...",
+        "DELETE FROM song_lookup USING song_lookup_delta "
+        "WHERE song_lookup.match_key = song_lookup_delta.match_key "
+        "AND song_lookup.song_id = song_lookup_delta.song_id;",
+        "INSERT INTO song_lookup SELECT * FROM song_lookup_delta;",
+        "DROP TABLE song_lookup_delta;",
+    ]
+    assert LoadDimensionOperator.load_statements("users", "SELECT ...", True, None) == ["INSERT INTO users SELECT ..."]
+    assert LoadDimensionOperator.load_statements("users", "SELECT ...", False, None) == [
+        "TRUNCATE TABLE users;", "INSERT INTO users SELECT ..."]
+
+
+@pytest.mark.parametrize("grouping, commits", [("single", 1), ("per_table", 2)])
+def test_dimension_tables_share_one_session(monkeypatch, grouping, commits):
+    pytest.importorskip("airflow")
+    from hooks import pooled_postgres_hook
+    from operators.load_to_dimension_table import LoadDimensionOperator
+
+    conn = FakeConnection()
+    monkeypatch.setattr(pooled_postgres_hook, "PooledPostgresHook", lambda postgres_conn_id: FakeHook(conn))
+    operator = LoadDimensionOperator(task_id="Load_dimension_tables", redshift_conn_id="redshift",
+                                     tables={"users": {"sql_statement": "SELECT 1", "merge_key": "user_id"},
+                                             "songs": "SELECT 2"},
+                                     transaction_grouping=grouping)
+    assert set(operator.execute({})) == {"users", "songs"}
+    assert [statement for statement in conn.statements if not statement.startswith("SELECT")] == [
+        "CREATE TEMP TABLE users_delta (LIKE users);",
+        "INSERT INTO users_delta SELECT 1",
+        "DELETE FROM users USING users_delta WHERE users.user_id = users_delta.user_id;",
+        "INSERT INTO users SELECT * FROM users_delta;",
+        "DROP TABLE users_delta;",
+        "INSERT INTO songs SELECT 2",
+    ]
+    assert conn.commits == commits
@@ -0,0 +1,86 @@
+from helpers.instrumentation import SqlMetrics, StatsdMetricsSink
+from helpers.query_plans import QueryProfiler
+
+from fakes import FakeConnection
+
+CHECK_SQL = "SELECT COUNT(*) FROM songplays"
+
+
+def connection():
+    return FakeConnection({
+        CHECK_SQL: [(320,)],
+        "EXPLAIN": [("XN Aggregate (cost=0.00..1.00 rows=1 width=0)",),
+                    ("  -> XN Seq Scan on songplays (cost=0.00..1.00 rows=320 width=0)",)],
+    })
+
+
+def test_result_set_survives_query_id_lookup():
+    conn = connection()
+    cursor = conn.cursor()
+    metrics = SqlMetrics("check", query_ids=None)
+    metrics.run(cursor, CHECK_SQL, table="songplays")
+    assert cursor.fetchone() == (320,)
+
+
+def profiler(mode, history):
+    profiler = QueryProfiler(mode=mode)
+    profiler.history_connection = lambda: history
+    return profiler
+
+
+def test_profiled_select_check_keeps_its_result():
+    for mode in QueryProfiler.modes:
+        conn, history = connection(), FakeConnection()
+        cursor = conn.cursor()
+        metrics = SqlMetrics("check", query_ids=False, profiler=profiler(mode, history))
+        metrics.run(cursor, CHECK_SQL, table="songplays")
+        assert cursor.fetchone() == (320,)
+        assert metrics.records[-1]["findings"] == ["Seq Scan on songplays"]
+        assert any(statement.startswith("INSERT INTO query_plans") for statement in history.statements)
+        assert history.commits == 1
+
+
+class FailingExplainConnection(FakeConnection):
+    """ EXPLAIN fails for statements reading a table a skipped statement would create """
+
+    def cursor(self):
+        cursor = super(FailingExplainConnection, self).cursor()
+        execute = cursor.execute
+
+        def failing(sql, parameters=None):
+            if sql.startswith("EXPLAIN") and "users_delta" in sql:
+                raise RuntimeError('relation "users_delta" does not exist')
+            execute(sql, parameters)
+        cursor.execute = failing
+        return cursor
+
+
+def test_dry_run_explain_error_keeps_earlier_plans():
+    conn, history = FailingExplainConnection({"EXPLAIN": [("XN Seq Scan on staging_events",)]}), FakeConnection()
+    metrics = SqlMetrics("dims", query_ids=False, profiler=profiler("dry_run", history))
+    cursor = conn.cursor()
+    metrics.run(cursor, "INSERT INTO songs SELECT * FROM staging_songs")
+    metrics.run(cursor, "INSERT INTO users SELECT * FROM users_delta")
+
+    assert conn.rollbacks == 1
+    assert "users_delta" in metrics.records[-1]["explain_error"]
+    # The first statement's plan was committed on the history connection before the rollback
+    assert [statement for statement in history.statements if statement.startswith("INSERT")]
+    assert history.commits == 1
+    assert not any(statement.startswith("INSERT INTO songs") for statement in conn.statements)
+
+
+def test_statsd_names_carry_the_statement():
+    metrics = SqlMetrics("Load_dimensions", query_ids=False)
+    metrics.record("DELETE FROM users USING users_delta WHERE ...", 0.25, 3, table="users")
+    metrics.record("INSERT INTO users SELECT * FROM users_delta", 0.5, 7, table="users")
+    metrics.record("POOL_WAIT", 0.0, None, table="connection_pool")
+    metrics.record("ANALYZE songplays", 1.5, -1)
+    assert StatsdMetricsSink(prefix="goose").lines(metrics.records) == [
+        "goose.Load_dimensions.users.DELETE.seconds:250|ms",
+        "goose.Load_dimensions.users.DELETE.rows:3|g",
+        "goose.Load_dimensions.users.INSERT.seconds:500|ms",
+        "goose.Load_dimensions.users.INSERT.rows:7|g",
+        "goose.Load_dimensions.connection_pool.POOL_WAIT.seconds:0|ms",
+        "goose.Load_dimensions.all.ANALYZE.seconds:1500|ms",
+    ]
@@ -0,0 +1,32 @@
+import pytest
+
+from helpers.json_records import iter_lines_records
+
+
+def records(text):
+    return list(iter_lines_records(text.splitlines(True)))
+
+
+def test_values_on_one_or_several_lines():
+    text = '{"a": 1}\n{"a": 2} {"a": 3}\n\n{\n  "a": [4,\n    5]\n}\n'
+    assert records(text) == [{"a": 1}, {"a": 2}, {"a": 3}, {"a": [4, 5]}]
+
+
+def test_bad_line_mid_file_raises_at_once():
+    lines = iter(['{"a": 1}\n', '{"a": ]\n', '{"a": 2}\n'])
+    decoded = iter_lines_records(lines)
+    assert next(decoded) == {"a": 1}
+    with pytest.raises(ValueError, match="line 2"):
+        next(decoded)
+    # Nothing after the bad line was read into a buffer
+    assert list(lines) == ['{"a": 2}\n']
+
+
+def test_unterminated_string_is_not_buffered():
+    with pytest.raises(ValueError, match="line 1"):
+        records('{"a": "abc\n{"a": 2}\n' * 3)
+
+
+def test_truncated_last_value_raises():
+    with pytest.raises(ValueError, match="line 2"):
+        records('{"a": 1}\n{"a": [1,\n')
@@ -0,0 +1,33 @@
+from helpers.json_validation import column_rules, iter_checked_values, record_errors
+
+
+def values(text, **options):
+    return list(iter_checked_values(text.splitlines(True), **options))
+
+
+def test_values_on_one_or_several_lines():
+    text = '{"a": 1}\n{"a": 2} {"a": 3}\n\n{"a":\n 4}\n'
+    assert values(text) == [({"a": 1}, None), ({"a": 2}, None), ({"a": 3}, None), ({"a": 4}, None)]
+
+
+def test_bad_text_only_costs_its_own_line():
+    text = '{"a": 1}\n{"a": ]\n{"a": 2}\n'
+    assert values(text) == [({"a": 1}, None), (None, '{"a": ]'), ({"a": 2}, None)]
+
+
+def test_unfinished_values_are_cut_off():
+    text = '{"a": "' + "x" * 50 + '\n' + "x" * 50 + '\n{"a": 2}\n'
+    # Too large to keep waiting for the closing quote
+    assert values(text, max_record_bytes=20)[-1] == ({"a": 2}, None)
+    assert all(record is None for record, _ in values(text, max_record_bytes=20)[:-1])
+    # Still unfinished when the file ends
+    assert values('{"a": 1}\n{"a": \n') == [({"a": 1}, None), (None, '{"a":')]
+
+
+def test_record_errors_follow_the_table():
+    rules = column_rules("CREATE TABLE t (\n  user_id INT,\n  level VARCHAR(4),\n  ts BIGINT\n);")
+    assert record_errors({"user_id": "7", "LEVEL": "free", "ts": 1.0}, rules) == []
+    assert record_errors({"user_id": "x", "level": "premium"}, rules) == [
+        "user_id: 'x' is not an integer", "level: 7 bytes is over VARCHAR(4)"]
+    assert record_errors({"other": 1}, rules) == ["none of the table's fields are present"]
+    assert record_errors([1], rules) == ["expected a JSON object, got list"]
@@ -0,0 +1,32 @@
+from helpers.manifest import balance, build_manifest, load_stats
+from helpers.object_store import LocalObjectStore, ObjectInfo
+
+OBJECTS = [ObjectInfo("a", 50), ObjectInfo("b", 30), ObjectInfo("c", 20), ObjectInfo("d", 10), ObjectInfo("e", 10)]
+
+
+def test_balance_spreads_bytes_largest_first():
+    groups = balance(OBJECTS, 2)
+    assert [[obj.key for obj in group] for group in groups] == [["a", "d"], ["b", "c", "e"]]
+    assert [sum(obj.size for obj in group) for group in groups] == [60, 60]
+
+
+def test_balance_drops_empty_groups():
+    assert balance(OBJECTS[:2], 4) == [[OBJECTS[0]], [OBJECTS[1]]]
+    assert balance([], 3) == []
+    assert balance(OBJECTS, 0) == [sorted(OBJECTS, key=lambda obj: obj.size, reverse=True)]
+
+
+def test_load_stats_reports_skew():
+    assert load_stats(OBJECTS, 2) == {"files": 5, "bytes": 120, "slices": 2, "skew": 1.0}
+    # One file cannot be spread: a single busy slice out of four
+    assert load_stats([ObjectInfo("a", 100)], 4) == {"files": 1, "bytes": 100, "slices": 4, "skew": 4.0}
+    assert load_stats([], 2) == {"files": 0, "bytes": 0, "slices": 2, "skew": 0.0}
+
+
+def test_build_manifest_lists_every_object(tmp_path):
+    store = LocalObjectStore(str(tmp_path))
+    entries = build_manifest(store, OBJECTS[:2])["entries"]
+    assert entries == [
+        {"url": store.url("a"), "mandatory": True, "meta": {"content_length": 50}},
+        {"url": store.url("b"), "mandatory": True, "meta": {"content_length": 30}},
+    ]
@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_after(statement, package):
+    """ Modules of the package loaded by running statement in a fresh interpreter """
+    script = (f"import json, sys\n{statement}\n"
+              f"print(json.dumps(sorted(m for m in sys.modules if m.split('.')[0] == {package!r})))")
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.join(ROOT, "plugins"), env.get("PYTHONPATH")]))
+    output = subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True)
+    return json.loads(output.stdout)
+
+
+def test_helper_module_loads_alone():
+    assert loaded_after("import helpers.pipeline_spec", "helpers") == ["helpers", "helpers.pipeline_spec"]
+
+
+def test_package_names_load_their_module_on_use():
+    assert loaded_after("from helpers import SqlQueries", "helpers") == ["helpers", "helpers.sql_queries"]
+
+    import helpers
+    assert "SqlQueries" in dir(helpers)
+    with pytest.raises(AttributeError):
+        helpers.NoSuchHelper
+
+
+def test_operator_module_does_not_load_the_other_operators():
+    pytest.importorskip("airflow")
+
+    assert loaded_after("import operators.create_table", "operators") == ["operators", "operators.create_table"]
+    assert loaded_after("from operators import LoadFactOperator", "operators") == \
+        ["operators", "operators.load_to_fact_table"]
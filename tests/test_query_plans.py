@@ -0,0 +1,37 @@
+from helpers.query_plans import plan_findings, plan_nodes, statement_key
+
+PLAN = [
+    "XN Hash Join DS_DIST_BOTH  (cost=0.00..9.00 rows=10 width=8)",
+    "  Hash Cond: (\"outer\".song_id = \"inner\".song_id)",
+    "  ->  XN Seq Scan on songplays  (cost=0.00..1.00 rows=100 width=4)",
+    "        Filter: (start_time >= '2018-11-01 00:00:00'::timestamp without time zone)",
+    "  ->  XN Hash  (cost=0.00..1.00 rows=10 width=4)",
+    "        ->  XN Seq Scan on songs  (cost=0.00..1.00 rows=10 width=4)",
+    "  ->  XN Nested Loop DS_BCAST_INNER  (cost=0.00..1.00 rows=1 width=4)",
+    "        ->  XN Seq Scan on songs  (cost=0.00..1.00 rows=10 width=4)",
+]
+
+
+def test_plan_nodes_drop_costs_and_conditions():
+    assert plan_nodes(PLAN) == [
+        "XN Hash Join DS_DIST_BOTH",
+        "XN Seq Scan on songplays",
+        "XN Hash",
+        "XN Seq Scan on songs",
+        "XN Nested Loop DS_BCAST_INNER",
+        "XN Seq Scan on songs",
+    ]
+
+
+def test_plan_findings_are_sorted_and_distinct():
+    assert plan_findings(PLAN) == ["DS_BCAST_INNER", "DS_DIST_BOTH", "Nested Loop",
+                                   "Seq Scan on songplays", "Seq Scan on songs"]
+    assert plan_findings(["XN Hash Join DS_DIST_NONE  (cost=0.00..1.00 rows=1 width=4)"]) == []
+
+
+def test_statement_key_ignores_literals_and_whitespace():
+    assert statement_key("SELECT * FROM t WHERE ts >= 1541030400000;") == \
+        statement_key("select *\n  from t where ts >= 1541116800000")
+    assert statement_key("SELECT * FROM t WHERE d = '2018-11-01'") == \
+        statement_key("SELECT * FROM t WHERE d = '2018-11-02'")
+    assert statement_key("SELECT * FROM t") != statement_key("SELECT * FROM u")
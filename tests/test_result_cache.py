@@ -0,0 +1,102 @@
+import pytest
+
+from helpers.result_cache import ResultCache, tables_in
+
+from fakes import FakeConnection, FakeHook
+
+CHECK_SQL = "SELECT COUNT(*) FROM songplays WHERE (start_time >= '2018-11-01')"
+
+
+class CacheTable:
+    """ query_result_cache in memory, answering the statements ResultCache runs """
+
+    def __init__(self):
+        self.entries = {}
+
+    def results(self):
+        return {
+            "SELECT fingerprint, result FROM query_result_cache": self.lookup,
+            "DELETE FROM query_result_cache WHERE cache_key": self.delete,
+            "INSERT INTO query_result_cache": self.insert,
+        }
+
+    def lookup(self, statement, parameters):
+        return [self.entries[parameters[0]]] if parameters[0] in self.entries else []
+
+    def delete(self, statement, parameters):
+        self.entries.pop(parameters[0], None)
+        return []
+
+    def insert(self, statement, parameters):
+        key, fingerprint, result = parameters
+        self.entries[key] = (fingerprint, result)
+        return []
+
+
+def redshift(cache, last_insert):
+    """ A Redshift connection where songplays (table 101) was last written at ``last_insert`` """
+    return FakeConnection(dict(cache.results(), **{
+        "SELECT table_id, tbl_rows FROM svv_table_info": [(101, 320)],
+        "SELECT (SELECT MAX(endtime) FROM stl_insert WHERE tbl = 101)": [(last_insert, None)],
+    }), version="PostgreSQL 8.0.2 on i686-pc-linux-gnu, Redshift 1.0.58")
+
+
+def test_hit_until_the_table_changes():
+    table = CacheTable()
+    cache = ResultCache()
+    cursor = redshift(table, "2018-11-01 01:00:00").cursor()
+    cache.prepare(cursor)
+
+    fingerprint = cache.fingerprint(cursor, tables_in(CHECK_SQL))
+    assert cache.get(cursor, CHECK_SQL, fingerprint) == (False, None)
+    cache.put(cursor, CHECK_SQL, fingerprint, (320,))
+    # Same SQL up to whitespace, same table metadata
+    assert cache.get(cursor, CHECK_SQL.replace(" WHERE", "\n    WHERE") + "\n", fingerprint) == (True, [320])
+
+    # A later insert into songplays changes its fingerprint
+    cursor = redshift(table, "2018-11-02 01:00:00").cursor()
+    cache.prepare(cursor)
+    changed = cache.fingerprint(cursor, ["songplays"])
+    assert changed != fingerprint
+    assert cache.get(cursor, CHECK_SQL, changed) == (False, None)
+    cache.put(cursor, CHECK_SQL, changed, (321,))
+    assert list(table.entries.values()) == [(changed, "[321]")]
+
+
+def test_fingerprint_sources():
+    cursor = FakeConnection({"SELECT n_live_tup": [(320, 400, 0, 80)],
+                             "SELECT MAX(start_time)": [("2018-11-30",)]}).cursor()
+    cache = ResultCache(fingerprint_sql={"songs": "SELECT MAX(start_time) FROM songs"}, ttl_seconds=60)
+    cache.prepare(cursor)
+    assert cursor.connection.statements[-1] == \
+        "DELETE FROM query_result_cache WHERE cached_at < CURRENT_TIMESTAMP - INTERVAL '60 seconds';"
+    # Postgres counters, or the table's own query
+    assert cache.fingerprint(cursor, ["public.songplays", "songs"]) == \
+        '{"public.songplays": [320, 400, 0, 80], "songs": ["2018-11-30"]}'
+
+
+def test_tables_in():
+    assert tables_in("SELECT COUNT(*) FROM songplays s JOIN public.users u ON s.user_id = u.user_id "
+                     "WHERE s.song_id IN (SELECT song_id FROM songs)") == ["public.users", "songplays", "songs"]
+
+
+def test_quality_checks_skip_unchanged_tables(monkeypatch):
+    pytest.importorskip("airflow")
+    from hooks import pooled_postgres_hook
+    from operators.data_quality_check import DataQualityOperator
+
+    table = CacheTable()
+    check = {"sql": "SELECT COUNT(*) FROM songplays", "comparator": "greater_than", "value": 0}
+
+    def run(last_insert):
+        conn = redshift(table, last_insert)
+        conn.results["SELECT COUNT(*) FROM songplays"] = [(320,)]
+        monkeypatch.setattr(pooled_postgres_hook, "PooledPostgresHook", lambda postgres_conn_id: FakeHook(conn))
+        DataQualityOperator(task_id="Run_data_quality_checks", redshift_conn_id="redshift", checks=[check],
+                            metric_history_table=None, result_cache=ResultCache()).execute({"ds": "2018-11-01"})
+        return [statement for statement in conn.statements if statement == "SELECT COUNT(*) FROM songplays"]
+
+    assert len(run("2018-11-01 01:00:00")) == 1
+    # A re-trigger with songplays unchanged reuses the result
+    assert run("2018-11-01 01:00:00") == []
+    assert len(run("2018-11-01 02:00:00")) == 1
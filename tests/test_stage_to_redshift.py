@@ -0,0 +1,193 @@
+import json
+import re
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("airflow")
+
+from hooks import pooled_postgres_hook  # noqa: E402
+from helpers.backends import RedshiftBackend  # noqa: E402
+from helpers.load_errors import LoadError  # noqa: E402
+from helpers.object_store import LocalObjectStore  # noqa: E402
+from operators.stage_to_redshift import StageToRedshiftOperator  # noqa: E402
+
+from fakes import FakeConnection, FakeHook  # noqa: E402
+
+# A two-day run window
+CONTEXT = {
+    "execution_date": datetime(2018, 11, 1),
+    "next_execution_date": datetime(2018, 11, 3),
+    "ts": "2018-11-01T00:00:00+00:00",
+    "ts_nodash": "20181101T000000",
+    "ds_nodash": "20181101",
+}
+
+EVENTS_KEY = "log_data/{ds}-events.json"
+DAY_ONE = "s3://udacity-dend/log_data/2018-11-01-events.json"
+DAY_TWO = "s3://udacity-dend/log_data/2018-11-02-events.json"
+
+
+class WatermarkTable:
+    """ stage_watermarks in memory, answering the statements PartitionWatermark runs """
+
+    def __init__(self, *rows):
+        self.rows = list(rows)
+
+    def results(self):
+        return {
+            "INSERT INTO stage_watermarks": self.insert,
+            "SELECT COUNT(*) FROM stage_watermarks": self.count,
+            "SELECT s3_path FROM stage_watermarks": self.paths,
+            "DELETE FROM stage_watermarks": self.delete,
+        }
+
+    @staticmethod
+    def table_name(statement):
+        return re.search(r"table_name = '([^']*)'", statement).group(1)
+
+    def insert(self, statement, parameters=None):
+        self.rows.extend(re.findall(r"\('([^']*)', '([^']*)'\)", statement))
+        return []
+
+    def count(self, statement, parameters=None):
+        path = re.search(r"s3_path = '([^']*)'", statement).group(1)
+        return [(self.rows.count((self.table_name(statement), path)),)]
+
+    def paths(self, statement, parameters=None):
+        return [(path,) for table, path in self.rows if table == self.table_name(statement)]
+
+    def delete(self, statement, parameters=None):
+        self.rows = [row for row in self.rows if row[0] != self.table_name(statement)]
+        return []
+
+
+class FakeBackend(RedshiftBackend):
+    """ Redshift without AWS: fixed credentials, COPYs run on the fake connection """
+
+    def credentials(self, aws_credentials_id):
+        return SimpleNamespace(access_key="key", secret_key="secret")
+
+
+class FailingBackend(FakeBackend):
+    """ Manifest COPYs fail on the ``bad`` files, naming them like stl_load_errors, unless run with MAXERROR """
+
+    def __init__(self, store, bad=()):
+        self.store = store
+        self.bad = set(bad)
+
+    def object_store(self, bucket, aws_credentials_id):
+        return self.store
+
+    def copy(self, operator, cursor, metrics, formatted_sql, inspect=True):
+        metrics.run(cursor, formatted_sql, table=operator.table, copy=True)
+        manifest_url = re.search(r"FROM '([^']*)'", formatted_sql).group(1)
+        with open(manifest_url[len("file://"):]) as manifest:
+            urls = [entry["url"] for entry in json.load(manifest)["entries"]]
+        errors = [LoadError(1, url, 3, "ts", "Invalid timestamp format", "x") for url in urls if url in self.bad]
+        if errors and "MAXERROR" not in formatted_sql:
+            cursor.connection.rollback()
+            error = RuntimeError(f"Load into table '{operator.table}' failed")
+            error.load_errors = errors
+            raise error
+        return errors
+
+
+def stage(monkeypatch, conn, **options):
+    monkeypatch.setattr(pooled_postgres_hook, "PooledPostgresHook",
+                        lambda postgres_conn_id: FakeHook(conn))
+    options.setdefault("backend", FakeBackend())
+    operator = StageToRedshiftOperator(task_id="Stage_events", redshift_conn_id="redshift",
+                                       s3_bucket="udacity-dend", inspect_load_errors=False, **options)
+    return operator.execute(dict(CONTEXT))
+
+
+def copied_paths(conn):
+    return [re.search(r"FROM '([^']*)'", statement).group(1)
+            for statement in conn.statements if statement.startswith("COPY")]
+
+
+def test_incremental_skips_loaded_partitions(monkeypatch):
+    watermarks = WatermarkTable(("staging_events", DAY_ONE))
+    conn = FakeConnection(watermarks.results())
+
+    loaded = stage(monkeypatch, conn, table="staging_events", s3_key=EVENTS_KEY, incremental=True)
+    assert list(loaded) == ["log_data/2018-11-02-events.json"]
+    assert copied_paths(conn) == [DAY_TWO]
+    assert watermarks.rows == [("staging_events", DAY_ONE), ("staging_events", DAY_TWO)]
+    assert not any(statement.startswith("DELETE FROM staging_events") for statement in conn.statements)
+
+    # A rerun of the same window finds both days loaded
+    rerun = FakeConnection(watermarks.results())
+    assert stage(monkeypatch, rerun, table="staging_events", s3_key=EVENTS_KEY, incremental=True) == {}
+    assert copied_paths(rerun) == []
+
+
+def test_reload_replaces_the_windows_rows(monkeypatch):
+    watermarks = WatermarkTable(("staging_events", DAY_ONE))
+    conn = FakeConnection(watermarks.results())
+
+    stage(monkeypatch, conn, table="staging_events", s3_key=EVENTS_KEY, incremental=True,
+          reload_where="ts >= 1541030400000 AND ts < 1541203200000")
+    statements = [statement for statement in conn.statements if not statement.startswith("SELECT")]
+    assert statements[1] == "DELETE FROM staging_events WHERE ts >= 1541030400000 AND ts < 1541203200000"
+    # Both days are loaded again, in the one transaction with the DELETE
+    assert copied_paths(conn) == [DAY_ONE, DAY_TWO]
+    assert watermarks.rows == [("staging_events", DAY_ONE), ("staging_events", DAY_TWO)]
+    assert conn.commits == 2  # The watermark table's CREATE, then the reload
+
+
+@pytest.fixture
+def song_parts(tmp_path):
+    store = LocalObjectStore(tmp_path)
+    for name in ("a", "b", "c"):
+        store.write_bytes(f"song_data/{name}.json", b'{"song_id": "S"}\n')
+    return store
+
+
+def copied_files(conn):
+    """ The source files of every COPY, read back from its manifest """
+    files = []
+    for url in copied_paths(conn):
+        with open(url[len("file://"):]) as manifest:
+            files.append([entry["url"].rsplit("/", 1)[1] for entry in json.load(manifest)["entries"]])
+    return files
+
+
+def test_failed_files_are_set_aside_and_retried(monkeypatch, song_parts):
+    watermarks = WatermarkTable()
+    conn = FakeConnection(watermarks.results())
+    bad = song_parts.url("song_data/b.json")
+
+    result = stage(monkeypatch, conn, table="staging_songs", s3_key="song_data/", retry_failed_files=True,
+                   retry_max_errors=100, backend=FailingBackend(song_parts, [bad]))
+    assert result == {"attempts": 2, "retried_files": ["song_data/b.json"]}
+    assert copied_files(conn) == [["a.json", "b.json", "c.json"], ["a.json", "c.json"], ["b.json"]]
+    assert "MAXERROR 100" in [statement for statement in conn.statements if statement.startswith("COPY")][-1]
+    # The run's file records are dropped once the whole prefix is in
+    assert watermarks.rows == []
+
+
+def test_retry_reloads_only_missing_files(monkeypatch, song_parts):
+    watermarks = WatermarkTable()
+    backend = FailingBackend(song_parts, [song_parts.url("song_data/b.json")])
+    conn = FakeConnection(watermarks.results())
+
+    with pytest.raises(ValueError, match="1 file\\(s\\) failed to load into staging_songs"):
+        stage(monkeypatch, conn, table="staging_songs", s3_key="song_data/", retry_failed_files=True,
+              backend=backend)
+    # The files that loaded are committed and recorded for the run
+    assert watermarks.rows == [("staging_songs@20181101T000000", song_parts.url("song_data/a.json")),
+                               ("staging_songs@20181101T000000", song_parts.url("song_data/c.json"))]
+
+    # The Airflow retry, once the bad file is fixed
+    backend.bad.clear()
+    retry = FakeConnection(watermarks.results())
+    result = stage(monkeypatch, retry, table="staging_songs", s3_key="song_data/", retry_failed_files=True,
+                   backend=backend)
+    assert result == {"attempts": 1, "retried_files": []}
+    assert copied_files(retry) == [["b.json"]]
+    # The committed files stay: no DELETE of the table this time
+    assert not any(statement.startswith("DELETE FROM staging_songs") for statement in retry.statements)
+    assert watermarks.rows == []
@@ -0,0 +1,32 @@
+import os
+import re
+
+import statements_for_sql
+from helpers.star_schema import STAR_SCHEMA_LAYOUTS, TableLayout, create_table_sql
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def layouts_in(ddl):
+    """ Table -> its attribute clause, for every CREATE TABLE in a script """
+    return dict(re.findall(r"CREATE TABLE IF NOT EXISTS (\w+) \(.*?\n\)\n(DISTSTYLE[^;]*);", ddl, re.S))
+
+
+def test_create_table_sql_appends_the_layout():
+    sql = create_table_sql("CREATE TABLE t (a INT, b INT);", TableLayout("KEY", "a", ("b",)))
+    assert sql == "CREATE TABLE t (a INT, b INT)\nDISTSTYLE KEY DISTKEY (a) SORTKEY (b);\n"
+
+
+def test_dag_ddl_uses_the_layouts():
+    for table, layout in STAR_SCHEMA_LAYOUTS.items():
+        ddl = getattr(statements_for_sql, f"CREATE_{table}_TABLE_SQL")
+        assert layouts_in(ddl) == {table: layout.clause()}
+
+
+def test_hand_run_ddl_matches_the_layouts():
+    # table_creation.py spells columns without underscores (songid for song_id)
+    with open(os.path.join(ROOT, "table_creation.py")) as script:
+        found = layouts_in(script.read())
+    assert set(found) == set(STAR_SCHEMA_LAYOUTS)
+    for table, layout in STAR_SCHEMA_LAYOUTS.items():
+        assert found[table].replace("_", "") == layout.clause().replace("_", "")